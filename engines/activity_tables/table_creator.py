@@ -3,10 +3,14 @@ import sys
 import numpy as np
 import os
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eval_tables  # noqa: E402
+
 # Configuration
 piece = 'king'  # Change this to one of ['knight', 'bishop', 'pawn', 'queen', 'rook','king'] as needed
+phase = 'middlegame'  # Change this to 'endgame' to edit the table used when most pieces are off the board
 SELECT_MULTIPLE = False
-filename = f"{piece}_activity_table.npy"
+filename = f"{piece}_activity_table.npy" if phase == 'middlegame' else f"{piece}_{phase}_activity_table.npy"
 
 # Constants
 ROWS, COLS = 8, 8
@@ -103,7 +107,7 @@ def draw_grid():
             window.blit(text_surf, text_rect)
 
     # Draw piece name text and buttons as before
-    piece_text = font.render(f"Editing: {piece.capitalize()} Activity Table", True, (0, 0, 0))
+    piece_text = font.render(f"Editing: {piece.capitalize()} {phase.capitalize()} Activity Table", True, (0, 0, 0))
     window.blit(piece_text, (10, 10))
 
     clear_button_rect = pygame.Rect(50, TOP_MARGIN + GRID_HEIGHT + (BUTTON_HEIGHT - 30)//2, 120, 30)
@@ -129,7 +133,11 @@ def save_to_file():
             except ValueError:
                 arr[r, c] = 0
     np.save(filename, arr)
-    print(f"Saved activity table to {filename}")
+    # The engine reads the packed bundle, so rebuild it from all the tables.
+    table_dir = os.path.dirname(os.path.abspath(filename))
+    bundle_path = os.path.join(table_dir, os.path.basename(eval_tables.BUNDLE_PATH))
+    eval_tables.write_bundle(eval_tables.pack_tables(table_dir), bundle_path)
+    print(f"Saved activity table to {filename} and rebuilt {bundle_path}")
 
 def backspace_selected_cells():
     for (r, c) in selected_cells:
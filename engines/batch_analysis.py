@@ -0,0 +1,252 @@
+"""
+Analyse many positions with an engine from a bot config.
+
+The input has one FEN or EPD per line. Every worker process starts one engine with `create_engine` and keeps it for
+all the positions it is given, so engine start-up is paid once per worker. Results are written as they arrive, in
+input order, as NDJSON (one JSON object per line) or CSV. Scores are from white's point of view.
+
+When the output file already exists, the positions in it are skipped and the new results are appended, so an
+interrupted run can be resumed by running the same command again. A last line cut off by the interruption is dropped.
+
+Analyse positions with: python -m engines.batch_analysis positions.epd results.ndjson --config config.yml --depth 6
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import time
+import chess
+import chess.engine
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, TextIO, cast
+from lib.config import Configuration, load_config
+from lib.engine_wrapper import EngineWrapper, MinimalEngine, create_engine
+from engines.epd_runner import maydan_iterations
+from engines.maydan_engine import MaydanEngine, mate_info
+
+MATE_SCORE = 100_000  # Centipawns reported when MaydanEngine sees a mate but not how far away it is.
+
+
+@dataclass
+class Position:
+    """A position to analyse."""
+
+    index: int  # The position's place in the input, counting from 0.
+    id: str  # The EPD id, or the line number.
+    fen: str
+
+
+@dataclass
+class Analysis:
+    """The engine's analysis of one position."""
+
+    index: int
+    id: str
+    fen: str
+    move: Optional[str]  # UCI.
+    score: Optional[int]  # Centipawns from white's point of view, unless there is a mate.
+    mate: Optional[int]  # Moves to mate, positive if white mates.
+    pv: str  # UCI moves separated by spaces.
+    depth: Optional[int]
+    nodes: Optional[int]
+    seconds: float
+
+
+def read_positions(path: str) -> list[Position]:
+    """Read a file with one FEN or EPD per line. Empty lines and lines starting with # are skipped."""
+    positions: list[Position] = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                board = chess.Board(line)
+                position_id = str(line_number)
+            except ValueError:
+                board, operations = chess.Board.from_epd(line)
+                position_id = str(operations.get("id", line_number))
+            positions.append(Position(len(positions), position_id, board.fen()))
+    return positions
+
+
+def maydan_info(engine: MaydanEngine, board: chess.Board, limit: chess.engine.Limit) -> chess.engine.InfoDict:
+    """Search deeper and deeper with MaydanEngine and describe its last iteration like a UCI engine would."""
+    last = list(maydan_iterations(engine, board, limit))[-1]
+    info: chess.engine.InfoDict = {"pv": [last.move] if last.move else [], "depth": last.depth or 0,
+                                   "nodes": last.nodes or 0}
+    value = MaydanEngine.best_value
+    if value == float("inf") and engine.mate_solver_nodes > 0:
+        mating_line = engine.solve_mate(board)
+        if mating_line:
+            return info | mate_info(board, mating_line)
+    centipawns = MATE_SCORE if value == float("inf") else -MATE_SCORE if value == float("-inf") else round(100 * value)
+    info["score"] = chess.engine.PovScore(chess.engine.Cp(centipawns), board.turn)
+    return info
+
+
+def engine_info(engine: EngineWrapper, board: chess.Board, limit: chess.engine.Limit) -> chess.engine.InfoDict:
+    """Get the score and principal variation of a position from any kind of engine."""
+    if isinstance(engine, MaydanEngine):
+        return maydan_info(engine, board, limit)
+    if isinstance(engine, MinimalEngine):
+        result = engine.search(board, limit, False, False, chess.engine.PlayResult(None, None))
+        info = result.info.copy()
+        if result.move and not info.get("pv"):
+            info["pv"] = [result.move]
+        return info
+    return cast(chess.engine.SimpleEngine, engine.engine).analyse(board, limit)
+
+
+def analyse(engine: EngineWrapper, position: Position, limit: chess.engine.Limit) -> Analysis:
+    """Analyse one position. Positions where the game is over are not searched."""
+    board = chess.Board(position.fen)
+    start = time.perf_counter()
+    info = engine_info(engine, board, limit) if not board.is_game_over() else {}
+    seconds = time.perf_counter() - start
+    score = info["score"].white() if "score" in info else None
+    pv = info.get("pv", [])
+    return Analysis(position.index, position.id, position.fen, pv[0].uci() if pv else None,
+                    score.score() if score else None, score.mate() if score else None,
+                    " ".join(move.uci() for move in pv), info.get("depth"), info.get("nodes"), round(seconds, 3))
+
+
+_worker_engine: Optional[EngineWrapper] = None
+
+
+def start_worker_engine(config: Configuration) -> None:
+    """
+    Start the engine of a worker process. Use as the initializer of a `multiprocessing.Pool`.
+
+    The engine is kept for every task of the worker and is shut down when the pool is closed and joined.
+    """
+    global _worker_engine
+    engine = create_engine(config).__enter__()
+    multiprocessing.util.Finalize(engine, engine.__exit__, args=(None, None, None), exitpriority=10)
+    _worker_engine = engine
+
+
+def worker_engine() -> EngineWrapper:
+    """Get the engine started by `start_worker_engine` in this worker process."""
+    return cast(EngineWrapper, _worker_engine)
+
+
+def _analyse(task: tuple[Position, chess.engine.Limit]) -> Analysis:
+    """Analyse one position with the worker's engine. This runs in the worker processes."""
+    position, limit = task
+    return analyse(worker_engine(), position, limit)
+
+
+def analyse_all(positions: list[Position], config: Configuration, limit: chess.engine.Limit,
+                processes: int = 1) -> Iterator[Analysis]:
+    """
+    Analyse positions, yielding the results in the order of the positions as soon as they are ready.
+
+    :param config: The bot's config, which sets the engine and its options.
+    :param processes: The number of worker processes, each with its own engine.
+    """
+    if processes <= 1:
+        with create_engine(config) as engine:
+            for position in positions:
+                yield analyse(engine, position, limit)
+        return
+    pool = multiprocessing.Pool(processes, initializer=start_worker_engine, initargs=(config,))
+    try:
+        yield from pool.imap(_analyse, [(position, limit) for position in positions])
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def output_format(path: str) -> str:
+    """Get the output format from the file extension: CSV for .csv, otherwise NDJSON."""
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def completed_indexes(path: str) -> set[int]:
+    """
+    Find the positions that an earlier run has already written to the output.
+
+    A last line without a line end was cut off when the run was interrupted, so it is removed from the file.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as file:
+        content = file.read()
+        complete_length = content.rfind(b"\n") + 1
+        if complete_length < len(content):
+            file.truncate(complete_length)
+    lines = content[:complete_length].decode().splitlines()
+    if output_format(path) == "csv":
+        return {int(row["index"]) for row in csv.DictReader(lines)}
+    return {int(json.loads(line)["index"]) for line in lines if line.strip()}
+
+
+def write_results(results: Iterable[Analysis], file: TextIO, file_format: str) -> int:
+    """
+    Write results as they arrive, flushing after each one so an interruption loses as little as possible.
+
+    :return: The number of results written.
+    """
+    writer: Optional[csv.DictWriter[str]] = None
+    if file_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=list(Analysis.__dataclass_fields__), lineterminator="\n")
+        if file.tell() == 0:
+            writer.writeheader()
+    count = 0
+    for result in results:
+        row: dict[str, Any] = asdict(result)
+        if writer:
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(row) + "\n")
+        file.flush()
+        count += 1
+    return count
+
+
+def run(input_path: str, output_path: str, config: Configuration, limit: chess.engine.Limit, processes: int = 1) -> int:
+    """
+    Analyse the positions of a file that are not in the output yet and append their results to the output.
+
+    :return: The number of positions analysed.
+    """
+    done = completed_indexes(output_path)
+    positions = [position for position in read_positions(input_path) if position.index not in done]
+    start = time.perf_counter()
+    with open(output_path, "a", newline="") as file:
+        count = write_results(analyse_all(positions, config, limit, processes), file, output_format(output_path))
+    seconds = time.perf_counter() - start
+    skipped = f", skipped {len(done)} already in {output_path}" if done else ""
+    print(f"Analysed {count} positions in {seconds:.1f} s ({count / seconds if seconds else 0:.1f} positions/s){skipped}")
+    return count
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Analyse positions from the command line."""
+    parser = argparse.ArgumentParser(description="Analyse the positions of a FEN or EPD file with an engine.")
+    parser.add_argument("input", help="A file with one FEN or EPD per line.")
+    parser.add_argument("output", help="Where to write the results: CSV if it ends with .csv, otherwise NDJSON.")
+    parser.add_argument("--config", default="config.yml", help="The bot config that sets the engine.")
+    parser.add_argument("--time", type=float, help="Seconds per position.")
+    parser.add_argument("--nodes", type=int, help="Nodes per position.")
+    parser.add_argument("--depth", type=int, help="Search depth per position.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="The number of engines to run.")
+    args = parser.parse_args(argv)
+    if args.time is None and args.nodes is None and args.depth is None:
+        parser.error("Set a budget with --time, --nodes or --depth.")
+
+    run(args.input, args.output, load_config(args.config),
+        chess.engine.Limit(time=args.time, nodes=args.nodes, depth=args.depth), args.processes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+A deterministic benchmark for MaydanEngine.
+
+Every position is searched at depth 1, 2, ... up to a fixed depth, so the time each depth is reached can be
+compared like the iterations of a deepening search. The total number of nodes is a signature of the search:
+it only changes when the search or evaluation changes, and it is the same on every machine. Tablebases and
+the evaluation cache are turned off, so the results don't depend on files found on the host.
+
+Run the benchmark with: python -m engines.bench [--depth 3] [--baseline bench.json] [--save bench.json]
+"""
+import argparse
+import json
+import sys
+import time
+import chess
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional, cast
+from lib.config import Configuration
+from engines.maydan_engine import MaydanEngine
+
+DEFAULT_DEPTH = 3
+DEFAULT_THRESHOLD = 0.1  # The largest allowed drop in nodes per second compared to the baseline.
+
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11",
+    "4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19",
+    "rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14",
+    "r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14",
+    "r3r1k1/2p2ppp/p1p1bn2/8/1q2P3/2NPQN2/PPP3PP/R4RK1 b - - 2 15",
+    "r1bbk1nr/pp3p1p/2n5/1N4p1/2Np1B2/8/PPP2PPP/2KR1B1R w kq - 0 13",
+    "r1bq1rk1/ppp1nppp/4n3/3p3Q/3P4/1BP1B3/PP1N2PP/R4RK1 w - - 1 16",
+    "4r1k1/r1q2ppp/ppp2n2/4P3/5Rb1/1N1BQ3/PPP3PP/R5K1 w - - 1 17",
+    "2rqkb1r/ppp2p2/2npb1p1/1N1Nn2p/2P1PP2/8/PP2B1PP/R1BQK2R b KQ - 0 11",
+    "r1bq1r1k/b1p1npp1/p2p3p/1p6/3PP3/1B2NN2/PP3PPP/R2Q1RK1 w - - 1 16",
+    "3r1rk1/p5pp/bpp1pp2/8/q1PP1P2/b3P3/P2NQRPP/1R2B1K1 b - - 6 22",
+    "r1q2rk1/2p1bppp/2Pp4/p6b/Q1PNp3/4B3/PP1R1PPP/2K4R w - - 2 18",
+    "4k2r/1pb2ppp/1p2p3/1R1p4/3P4/2r1PN2/P4PPP/1R4K1 b - - 3 22",
+    "3q2k1/pb3p1p/4pbp1/2r5/PpN2N2/1P2P2P/5PP1/Q2R2K1 b - - 4 26",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/3N4 b - - 0 1",
+    "3b4/5kp1/1p1p1p1p/pP1PpP1P/P1P1P3/3KN3/8/8 w - - 0 1",
+    "2K5/p7/7P/5pR1/8/5k2/r7/8 w - - 0 1",
+    "8/6pk/1p6/8/PP3p1p/5P2/4KP1q/3Q4 w - - 0 1",
+    "7k/3p2pp/4q3/8/4Q3/5Kp1/P6b/8 w - - 0 1",
+    "8/2p5/8/2kPKp1p/2p4P/2P5/3P4/8 w - - 0 1",
+    "8/1p3pp1/7p/5P1P/2k3P1/8/2K2P2/8 w - - 0 1",
+    "8/pp2r1k1/2p1p3/3pP2p/1P1P1P1P/P5KR/8/8 w - - 0 1",
+    "8/3p4/p1bk3p/Pp6/1Kp1PpPp/2P2P1P/2P5/5B2 b - - 0 1",
+    "5k2/7R/4P2p/5K2/p1r2P1p/8/8/8 b - - 0 1",
+    "6k1/6p1/P6p/r1N5/5p2/7P/1b3PP1/4R1K1 w - - 0 1",
+    "1r3k2/4q3/2Pp3b/3Bp3/2Q2p2/1p1P2P1/1P2KP2/3N4 w - - 0 1",
+    "6k1/4pp1p/3p2p1/P1pPb3/R7/1r2P1PP/3B1P2/6K1 w - - 0 1",
+    "8/3p3B/5p2/5P2/p7/PP5b/k7/6K1 w - - 0 1",
+    "5rk1/q6p/2p3bR/1pPp1rP1/1P1Pp3/P3B1Q1/1K3P2/R7 w - - 93 90",
+    "4rrk1/1p1nq3/p7/2p1P1pp/3P2bp/3Q1Bn1/PPPB4/1K2R1NR w - - 40 21",
+    "r3k2r/3nnpbp/q2pp1p1/p7/Pp1PPPP1/4BNN1/1P5P/R2Q1RK1 w kq - 0 16",
+    "3Qb1k1/1r2ppb1/pN1n2q1/Pp1Pp1Pr/4P2p/4BP2/4B1R1/1R5K b - - 11 40",
+    "4k3/3q1r2/1N2r1b1/3ppN2/2nPP3/1B1R2n1/2R1Q3/3K4 w - - 5 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkb1r/pp1p1ppp/4pn2/2p5/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 0 4",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "r2r1n2/pp2bk2/2p1p2p/3q4/3PN1QP/2P3R1/P4PP1/5RK1 w - - 0 1",
+    "6k1/3b3r/1p1p4/p1n2p2/1PPNpP1q/P3Q1p1/1R1RB1P1/5K2 b - - 0 1",
+    "8/8/8/8/5kp1/P7/8/1K1N4 w - - 0 1",
+    "8/8/8/5N2/8/p7/8/2NK3k w - - 0 1",
+    "8/5k2/8/8/3N4/8/1K6/6B1 w - - 0 1",
+    "8/8/1P6/5pr1/8/4R3/7k/2K5 w - - 0 1",
+    "8/2p4P/8/kr6/6R1/8/8/1K6 w - - 0 1",
+    "8/8/3P3k/8/1p6/8/1P6/1K3n2 b - - 0 1",
+    "8/R7/2q5/8/6k1/8/1P5p/K6R w - - 0 124",
+    "8/8/8/8/4k3/8/3KP3/8 w - - 0 1",
+    "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+]
+
+
+@dataclass
+class PositionResult:
+    """The search of one position."""
+
+    fen: str
+    nodes: int  # The nodes searched at all depths.
+    seconds: float
+    time_to_depth: list[float]  # The seconds taken to finish each depth, counting the shallower depths.
+    best_move: Optional[str]
+
+    @property
+    def nps(self) -> float:
+        """Get the nodes searched per second."""
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class BenchResult:
+    """The search of all the bench positions."""
+
+    depth: int
+    positions: list[PositionResult] = field(default_factory=list)
+
+    @property
+    def nodes(self) -> int:
+        """Get the total number of nodes, which is the signature of the search."""
+        return sum(position.nodes for position in self.positions)
+
+    @property
+    def seconds(self) -> float:
+        """Get the total search time."""
+        return sum(position.seconds for position in self.positions)
+
+    @property
+    def nps(self) -> float:
+        """Get the nodes searched per second over all positions."""
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def to_json(self) -> dict[str, Any]:
+        """Get the results in the format of a baseline file."""
+        return {"depth": self.depth, "nodes": self.nodes, "seconds": self.seconds, "nps": self.nps,
+                "positions": [asdict(position) for position in self.positions]}
+
+
+def bench_position(engine: MaydanEngine, fen: str, depth: int) -> PositionResult:
+    """Search one position at every depth up to `depth`."""
+    board = chess.Board(fen)
+    nodes = 0
+    time_to_depth = []
+    best_move: Optional[chess.Move] = None
+    start = time.perf_counter()
+    for current_depth in range(1, depth + 1):
+        best_move = cast(Optional[chess.Move], engine.find_best_move(board, current_depth, board.turn))
+        nodes += MaydanEngine.num_evaluated_nodes
+        time_to_depth.append(time.perf_counter() - start)
+    return PositionResult(fen, nodes, time_to_depth[-1] if time_to_depth else 0.0, time_to_depth,
+                          best_move.uci() if best_move else None)
+
+
+def run_bench(depth: int = DEFAULT_DEPTH, fens: Optional[list[str]] = None, verbose: bool = False) -> BenchResult:
+    """
+    Search the bench positions with a fresh engine.
+
+    :param depth: The deepest search of each position.
+    :param fens: The positions to search. The default is `BENCH_POSITIONS`.
+    :param verbose: Whether to print the result of each position as it is searched.
+    """
+    engine = MaydanEngine([], {"BitbasePath": "", "EvalHash": 0}, None, Configuration({}))
+    result = BenchResult(depth)
+    for number, fen in enumerate(BENCH_POSITIONS if fens is None else fens, 1):
+        position = bench_position(engine, fen, depth)
+        result.positions.append(position)
+        if verbose:
+            times = " ".join(f"{seconds:.2f}" for seconds in position.time_to_depth)
+            print(f"Position {number:2}: {position.nodes:8} nodes, {position.seconds:7.2f} s, "
+                  f"{position.nps:6.0f} nps, best move {position.best_move}, time to depth {times}")
+    return result
+
+
+def compare(result: BenchResult, baseline: dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Compare a bench run to a baseline saved with `BenchResult.to_json`.
+
+    :param threshold: The largest allowed fractional drop in nodes per second.
+    :return: The regressions found. A different node count is reported, but only a slower search is a regression.
+    """
+    if baseline["depth"] != result.depth:
+        raise ValueError(f"The baseline was searched to depth {baseline['depth']}, not {result.depth}.")
+    if baseline["nodes"] != result.nodes:
+        print(f"The node signature changed from {baseline['nodes']} to {result.nodes}.")
+    change = result.nps / baseline["nps"] - 1
+    print(f"Speed: {result.nps:.0f} nps against {baseline['nps']:.0f} nps in the baseline ({change:+.1%}).")
+    if change < -threshold:
+        return [f"Nodes per second dropped by {-change:.1%}, more than the allowed {threshold:.1%}."]
+    return []
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run the bench from the command line. The exit code is 1 if the speed regressed against the baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark MaydanEngine's search.")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--baseline", help="A JSON file from --save to compare the speed to.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="The largest allowed drop in nodes per second, as a fraction of the baseline.")
+    parser.add_argument("--save", help="Where to write the results as JSON, to use as a baseline later.")
+    parser.add_argument("--quiet", action="store_true", help="Only print the totals.")
+    args = parser.parse_args(argv)
+
+    result = run_bench(args.depth, verbose=not args.quiet)
+    print(f"Nodes: {result.nodes}")
+    print(f"Time: {result.seconds:.2f} s")
+    depth_times = [sum(position.time_to_depth[depth] for position in result.positions) for depth in range(args.depth)]
+    print("Time to depth: " + ", ".join(f"{depth} in {seconds:.2f} s" for depth, seconds in enumerate(depth_times, 1)))
+    print(f"Nodes per second: {result.nps:.0f}")
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result.to_json(), file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.threshold)
+        for regression in regressions:
+            print(regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
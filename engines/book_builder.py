@@ -0,0 +1,268 @@
+"""
+Build a Polyglot opening book from PGN files.
+
+PGN files are split into chunks of about `chunk_size` bytes that start at a game (a line starting with `[Event `),
+and the chunks are parsed in a pool of worker processes. Each worker records the Polyglot key and move of every
+position in the first `max_plies` plies of its games and sums them up with NumPy: the weight of a move is 2 for
+every game won by the side that played it and 1 for every draw, and the learn field counts the games it was
+played in. Games without a result and games of other variants are skipped.
+
+The sums of the chunks are merged as they come in, so memory holds one chunk per worker and the distinct entries of
+the book, however large the input. Existing books can be merged in. Weights of a position are scaled down together
+when the largest does not fit in 16 bits. The book is written sorted by key, with the heaviest move first.
+
+Build a book with: python -m engines.book_builder book.bin games/ --max-plies 24 --processes 8
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import chess
+import chess.pgn
+import chess.polyglot
+import numpy as np
+import numpy.typing as npt
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Optional
+from engines.pgn_annotator import pgn_paths
+
+ENTRY = np.dtype([("key", ">u8"), ("move", ">u2"), ("weight", ">u2"), ("learn", ">u4")])
+assert ENTRY.itemsize == 16
+GAME_START = b"[Event "
+CHUNK_SIZE = 64 << 20  # Bytes of PGN parsed by a worker at a time.
+REDUCE_AT = 1 << 22  # Entries held before the chunk sums are merged.
+MAX_WEIGHT = np.iinfo(np.uint16).max
+MAX_LEARN = np.iinfo(np.uint32).max
+RESULT_WEIGHTS = {"1-0": {chess.WHITE: 2, chess.BLACK: 0}, "0-1": {chess.WHITE: 0, chess.BLACK: 2},
+                  "1/2-1/2": {chess.WHITE: 1, chess.BLACK: 1}}
+
+UInt64Array = npt.NDArray[np.uint64]
+
+
+@dataclass
+class BookCounts:
+    """Summed book entries, sorted by key and move, with one row per key and move."""
+
+    keys: UInt64Array
+    moves: npt.NDArray[np.uint16]
+    weights: UInt64Array
+    games: UInt64Array
+
+    def __len__(self) -> int:
+        """Get the number of entries."""
+        return len(self.keys)
+
+    @classmethod
+    def empty(cls) -> "BookCounts":
+        """Get counts without entries."""
+        return cls(np.zeros(0, np.uint64), np.zeros(0, np.uint16), np.zeros(0, np.uint64), np.zeros(0, np.uint64))
+
+
+def aggregate(parts: list[BookCounts]) -> BookCounts:
+    """Sum the weights and games of the entries with the same key and move."""
+    keys = np.concatenate([part.keys for part in parts]) if parts else np.zeros(0, np.uint64)
+    if not len(keys):
+        return BookCounts.empty()
+    moves = np.concatenate([part.moves for part in parts])
+    order = np.lexsort((moves, keys))
+    keys, moves = keys[order], moves[order]
+    starts = np.flatnonzero(np.concatenate([[True], (keys[1:] != keys[:-1]) | (moves[1:] != moves[:-1])]))
+    weights = np.add.reduceat(np.concatenate([part.weights for part in parts])[order], starts)
+    games = np.add.reduceat(np.concatenate([part.games for part in parts])[order], starts)
+    return BookCounts(keys[starts], moves[starts], weights.astype(np.uint64), games.astype(np.uint64))
+
+
+def encode_move(board: chess.Board, move: chess.Move) -> int:
+    """Encode a move like Polyglot, where castling is the king taking its own rook."""
+    to_square = move.to_square
+    if board.is_castling(move):
+        rook_file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+
+class BookVisitor(chess.pgn.BaseVisitor[list[tuple[int, int, int]]]):
+    """Collect the key, move and weight of the first plies of a game's main line, skipping everything else."""
+
+    def __init__(self, max_plies: int) -> None:
+        """:param max_plies: The number of plies of each game to put in the book."""
+        self.max_plies = max_plies
+        self.entries: list[tuple[int, int, int]] = []
+        self.weights: Optional[dict[chess.Color, int]] = None
+        self.plies = 0
+
+    def begin_game(self) -> None:
+        """Start a new game."""
+        self.entries = []
+        self.weights = None
+        self.plies = 0
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        """Remember the result, which sets the weights."""
+        if tagname == "Result":
+            self.weights = RESULT_WEIGHTS.get(tagvalue)
+
+    def visit_board(self, board: chess.Board) -> None:
+        """Skip games of other variants."""
+        if type(board) is not chess.Board or board.chess960:
+            self.weights = None
+
+    def begin_variation(self) -> chess.pgn.SkipType:
+        """Skip side lines."""
+        return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move) -> None:
+        """Record a move of the main line."""
+        if self.weights is not None and self.plies < self.max_plies:
+            self.entries.append((chess.polyglot.zobrist_hash(board), encode_move(board, move), self.weights[board.turn]))
+        self.plies += 1
+
+    def result(self) -> list[tuple[int, int, int]]:
+        """Get the entries of the game."""
+        return self.entries if self.weights is not None else []
+
+
+def game_offsets(path: str, chunk_size: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    """Split a PGN file into byte ranges of about `chunk_size` that each start at a game."""
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as file:
+        while starts[-1] + chunk_size < size:
+            file.seek(starts[-1] + chunk_size)
+            file.readline()  # Skip to the start of a line.
+            while True:
+                offset = file.tell()
+                line = file.readline()
+                if not line or line.startswith(GAME_START):
+                    break
+            if offset >= size:
+                break
+            starts.append(offset)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def count_chunk(path: str, start: int, end: int, max_plies: int) -> tuple[BookCounts, int]:
+    """
+    Parse the games in one byte range of a PGN file. This runs in the worker processes.
+
+    :return: The summed entries and the number of games read.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        pgn = io.StringIO(file.read(end - start).decode("utf-8", errors="replace"))
+    keys, moves, weights = [], [], []
+    games = 0
+    while (entries := chess.pgn.read_game(pgn, Visitor=lambda: BookVisitor(max_plies))) is not None:
+        games += 1
+        for key, move, weight in entries:
+            keys.append(key)
+            moves.append(move)
+            weights.append(weight)
+    counts = BookCounts(np.array(keys, dtype=np.uint64), np.array(moves, dtype=np.uint16),
+                        np.array(weights, dtype=np.uint64), np.ones(len(keys), dtype=np.uint64))
+    return aggregate([counts]), games
+
+
+def _count_chunk(task: tuple[str, int, int, int]) -> tuple[BookCounts, int]:
+    """Unpack a task for `Pool.imap_unordered`."""
+    return count_chunk(*task)
+
+
+def read_book(path: str) -> BookCounts:
+    """Read a Polyglot book to merge it into a new one."""
+    entries = np.fromfile(path, dtype=ENTRY)
+    return aggregate([BookCounts(entries["key"].astype(np.uint64), entries["move"].astype(np.uint16),
+                                 entries["weight"].astype(np.uint64), entries["learn"].astype(np.uint64))])
+
+
+def write_book(counts: BookCounts, path: str, min_games: int = 1) -> int:
+    """
+    Write summed entries as a Polyglot book.
+
+    :param min_games: Leave out moves played in fewer games.
+    :return: The number of entries written.
+    """
+    keep = counts.games >= min_games
+    keys, moves, weights, games = counts.keys[keep], counts.moves[keep], counts.weights[keep], counts.games[keep]
+    if len(keys):
+        # Scale down the weights of positions whose heaviest move does not fit, keeping their proportions.
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        heaviest = np.repeat(np.maximum.reduceat(weights, starts), np.diff(np.append(starts, len(keys))))
+        weights = np.where(heaviest > MAX_WEIGHT, weights * MAX_WEIGHT // np.maximum(heaviest, 1), weights)
+    order = np.lexsort((-weights.astype(np.int64), keys))
+    book = np.zeros(len(keys), dtype=ENTRY)
+    book["key"] = keys[order]
+    book["move"] = moves[order]
+    book["weight"] = weights[order]
+    book["learn"] = np.minimum(games[order], MAX_LEARN)
+    book.tofile(path)
+    return len(book)
+
+
+def chunk_tasks(pgn_files: list[str], max_plies: int, chunk_size: int) -> Iterator[tuple[str, int, int, int]]:
+    """Get the byte ranges of all the PGN files."""
+    for path in pgn_files:
+        for start, end in game_offsets(path, chunk_size):
+            yield path, start, end, max_plies
+
+
+def build(pgn_files: list[str], max_plies: int = 24, merge: Optional[list[str]] = None, processes: int = 1,
+          chunk_size: int = CHUNK_SIZE) -> tuple[BookCounts, int]:
+    """
+    Count the moves of PGN files and of books to merge.
+
+    :return: The summed entries and the number of games read.
+    """
+    parts = [read_book(path) for path in merge or []]
+    tasks = chunk_tasks(pgn_files, max_plies, chunk_size)
+    games = 0
+    pending = sum(len(part) for part in parts)
+
+    def add(counts: BookCounts, chunk_games: int) -> None:
+        nonlocal games, pending, parts
+        parts.append(counts)
+        games += chunk_games
+        pending += len(counts)
+        if pending > REDUCE_AT:
+            parts = [aggregate(parts)]
+            pending = len(parts[0])
+
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            for counts, chunk_games in pool.imap_unordered(_count_chunk, tasks):
+                add(counts, chunk_games)
+    else:
+        for task in tasks:
+            add(*_count_chunk(task))
+    return aggregate(parts), games
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Build a book from the command line."""
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book from PGN files.")
+    parser.add_argument("book", help="The book file to write.")
+    parser.add_argument("inputs", nargs="*", help="PGN files or directories of PGN files, like the pgn_directory.")
+    parser.add_argument("--max-plies", type=int, default=24, help="The number of plies of each game in the book.")
+    parser.add_argument("--merge", nargs="+", default=[], help="Polyglot books to merge into the new book.")
+    parser.add_argument("--min-games", type=int, default=1, help="Leave out moves played in fewer games.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE >> 20, help="Megabytes of PGN per task.")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.merge:
+        parser.error("Give PGN files or books to merge.")
+
+    start = time.perf_counter()
+    counts, games = build(pgn_paths(args.inputs), args.max_plies, args.merge, args.processes, args.chunk_mb << 20)
+    entries = write_book(counts, args.book, args.min_games)
+    seconds = time.perf_counter() - start
+    print(f"Wrote {entries} entries from {games} games to {args.book} in {seconds:.1f} s "
+          f"({games / seconds if seconds else 0:.0f} games/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
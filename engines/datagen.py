@@ -0,0 +1,253 @@
+"""
+Generate training positions by MaydanEngine self-play.
+
+Each worker process plays games from a few random opening moves at a fixed depth or node budget and records every
+position the engine searched, with its score and the game's result. Positions are written as 32-byte records to
+shard files that `load_shard` memory-maps as NumPy record arrays without copying them, and that
+`engines.nnue_trainer` can train on directly.
+
+Generate positions with: python -m engines.datagen data/ --games 1000 --depth 2 --processes 8
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+import chess
+import chess.engine
+import numpy as np
+import numpy.typing as npt
+from dataclasses import dataclass
+from typing import Any, Optional, cast
+from lib.config import Configuration
+from engines.epd_runner import maydan_iterations
+from engines.maydan_engine import MaydanEngine
+
+SHARD_MAGIC = b"MDPOSREC"
+SHARD_VERSION = 1
+HEADER = struct.Struct("<8sH22x")  # magic, version; padded to 32 bytes, the size of a record
+
+# One position. Pieces are packed two per byte, low nibble first, in the order of the set bits of `occupied`,
+# with the piece codes of `engines.nnue_trainer` (1-6 for white pawn to king, 7-12 for black).
+RECORD = np.dtype([
+    ("occupied", "<u8"),
+    ("pieces", "u1", (16,)),
+    ("score", "<i2"),  # Centipawns from white's point of view.
+    ("result", "i1"),  # 1 if white won, 0 for a draw and -1 if black won.
+    ("flags", "u1"),  # The FLAG_* bits below.
+    ("fullmove", "<u2"),
+    ("halfmove_clock", "u1"),
+    ("ep_square", "u1"),  # 64 when there is no en passant square.
+])
+assert RECORD.itemsize == 32
+
+FLAG_WHITE_TO_MOVE = 1
+FLAG_CASTLING = [(chess.BB_H1, 2), (chess.BB_A1, 4), (chess.BB_H8, 8), (chess.BB_A8, 16)]
+FLAG_IN_CHECK = 32
+FLAG_NOISY = 64  # The engine's move was a capture or a promotion.
+MAX_SCORE = 32000  # Centipawns. Mates and tablebase wins are stored as this.
+NO_EP_SQUARE = 64
+SYMBOLS = ".PNBRQKpnbrqk"
+
+ADJUDICATION_SCORE = 20.0  # Pawns. Games are adjudicated when the score stays above this ...
+ADJUDICATION_PLIES = 8  # ... for this many plies.
+MAX_PLIES = 400  # Longer games are adjudicated as draws.
+
+RecordArray = npt.NDArray[Any]
+
+
+def pack_position(board: chess.Board, score: float, noisy: bool) -> RecordArray:
+    """Pack a position into a record with its score in pawns from white's point of view. The result is set later."""
+    record = np.zeros((), dtype=RECORD)
+    record["occupied"] = board.occupied
+    codes = [SYMBOLS.index(board.piece_at(square).symbol())  # type: ignore[union-attr]
+             for square in chess.scan_forward(board.occupied)]
+    codes += [0] * (32 - len(codes))
+    record["pieces"] = [low | (high << 4) for low, high in zip(codes[::2], codes[1::2])]
+    record["score"] = int(max(-MAX_SCORE, min(MAX_SCORE, round(100 * score)))) if np.isfinite(score) else (
+        MAX_SCORE if score > 0 else -MAX_SCORE)
+    flags = FLAG_WHITE_TO_MOVE if board.turn == chess.WHITE else 0
+    for rook, flag in FLAG_CASTLING:
+        flags |= flag if board.castling_rights & rook else 0
+    flags |= FLAG_IN_CHECK if board.is_check() else 0
+    flags |= FLAG_NOISY if noisy else 0
+    record["flags"] = flags
+    record["fullmove"] = min(board.fullmove_number, 0xFFFF)
+    record["halfmove_clock"] = min(board.halfmove_clock, 0xFF)
+    record["ep_square"] = NO_EP_SQUARE if board.ep_square is None else board.ep_square
+    return record
+
+
+def unpack_pieces(records: RecordArray) -> npt.NDArray[np.int8]:
+    """Get the piece code on every square of many records, as an array of shape (positions, 64)."""
+    occupied = np.unpackbits(records["occupied"].astype("<u8").view(np.uint8).reshape(-1, 8), axis=1,
+                             bitorder="little").astype(bool)
+    nibbles = np.empty((len(records), 32), dtype=np.int8)
+    nibbles[:, 0::2] = records["pieces"] & 0x0F
+    nibbles[:, 1::2] = records["pieces"] >> 4
+    order = np.clip(np.cumsum(occupied, axis=1) - 1, 0, 31)
+    pieces: npt.NDArray[np.int8] = np.where(occupied, np.take_along_axis(nibbles, order, axis=1), 0).astype(np.int8)
+    return pieces
+
+
+def unpack_board(record: RecordArray) -> chess.Board:
+    """Set up the board of one record."""
+    board = chess.Board(None)
+    for square, code in enumerate(unpack_pieces(record.reshape(1))[0]):
+        if code:
+            board.set_piece_at(square, chess.Piece.from_symbol(SYMBOLS[code]))
+    flags = int(record["flags"])
+    board.turn = bool(flags & FLAG_WHITE_TO_MOVE)
+    board.castling_rights = sum(rook for rook, flag in FLAG_CASTLING if flags & flag)
+    board.fullmove_number = int(record["fullmove"])
+    board.halfmove_clock = int(record["halfmove_clock"])
+    board.ep_square = None if record["ep_square"] == NO_EP_SQUARE else int(record["ep_square"])
+    return board
+
+
+def write_shard(path: str, records: RecordArray) -> None:
+    """Write records to a new shard file."""
+    with open(path, "wb") as shard_file:
+        shard_file.write(HEADER.pack(SHARD_MAGIC, SHARD_VERSION))
+        shard_file.write(records.astype(RECORD).tobytes())
+
+
+def load_shard(path: str) -> RecordArray:
+    """Memory-map a shard file as a read-only record array."""
+    with open(path, "rb") as shard_file:
+        mapping = mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version = HEADER.unpack_from(mapping)
+    if magic != SHARD_MAGIC or version != SHARD_VERSION or (len(mapping) - HEADER.size) % RECORD.itemsize:
+        raise ValueError(f"{path} is not a version {SHARD_VERSION} position shard.")
+    return np.frombuffer(mapping, dtype=RECORD, offset=HEADER.size)
+
+
+def shard_paths(directory: str) -> list[str]:
+    """Get the shard files in a directory."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".bin"))
+
+
+@dataclass
+class GameRecords:
+    """The positions of one self-play game."""
+
+    records: RecordArray
+    result: int
+
+
+def search(engine: MaydanEngine, board: chess.Board, limit: chess.engine.Limit) -> Optional[chess.Move]:
+    """Search at a fixed depth, or deeper and deeper until the node budget is used up."""
+    if limit.nodes is None:
+        return cast(Optional[chess.Move], engine.find_best_move(board, limit.depth or 1, board.turn))
+    return list(maydan_iterations(engine, board, limit))[-1].move
+
+
+def play_game(engine: MaydanEngine, rng: random.Random, limit: chess.engine.Limit, random_plies: int) -> GameRecords:
+    """Play one self-play game and record the positions that the engine searched."""
+    board = chess.Board()
+    for _ in range(random_plies):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(rng.choice(moves))
+    records = []
+    adjudicated: Optional[int] = None
+    decisive_plies = 0
+    while adjudicated is None and not board.is_game_over(claim_draw=True) and len(board.move_stack) < MAX_PLIES:
+        move = search(engine, board, limit)
+        if move is None:
+            break
+        white_score = MaydanEngine.best_value if board.turn == chess.WHITE else -MaydanEngine.best_value
+        records.append(pack_position(board, white_score, board.is_capture(move) or move.promotion is not None))
+        decisive_plies = decisive_plies + 1 if abs(white_score) >= ADJUDICATION_SCORE else 0
+        if decisive_plies >= ADJUDICATION_PLIES:
+            adjudicated = 1 if white_score > 0 else -1
+        board.push(move)
+    outcome = board.outcome(claim_draw=True)
+    if adjudicated is not None:
+        result = adjudicated
+    elif outcome is None or outcome.winner is None:
+        result = 0
+    else:
+        result = 1 if outcome.winner == chess.WHITE else -1
+    game_records = np.array(records, dtype=RECORD)
+    game_records["result"] = result
+    return GameRecords(game_records, result)
+
+
+def generate(directory: str, worker: int, games: int, limit: chess.engine.Limit, random_plies: int = 8,
+             shard_size: int = 1 << 20, seed: int = 0) -> tuple[int, float]:
+    """
+    Play self-play games and write their positions to shards named positions-<worker>-<shard>.bin.
+
+    :param worker: The number of this worker, which makes its file names and random openings different from the others.
+    :param shard_size: The most positions in one shard.
+    :return: The number of positions written and the seconds it took.
+    """
+    start = time.perf_counter()
+    engine = MaydanEngine([], {"BitbasePath": ""}, None, Configuration({}))
+    rng = random.Random(seed * 1_000_003 + worker)
+    pending = np.zeros(0, dtype=RECORD)
+    total = shards = 0
+
+    def write_next_shard(records: RecordArray) -> None:
+        nonlocal shards
+        write_shard(os.path.join(directory, f"positions-{worker:03}-{shards:04}.bin"), records)
+        shards += 1
+
+    for _ in range(games):
+        game = play_game(engine, rng, limit, random_plies)
+        pending = np.concatenate([pending, game.records])
+        total += len(game.records)
+        while len(pending) >= shard_size:
+            write_next_shard(pending[:shard_size])
+            pending = pending[shard_size:]
+    if len(pending):
+        write_next_shard(pending)
+    return total, time.perf_counter() - start
+
+
+def run(directory: str, games: int, limit: chess.engine.Limit, processes: int = 1, random_plies: int = 8,
+        shard_size: int = 1 << 20, seed: int = 0) -> int:
+    """
+    Split the games across worker processes and report the throughput.
+
+    :return: The number of positions written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(directory, worker, games // processes + (worker < games % processes), limit, random_plies, shard_size, seed)
+             for worker in range(processes)]
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(generate, tasks)
+    else:
+        results = [generate(*tasks[0])]
+    positions = sum(count for count, _ in results)
+    seconds = sum(seconds for _, seconds in results)
+    print(f"Wrote {positions} positions from {games} games, {positions / seconds if seconds else 0:.1f} positions/s per core")
+    return positions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Generate positions from the command line."""
+    parser = argparse.ArgumentParser(description="Generate training positions by MaydanEngine self-play.")
+    parser.add_argument("directory", help="Where to write the shards.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--depth", type=int, help="The search depth of each move.")
+    parser.add_argument("--nodes", type=int, help="Search deeper until this many nodes are searched.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--random-plies", type=int, default=8, help="Random moves at the start of each game.")
+    parser.add_argument("--shard-size", type=int, default=1 << 20, help="The most positions in one shard file.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    depth = args.depth if args.depth or args.nodes else 2
+    run(args.directory, args.games, chess.engine.Limit(depth=depth, nodes=args.nodes), args.processes,
+        args.random_plies, args.shard_size, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
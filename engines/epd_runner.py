@@ -0,0 +1,219 @@
+"""
+Run an engine on EPD test suites and measure how soon it finds the solutions.
+
+Each EPD line gives a position with `bm` (best moves) or `am` (moves to avoid) operations. The engine from the
+config searches every position within a time, node or depth budget. A position is solved when the final move is one
+of the best moves and none of the moves to avoid. The time and nodes to solution are those of the first iteration
+after which the engine's move stays a solution until the search ends.
+
+MaydanEngine searches at depth 1, 2, ... until the budget is used up; a depth that starts within the budget is
+finished. UCI and XBoard engines report their iterations as they analyse. Other homemade engines search once.
+
+Run a suite with: python -m engines.epd_runner suite.epd --config config.yml --time 5 --processes 4 --csv results.csv
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import sys
+import time
+import chess
+import chess.engine
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from typing import Optional, cast
+from lib.config import Configuration, load_config
+from lib.engine_wrapper import EngineWrapper, MinimalEngine, create_engine
+from engines.maydan_engine import MaydanEngine
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 64  # The deepest MaydanEngine search when the budget has no depth.
+
+
+@dataclass
+class EpdPosition:
+    """A test position and its solution."""
+
+    id: str
+    fen: str
+    best_moves: list[str]  # UCI moves.
+    avoid_moves: list[str]  # UCI moves.
+
+    def is_solution(self, move: Optional[chess.Move]) -> bool:
+        """Check whether a move solves the position."""
+        if move is None:
+            return False
+        if self.best_moves and move.uci() not in self.best_moves:
+            return False
+        return move.uci() not in self.avoid_moves
+
+
+@dataclass
+class Iteration:
+    """The engine's move after one iteration of its search."""
+
+    move: Optional[chess.Move]
+    seconds: float
+    nodes: Optional[int]
+    depth: Optional[int]
+
+
+@dataclass
+class EpdResult:
+    """The result of one test position."""
+
+    id: str
+    fen: str
+    best_moves: str
+    avoid_moves: str
+    move: Optional[str]
+    solved: bool
+    seconds: float
+    nodes: Optional[int]
+    depth: Optional[int]
+    seconds_to_solution: Optional[float]
+    nodes_to_solution: Optional[int]
+
+
+def read_epd(path: str) -> list[EpdPosition]:
+    """Read the positions with a `bm` or `am` operation from an EPD file."""
+    positions = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            board, operations = chess.Board.from_epd(line)
+            best_moves = cast(list[chess.Move], operations.get("bm", []))
+            avoid_moves = cast(list[chess.Move], operations.get("am", []))
+            if not best_moves and not avoid_moves:
+                logger.warning(f"Skipping line {line_number} of {path}, which has no bm or am operation.")
+                continue
+            positions.append(EpdPosition(str(operations.get("id", line_number)), board.fen(),
+                                         [move.uci() for move in best_moves], [move.uci() for move in avoid_moves]))
+    return positions
+
+
+def maydan_iterations(engine: MaydanEngine, board: chess.Board, limit: chess.engine.Limit) -> Iterator[Iteration]:
+    """Search deeper and deeper with MaydanEngine until the time, node or depth budget runs out."""
+    start = time.perf_counter()
+    nodes = 0
+    for depth in range(1, (limit.depth or MAX_DEPTH) + 1):
+        move = cast(Optional[chess.Move], engine.find_best_move(board, depth, board.turn))
+        nodes += MaydanEngine.num_evaluated_nodes
+        seconds = time.perf_counter() - start
+        yield Iteration(move, seconds, nodes, depth)
+        if (limit.time is not None and seconds >= limit.time) or (limit.nodes is not None and nodes >= limit.nodes):
+            break
+
+
+def analysis_iterations(engine: EngineWrapper, board: chess.Board, limit: chess.engine.Limit) -> Iterator[Iteration]:
+    """Follow the principal variation of a UCI or XBoard engine while it analyses."""
+    start = time.perf_counter()
+    with cast(chess.engine.SimpleEngine, engine.engine).analysis(board, limit) as analysis:
+        for info in analysis:
+            if info.get("pv"):
+                seconds = info.get("time", time.perf_counter() - start)
+                yield Iteration(info["pv"][0], seconds, info.get("nodes"), info.get("depth"))
+
+
+def search_iterations(engine: EngineWrapper, board: chess.Board, limit: chess.engine.Limit) -> Iterator[Iteration]:
+    """Get the engine's move after each iteration of its search."""
+    if isinstance(engine, MaydanEngine):
+        yield from maydan_iterations(engine, board, limit)
+    elif isinstance(engine, MinimalEngine):
+        start = time.perf_counter()
+        result = engine.search(board, limit, False, False, chess.engine.PlayResult(None, None))
+        yield Iteration(result.move, time.perf_counter() - start, result.info.get("nodes"), result.info.get("depth"))
+    else:
+        yield from analysis_iterations(engine, board, limit)
+
+
+def run_position(engine: EngineWrapper, position: EpdPosition, limit: chess.engine.Limit) -> EpdResult:
+    """Search one test position and find when the engine settled on a solution."""
+    board = chess.Board(position.fen)
+    iterations = list(search_iterations(engine, board, limit))
+    last = iterations[-1] if iterations else Iteration(None, 0.0, None, None)
+    solution: Optional[Iteration] = None
+    for iteration in iterations:
+        if not position.is_solution(iteration.move):
+            solution = None
+        elif solution is None:
+            solution = iteration
+    return EpdResult(position.id, position.fen, " ".join(position.best_moves), " ".join(position.avoid_moves),
+                     last.move.uci() if last.move else None, solution is not None, last.seconds, last.nodes, last.depth,
+                     solution.seconds if solution else None, solution.nodes if solution else None)
+
+
+def _run_position(config: Configuration, position: EpdPosition, limit: chess.engine.Limit) -> EpdResult:
+    """Search one test position with a new engine. This runs in the worker processes."""
+    with create_engine(config) as engine:
+        return run_position(engine, position, limit)
+
+
+def run_suite(positions: list[EpdPosition], config: Configuration, limit: chess.engine.Limit,
+              processes: int = 1) -> list[EpdResult]:
+    """
+    Search all the test positions.
+
+    :param config: The bot's config, which sets the engine and its options.
+    :param limit: The budget of each position.
+    :param processes: The number of positions to search at a time. Each position gets a new engine in a worker process.
+    """
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            return pool.starmap(_run_position, [(config, position, limit) for position in positions])
+    with create_engine(config) as engine:
+        return [run_position(engine, position, limit) for position in positions]
+
+
+def write_csv(results: list[EpdResult], path: str) -> None:
+    """Write the results with one row per position."""
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(EpdResult.__dataclass_fields__))
+        writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
+
+
+def write_json(results: list[EpdResult], path: str) -> None:
+    """Write the results as a list of objects."""
+    with open(path, "w") as file:
+        json.dump([asdict(result) for result in results], file, indent=2)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run test suites from the command line."""
+    parser = argparse.ArgumentParser(description="Run an engine on EPD test suites.")
+    parser.add_argument("epd", nargs="+", help="EPD files with bm or am operations.")
+    parser.add_argument("--config", default="config.yml", help="The bot config that sets the engine.")
+    parser.add_argument("--time", type=float, help="Seconds per position.")
+    parser.add_argument("--nodes", type=int, help="Nodes per position.")
+    parser.add_argument("--depth", type=int, help="Search depth per position.")
+    parser.add_argument("--processes", type=int, default=1, help="The number of positions to search at a time.")
+    parser.add_argument("--csv", help="Where to write the results as CSV.")
+    parser.add_argument("--json", help="Where to write the results as JSON.")
+    args = parser.parse_args(argv)
+    if args.time is None and args.nodes is None and args.depth is None:
+        parser.error("Set a budget with --time, --nodes or --depth.")
+
+    positions = [position for path in args.epd for position in read_epd(path)]
+    config = load_config(args.config)
+    results = run_suite(positions, config, chess.engine.Limit(time=args.time, nodes=args.nodes, depth=args.depth),
+                        args.processes)
+    for result in results:
+        status = f"solved in {result.seconds_to_solution:.2f} s" if result.solved else "not solved"
+        print(f"{result.id}: played {result.move}, {status}")
+    solved = [result for result in results if result.solved]
+    print(f"Solved {len(solved)} of {len(results)} positions in "
+          f"{sum(result.seconds_to_solution or 0.0 for result in solved):.2f} s to solution.")
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.json:
+        write_json(results, args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
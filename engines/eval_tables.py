@@ -0,0 +1,113 @@
+"""
+Packed evaluation tables for MaydanEngine.
+
+The activity tables edited with `activity_tables/table_creator.py` are packed into a single
+versioned binary bundle. The bundle holds int16 values laid out as [phase][color][piece_type][square],
+already oriented for each color and negated for black, so a search only has to add them up.
+
+The bundle is memory-mapped once per process, so every game process shares the same pages.
+
+Rebuild the bundle after editing a table with: python -m engines.eval_tables
+`engines.texel_tuner` tunes the tables on game results and writes both the tables and the bundle.
+"""
+import mmap
+import os
+import struct
+import chess
+import numpy as np
+import numpy.typing as npt
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLE_DIR = os.path.join(ENGINE_DIR, "activity_tables")
+BUNDLE_PATH = os.path.join(TABLE_DIR, "activity_tables.bin")
+
+BUNDLE_MAGIC = b"MDNPST\0\0"
+BUNDLE_VERSION = 1
+HEADER = struct.Struct("<8sHHHH")  # magic, version, phases, colors, piece types (index 0 is unused)
+
+MIDDLEGAME, ENDGAME = 0, 1
+PHASE_FILE_SUFFIXES = {MIDDLEGAME: "", ENDGAME: "_endgame"}
+PIECE_NAMES = {chess.PAWN: "pawn", chess.KNIGHT: "knight", chess.BISHOP: "bishop",
+               chess.ROOK: "rook", chess.QUEEN: "queen", chess.KING: "king"}
+BUNDLE_SHAPE = (len(PHASE_FILE_SUFFIXES), len(chess.COLORS), len(chess.PIECE_TYPES) + 1, len(chess.SQUARES))
+
+ActivityTable = list[list[list[int]]]
+
+_mapped_bundles: dict[str, npt.NDArray[np.int16]] = {}
+_table_lists: dict[str, tuple[ActivityTable, ActivityTable]] = {}
+
+
+def orient_table(table: npt.NDArray[np.int64]) -> npt.NDArray[np.int16]:
+    """
+    Convert an 8x8 table to per-color values indexed by square.
+
+    :param table: An 8x8 table from white's point of view with rank 8 in row 0.
+    :return: An array of shape (2, 64). Index 1 (white) holds the table values, index 0 (black) holds the
+        vertically mirrored values negated, so that sums are always from white's point of view.
+    """
+    white = np.flipud(table).reshape(64)  # Row 0 of the flipped table is rank 1, so a flat index is a square.
+    black = -table.reshape(64)  # Black reads the table mirrored: rank 8 is black's first rank.
+    oriented = np.empty((len(chess.COLORS), 64), dtype=np.int16)
+    # Colors are bools, which NumPy would treat as masks, so index with ints.
+    oriented[int(chess.WHITE)] = white
+    oriented[int(chess.BLACK)] = black
+    return oriented
+
+
+def pack_tables(table_dir: str = TABLE_DIR) -> npt.NDArray[np.int16]:
+    """Read the `.npy` activity tables in `table_dir` and pack them in the bundle layout."""
+    bundle = np.zeros(BUNDLE_SHAPE, dtype=np.int16)
+    for phase, suffix in PHASE_FILE_SUFFIXES.items():
+        for piece_type, name in PIECE_NAMES.items():
+            table = np.load(os.path.join(table_dir, f"{name}{suffix}_activity_table.npy")).astype(np.int64)
+            if np.abs(table).max() > np.iinfo(np.int16).max:
+                raise ValueError(f"The {name}{suffix} activity table has values that do not fit in 16 bits.")
+            bundle[phase, :, piece_type, :] = orient_table(table)
+    return bundle
+
+
+def write_bundle(bundle: npt.NDArray[np.int16], bundle_path: str = BUNDLE_PATH) -> None:
+    """Write packed tables with a header to `bundle_path`."""
+    if bundle.shape != BUNDLE_SHAPE:
+        raise ValueError(f"Expected tables of shape {BUNDLE_SHAPE}, got {bundle.shape}.")
+    with open(bundle_path, "wb") as bundle_file:
+        bundle_file.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, *BUNDLE_SHAPE[:3]))
+        bundle_file.write(bundle.astype("<i2").tobytes())
+
+
+def map_bundle(bundle_path: str = BUNDLE_PATH) -> npt.NDArray[np.int16]:
+    """
+    Memory-map the bundle. The mapping is made once per process and reused afterwards.
+
+    :return: A read-only array of shape (phase, color, piece_type, square).
+    """
+    bundle_path = os.path.abspath(bundle_path)
+    if bundle_path not in _mapped_bundles:
+        with open(bundle_path, "rb") as bundle_file:
+            mapping = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *shape = HEADER.unpack_from(mapping)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION or tuple(shape) != BUNDLE_SHAPE[:3]:
+            raise ValueError(f"{bundle_path} is not a version {BUNDLE_VERSION} activity table bundle. "
+                             "Rebuild it with: python -m engines.eval_tables")
+        values = np.frombuffer(mapping, dtype="<i2", offset=HEADER.size)
+        _mapped_bundles[bundle_path] = values.reshape(BUNDLE_SHAPE)
+    return _mapped_bundles[bundle_path]
+
+
+def activity_tables(bundle_path: str = BUNDLE_PATH) -> tuple[ActivityTable, ActivityTable]:
+    """
+    Get the middlegame and endgame tables as nested lists indexed by [color][piece_type][square].
+
+    Indexing a NumPy array with Python ints returns NumPy scalars, which is slow in a Python search,
+    so the search reads these small lists instead. Like the mapping, they are built once per process.
+    """
+    bundle_path = os.path.abspath(bundle_path)
+    if bundle_path not in _table_lists:
+        bundle = map_bundle(bundle_path)
+        _table_lists[bundle_path] = bundle[MIDDLEGAME].tolist(), bundle[ENDGAME].tolist()
+    return _table_lists[bundle_path]
+
+
+if __name__ == "__main__":
+    write_bundle(pack_tables())
+    print(f"Wrote {BUNDLE_PATH}")
@@ -0,0 +1,202 @@
+"""
+A depth-first proof-number (df-pn) search that proves forced mates for MaydanEngine.
+
+Proof-number search grows the tree towards the moves with the fewest replies left to refute,
+so it finds and proves long, narrow mates with far fewer nodes than a full-width alpha-beta search.
+Proof and disproof numbers are kept in a transposition table with a fixed maximum number of entries.
+
+Solve a position with: python -m engines.mate_solver "FEN" [node limit]
+"""
+import sys
+import chess
+from typing import Optional
+from engines.maydan_engine import SearchBoard
+
+INFINITY = 1 << 30
+MAX_LINE_LENGTH = 256  # Plies. Longer lines are cut off when they are read from the table.
+
+ProofNumbers = tuple[int, int]  # (phi, delta): the proof and disproof numbers for the side to move.
+
+
+class MateSolver:
+    """
+    Proves that the side to move can force checkmate.
+
+    Every node is scored from the point of view of its side to move: `phi` is the work left to prove
+    that the side to move wins, and `delta` is the work left to prove that it doesn't. For the attacker
+    these are the proof and disproof numbers, and for the defender they are swapped. Draws, including
+    repeating a position on the current line, count as failures for the attacker.
+    """
+
+    def __init__(self, max_nodes: int = 100_000, table_entries: int = 1 << 20) -> None:
+        """
+        :param max_nodes: The number of nodes to search before giving up.
+        :param table_entries: The maximum number of positions kept in the table. When it is full, the half of
+            the unsolved positions that took the least work to reach their numbers is dropped.
+        """
+        self.max_nodes = max_nodes
+        self.table_entries = table_entries
+        self.table: dict[int, ProofNumbers] = {}
+        self.work: dict[int, int] = {}  # The number of nodes searched below each position in the table.
+        self.nodes = 0
+        self.attacker = chess.WHITE
+
+    def solve(self, board: chess.Board) -> Optional[list[chess.Move]]:
+        """
+        Search for a forced mate by the side to move.
+
+        :return: The mating line, ending in checkmate, or None if no mate was proven within the node limit.
+        """
+        search_board = SearchBoard(board.fen(), chess960=board.chess960)
+        self.attacker = search_board.turn
+        self.nodes = 0
+        self.table.clear()
+        self.work.clear()
+        root_key = search_board.zobrist_key()
+        self._mid(search_board, root_key, INFINITY, INFINITY, set())
+        if self.table.get(root_key, (1, 1))[0] != 0:
+            return None
+        return self._mating_line(search_board)
+
+    def _mid(self, board: SearchBoard, key: int, phi_threshold: int, delta_threshold: int, path: set[int]) -> None:
+        """Expand the tree below `board` until its numbers reach one of the thresholds or the node limit is hit."""
+        self.nodes += 1
+        start_nodes = self.nodes
+        moves = list(board.legal_moves)
+        if not moves or board.is_insufficient_material():
+            self._store(key, self._terminal(board, bool(moves)), 1)
+            return
+        if len(path) >= MAX_LINE_LENGTH:
+            # Lines this long are not worth following, and would run into Python's recursion limit.
+            self._store(key, self._draw(board.turn), 1)
+            return
+
+        children = []
+        for move in moves:
+            board.push(move)
+            children.append((move, board.zobrist_key()))
+            board.pop()
+
+        path.add(key)
+        while True:
+            phi, delta = INFINITY, 0
+            second_delta = INFINITY
+            best_move, best_key, best_phi = children[0][0], children[0][1], INFINITY
+            for move, child_key in children:
+                child_phi, child_delta = self._lookup(child_key, path, not board.turn)
+                delta = min(INFINITY, delta + child_phi)
+                if child_delta < phi:
+                    second_delta = phi
+                    phi = child_delta
+                    best_move, best_key, best_phi = move, child_key, child_phi
+                elif child_delta < second_delta:
+                    second_delta = child_delta
+            if phi >= phi_threshold or delta >= delta_threshold or self.nodes >= self.max_nodes:
+                break
+            child_phi_threshold = min(INFINITY, delta_threshold - delta + best_phi)
+            child_delta_threshold = min(phi_threshold, second_delta + 1)
+            board.push(best_move)
+            self._mid(board, best_key, child_phi_threshold, child_delta_threshold, path)
+            board.pop()
+        path.discard(key)
+        self._store(key, (phi, delta), self.work.get(key, 0) + self.nodes - start_nodes + 1)
+
+    def _terminal(self, board: chess.Board, has_moves: bool) -> ProofNumbers:
+        """Get the numbers of a position where the game is over."""
+        if not has_moves and board.is_check():
+            return INFINITY, 0
+        return self._draw(board.turn)
+
+    def _draw(self, turn: chess.Color) -> ProofNumbers:
+        """Get the numbers of a drawn position with `turn` to move. A draw is a win for the defender."""
+        return (INFINITY, 0) if turn == self.attacker else (0, INFINITY)
+
+    def _lookup(self, key: int, path: set[int], turn: chess.Color) -> ProofNumbers:
+        """Get the numbers of a child position. Unexplored positions start at (1, 1)."""
+        if key in path:
+            return self._draw(turn)
+        return self.table.get(key, (1, 1))
+
+    def _store(self, key: int, numbers: ProofNumbers, work: int) -> None:
+        """Save the numbers of a position, making room in the table if it is full."""
+        if key not in self.table and len(self.table) >= self.table_entries:
+            # Proofs and disproofs are kept for as long as possible. They are needed for the mating line.
+            candidates = [position for position, entry in self.table.items() if 0 not in entry] or list(self.table)
+            candidates.sort(key=self.work.__getitem__)
+            for position in candidates[:max(1, len(candidates) // 2)]:
+                del self.table[position]
+                del self.work[position]
+        self.table[key] = numbers
+        self.work[key] = work
+
+    def _mating_line(self, board: SearchBoard) -> Optional[list[chess.Move]]:
+        """
+        Follow the proof from a proven position to checkmate.
+
+        The attacker plays the proven move that mates soonest and the defender plays the move that delays mate longest,
+        as far as the proof tree shows.
+
+        :return: The line, or None if part of the proof was dropped from a full table.
+        """
+        board = board.copy(stack=False)
+        distances: dict[int, int] = {}
+        if self._mate_distance(board, board.zobrist_key(), set(), distances) >= INFINITY:
+            return None
+        line: list[chess.Move] = []
+        while not board.is_checkmate():
+            attacker_to_move = board.turn == self.attacker
+            choices = []
+            for move in board.legal_moves:
+                board.push(move)
+                choices.append((distances.get(board.zobrist_key(), INFINITY), move))
+                board.pop()
+            distance, next_move = (min if attacker_to_move else max)(choices, key=lambda choice: choice[0])
+            if distance >= INFINITY:
+                return None
+            line.append(next_move)
+            board.push(next_move)
+        return line
+
+    def _mate_distance(self, board: SearchBoard, key: int, path: set[int], distances: dict[int, int]) -> int:
+        """Get the number of plies to checkmate in the proof tree below a proven position, or INFINITY if it is incomplete."""
+        if key in distances:
+            return distances[key]
+        if board.is_checkmate():
+            distances[key] = 0
+            return 0
+        if len(path) >= MAX_LINE_LENGTH:
+            return INFINITY
+        attacker_to_move = board.turn == self.attacker
+        distance = INFINITY if attacker_to_move else 0
+        path.add(key)
+        for move in board.legal_moves:
+            board.push(move)
+            child_key = board.zobrist_key()
+            child_phi, child_delta = self.table.get(child_key, (1, 1))
+            # A move back to a position on the line can never be part of the shortest mate.
+            if child_key in path:
+                child_distance = INFINITY
+            elif (child_delta if attacker_to_move else child_phi) == 0:
+                child_distance = min(INFINITY, self._mate_distance(board, child_key, path, distances) + 1)
+            else:
+                child_distance = INFINITY
+            board.pop()
+            distance = min(distance, child_distance) if attacker_to_move else max(distance, child_distance)
+        path.discard(key)
+        distances[key] = distance
+        return distance
+
+
+def solve_mate(board: chess.Board, max_nodes: int = 100_000, table_entries: int = 1 << 20) -> Optional[list[chess.Move]]:
+    """Get a forced mating line for the side to move, or None if no mate was proven within `max_nodes` nodes."""
+    return MateSolver(max_nodes, table_entries).solve(board)
+
+
+if __name__ == "__main__":
+    solver = MateSolver(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    start_board = chess.Board(sys.argv[1])
+    mating_line = solver.solve(start_board)
+    if mating_line is None:
+        print(f"No mate found in {solver.nodes} nodes.")
+    else:
+        print(f"Mate in {(len(mating_line) + 1) // 2} found in {solver.nodes} nodes: {start_board.variation_san(mating_line)}")
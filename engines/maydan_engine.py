@@ -1,12 +1,18 @@
 import chess
+import chess.polyglot
+import chess.syzygy
 from chess.engine import PlayResult, Limit
 from lib.engine_wrapper import MinimalEngine
 from lib.types import MOVE, HOMEMADE_ARGS_TYPE
+import array
 import logging
-import numpy as np
 import os
-from lib import model
+import numpy as np
+from lib import model, bitbases
 from lib.config import Configuration
+from engines.eval_tables import activity_tables
+from engines.nnue import Network, load_network
+import numpy.typing as npt
 from lib.types import (ReadableType, ChessDBMoveType, LichessEGTBMoveType, OPTIONS_GO_EGTB_TYPE, OPTIONS_TYPE,
                        COMMANDS_TYPE, MOVE, InfoStrDict, InfoDictKeys, InfoDictValue, GO_COMMANDS_TYPE, EGTPATH_TYPE,
                        ENGINE_INPUT_ARGS_TYPE, ENGINE_INPUT_KWARGS_TYPE)
@@ -39,18 +45,11 @@ def material_balance(board: chess.Board) -> int:
     return MaydanEngine.maximizer * (white_val - black_val)
 
 
-def activity_score(board: chess.Board) -> float:    
-    val = 0
-    for row in range(0, 8):
-      for col in range(0, 8):
-        squareIndex = row * 8 + col
-        square = chess.SQUARES[squareIndex]
-        piece = board.piece_at(square)
-        color = board.color_at(square)
-        if piece is not None:
-            maximizer = MaydanEngine.maximizer if color == chess.WHITE else -MaydanEngine.maximizer
-            val += maximizer * MaydanEngine.piece_to_activity_table[piece.piece_type][MaydanEngine.color_indexing[color] * row][col]
-    return val / 100.0
+def activity_score(board: "SearchBoard") -> float:
+    # Taper between the middlegame and endgame sums kept up to date by SearchBoard.push/pop.
+    phase = min(board.phase, TOTAL_PHASE)
+    tapered = (board.mg_activity * phase + board.eg_activity * (TOTAL_PHASE - phase)) / TOTAL_PHASE
+    return MaydanEngine.maximizer * tapered / 100.0
 
 
 def pawns_score(board: chess.Board) -> float:
@@ -58,29 +57,92 @@ def pawns_score(board: chess.Board) -> float:
     return val
 
 
-def heuristic(board: chess.Board) -> float:
+def heuristic(board: "SearchBoard") -> float:
+    if MaydanEngine.network is not None:
+        accumulator = cast(npt.NDArray[np.int16], board.accumulator)
+        return MaydanEngine.maximizer * MaydanEngine.network.evaluate(accumulator, board.turn)
     val = 0.0
     val += material_balance(board)
-    # val += activity_score(board)
+    val += activity_score(board)
     # val += pawns_score(board)
     return val
 
 
+def evaluate(board: "SearchBoard") -> float:
+    """Get the heuristic through the eval cache, if there is one. The cache stores scores from white's point of view."""
+    cache = MaydanEngine.eval_cache
+    if cache is None:
+        return heuristic(board)
+    key = board.zobrist_key()
+    index = key & cache.mask
+    if cache.keys[index] == key:
+        cache.hits += 1
+        return MaydanEngine.maximizer * cache.values[index]
+    cache.misses += 1
+    val = heuristic(board)
+    cache.keys[index] = key
+    cache.values[index] = MaydanEngine.maximizer * val
+    return val
+
 
-def max_value(node: chess.Board, depth: int, time_in_qsearch: int, alpha: float, beta: float) -> float:
+def tablebase_value(node: "SearchBoard", pieces_before: int) -> Optional[float]:
+    """
+    Get the value of a position from the bitbases or the Syzygy tablebases when a capture has just brought the piece
+    count down to the probe limit. Further down the tree, every position is in the tablebases, so the whole subtree is
+    replaced by one probe.
+
+    :param pieces_before: The number of pieces before the last move.
+    :return: The value for the maximizer, or None if the position is not probed or not in the tablebases.
+    """
+    tablebase, endgame_bitbases = MaydanEngine.tablebase, MaydanEngine.endgame_bitbases
+    pieces = chess.popcount(node.occupied)
+    probe_limit = max(MaydanEngine.syzygy_probe_limit if tablebase is not None else 0,
+                      bitbases.MAX_PIECES if endgame_bitbases is not None else 0)
+    if pieces >= pieces_before or pieces > probe_limit:
+        return None
+    key = node.zobrist_key()
+    cache = MaydanEngine.wdl_cache
+    if key in cache:
+        MaydanEngine.tablebase_hits += 1
+        wdl = cache[key]
+    else:
+        MaydanEngine.tablebase_probes += 1
+        wdl = endgame_bitbases.probe_wdl(node) if endgame_bitbases is not None else None
+        if wdl is None and tablebase is not None and pieces <= MaydanEngine.syzygy_probe_limit:
+            try:
+                wdl = tablebase.probe_wdl(node)
+            except KeyError:
+                wdl = None
+        if len(cache) >= WDL_CACHE_ENTRIES:
+            cache.clear()
+        cache[key] = wdl
+    if wdl is None:
+        return None
+    if abs(wdl) < 2:
+        # Cursed wins and blessed losses are draws under the 50-move rule.
+        return 0.0
+    white_wins = (wdl > 0) == (node.turn == chess.WHITE)
+    # The heuristic breaks ties between wins, so the engine still prefers keeping more material.
+    return MaydanEngine.maximizer * (TABLEBASE_WIN if white_wins else -TABLEBASE_WIN) + evaluate(node)
+
+
+def max_value(node: "SearchBoard", depth: int, time_in_qsearch: int, alpha: float, beta: float) -> float:
     capture_moves = [move for move in node.legal_moves if node.is_capture(move)]
     if depth < 0 or (depth == 0 and len(capture_moves) == 0) or node.is_game_over():
         if node.is_checkmate():
             return float("-inf")
-        return heuristic(node)
+        return evaluate(node)
     if depth == 0 and len(capture_moves) > 0:
         time_in_qsearch += 1
     rv = float("-inf")
+    pieces = chess.popcount(node.occupied)
     for move in sorted_moves(node, depth):
         MaydanEngine.num_evaluated_nodes += 1
         node.push(move)
-        new_depth = q_search(node, depth, time_in_qsearch)
-        cv = min_value(node, new_depth, time_in_qsearch, alpha, beta)
+        cv = tablebase_value(node, pieces)
+        if cv is None:
+            new_depth = q_search(node, depth, time_in_qsearch)
+            cv = min_value(node, new_depth, time_in_qsearch, alpha, beta)
         node.pop()
         rv = max(rv, cv)
         if rv >= beta:
@@ -89,20 +151,23 @@ def max_value(node: chess.Board, depth: int, time_in_qsearch: int, alpha: float,
     return rv
 
 
-def min_value(node: chess.Board, depth: int, time_in_qsearch: int, alpha: float, beta: float) -> float:
+def min_value(node: "SearchBoard", depth: int, time_in_qsearch: int, alpha: float, beta: float) -> float:
     capture_moves = [move for move in node.legal_moves if node.is_capture(move)]
     if depth < 0 or (depth == 0 and len(capture_moves) == 0) or node.is_game_over():
         if node.is_checkmate():
             return float("inf")
-        return heuristic(node)
+        return evaluate(node)
     if depth == 0 and len(capture_moves) > 0:
         time_in_qsearch += 1
     rv = float("inf")
+    pieces = chess.popcount(node.occupied)
     for move in sorted_moves(node, depth):
         MaydanEngine.num_evaluated_nodes += 1
         node.push(move)
-        new_depth = q_search(node, depth, time_in_qsearch)
-        cv = max_value(node, new_depth, time_in_qsearch, alpha, beta)
+        cv = tablebase_value(node, pieces)
+        if cv is None:
+            new_depth = q_search(node, depth, time_in_qsearch)
+            cv = max_value(node, new_depth, time_in_qsearch, alpha, beta)
         node.pop()
         rv = min(rv, cv)
         if rv <= alpha:
@@ -157,19 +222,233 @@ def sorted_moves(board: chess.Board, depth: int) -> list[chess.Move]:
     return pure_check_moves + capture_moves + rest_moves
 
 
+# Game phase weights. The starting position has TOTAL_PHASE and a bare-kings ending has 0.
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+TOTAL_PHASE = 24
+
+# Polyglot Zobrist keys of the pieces, indexed by [color][piece_type][square].
+PIECE_KEYS = [[[chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((piece_type - 1) * 2 + color) + square] if piece_type else 0
+                for square in chess.SQUARES]
+               for piece_type in range(7)]
+              for color in (chess.BLACK, chess.WHITE)]
+ZOBRIST_HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+TABLEBASE_WIN = 1000.0  # Pawns. More than any evaluation and less than a checkmate, which is infinite.
+WDL_CACHE_ENTRIES = 1 << 18  # The WDL cache is cleared when it reaches this size.
+
+_tablebases: dict[str, chess.syzygy.Tablebase] = {}
+
+
+def open_tablebase(syzygy_path: str) -> chess.syzygy.Tablebase:
+    """
+    Open Syzygy tablebases. Each set of directories is opened once per process and reused afterwards.
+
+    :param syzygy_path: The tablebase directories, separated by `os.pathsep`.
+    """
+    if syzygy_path not in _tablebases:
+        tablebase = chess.syzygy.Tablebase()
+        for directory in filter(None, syzygy_path.split(os.pathsep)):
+            tablebase.add_directory(directory)
+        _tablebases[syzygy_path] = tablebase
+    return _tablebases[syzygy_path]
+
+
+def castling_squares(board: chess.Board, move: chess.Move) -> tuple[chess.Square, chess.Square, chess.Square]:
+    """Get the king's target square and the rook's origin and target squares of a castling move."""
+    kingside = board.is_kingside_castling(move)
+    rank = chess.square_rank(move.from_square)
+    # Standard castling is encoded as the king moving two squares, chess960 castling as the king taking its rook.
+    own_rook_on_target = board.occupied_co[board.turn] & chess.BB_SQUARES[move.to_square]
+    rook_from = move.to_square if own_rook_on_target else chess.square(7 if kingside else 0, rank)
+    return chess.square(6 if kingside else 2, rank), rook_from, chess.square(5 if kingside else 3, rank)
+
+
+class SearchBoard(chess.Board):
+    """
+    A board that keeps its evaluation terms and Zobrist key up to date on push/pop.
+
+    `mg_activity` and `eg_activity` are white-minus-black sums of the middlegame and endgame
+    activity tables and `piece_key` is the Zobrist key of the pieces. When MaydanEngine uses a
+    network, `accumulator` holds its first layer. Only push and pop update them; call `refresh`
+    after editing the board any other way.
+    """
+
+    def __init__(self, fen: Optional[str] = chess.STARTING_FEN, *, chess960: bool = False) -> None:
+        """Set up the board and compute its incremental state from scratch."""
+        self._incremental_stack: list[tuple[int, int, int, int]] = []
+        self.mg_activity = 0
+        self.eg_activity = 0
+        self.phase = 0
+        self.piece_key = 0
+        self._accumulator_stack: list[Optional[npt.NDArray[np.int16]]] = []
+        self.accumulator: Optional[npt.NDArray[np.int16]] = None
+        super().__init__(fen, chess960=chess960)
+        self.refresh()
+
+    @classmethod
+    def from_board(cls, board: chess.Board) -> "SearchBoard":
+        """Copy a board, including its move history so repetitions are still detected."""
+        search_board = cls(board.root().fen(), chess960=board.chess960)
+        for move in board.move_stack:
+            search_board.push(move)
+        return search_board
+
+    def refresh(self) -> None:
+        """Recompute the activity sums, game phase, piece key and accumulator from the pieces on the board."""
+        mg_table, eg_table = MaydanEngine.mg_activity_table, MaydanEngine.eg_activity_table
+        self.mg_activity = self.eg_activity = self.phase = self.piece_key = 0
+        for square, piece in self.piece_map().items():
+            self.mg_activity += mg_table[piece.color][piece.piece_type][square]
+            self.eg_activity += eg_table[piece.color][piece.piece_type][square]
+            self.phase += PHASE_WEIGHTS[piece.piece_type]
+            self.piece_key ^= PIECE_KEYS[piece.color][piece.piece_type][square]
+        network = MaydanEngine.network
+        self.accumulator = network.new_accumulator(self) if network is not None else None
+
+    def zobrist_key(self) -> int:
+        """Get the Polyglot Zobrist key of the position, the same as `chess.polyglot.zobrist_hash`."""
+        return (self.piece_key ^ ZOBRIST_HASHER.hash_castling(self)
+                ^ ZOBRIST_HASHER.hash_ep_square(self) ^ ZOBRIST_HASHER.hash_turn(self))
+
+    def clear_stack(self) -> None:
+        """Clear the move stack together with the saved incremental state."""
+        super().clear_stack()
+        self._incremental_stack.clear()
+        self._accumulator_stack.clear()
+
+    def copy(self, *, stack: Union[bool, int] = True) -> "SearchBoard":
+        """Copy the board along with its incremental state."""
+        board = super().copy(stack=stack)
+        board.mg_activity, board.eg_activity, board.phase = self.mg_activity, self.eg_activity, self.phase
+        board.piece_key = self.piece_key
+        board._incremental_stack = self._incremental_stack[len(self._incremental_stack) - len(board.move_stack):]
+        # Accumulators are never changed after the push that made them, so they can be shared.
+        board.accumulator = self.accumulator
+        board._accumulator_stack = self._accumulator_stack[len(self._accumulator_stack) - len(board.move_stack):]
+        return board
+
+    def push(self, move: chess.Move) -> None:
+        """Update the incremental state, then make the move."""
+        self._incremental_stack.append((self.mg_activity, self.eg_activity, self.phase, self.piece_key))
+        network = MaydanEngine.network
+        king_moved: Optional[chess.Color] = None
+        if network is not None:
+            self._accumulator_stack.append(self.accumulator)
+        if move and not move.drop:
+            if network is not None:
+                king_moved = self._update_accumulator(network, move)
+            self._update_incremental(move)
+        super().push(move)
+        if network is not None and king_moved is not None:
+            cast(npt.NDArray[np.int16], self.accumulator)[int(king_moved)] = network.refresh(self, king_moved)
+
+    def pop(self) -> chess.Move:
+        """Unmake the last move and restore the incremental state from before it."""
+        move = super().pop()
+        self.mg_activity, self.eg_activity, self.phase, self.piece_key = self._incremental_stack.pop()
+        if MaydanEngine.network is not None:
+            self.accumulator = self._accumulator_stack.pop()
+        return move
+
+    def _update_accumulator(self, network: Network, move: chess.Move) -> Optional[chess.Color]:
+        """
+        Replace the accumulator with the one after the move.
+
+        :return: The side whose king moves. Its accumulator must be refreshed once the move is made.
+        """
+        color = self.turn
+        from_square, to_square = move.from_square, move.to_square
+        piece_type = cast(chess.PieceType, self.piece_type_at(from_square))
+        removed, added = [], []
+        if piece_type == chess.KING and self.is_castling(move):
+            _, rook_from, rook_to = castling_squares(self, move)
+            removed.append((color, chess.ROOK, rook_from))
+            added.append((color, chess.ROOK, rook_to))
+        else:
+            if piece_type != chess.KING:
+                removed.append((color, piece_type, from_square))
+                added.append((color, move.promotion or piece_type, to_square))
+            if self.is_en_passant(move):
+                removed.append((not color, chess.PAWN, chess.square(chess.square_file(to_square),
+                                                                    chess.square_rank(from_square))))
+            else:
+                captured_type = self.piece_type_at(to_square)
+                if captured_type:
+                    removed.append((not color, captured_type, to_square))
+        king_moved = color if piece_type == chess.KING else None
+        self.accumulator = network.update(cast(npt.NDArray[np.int16], self.accumulator), self, removed, added,
+                                          skip=king_moved)
+        return king_moved
+
+    def _update_incremental(self, move: chess.Move) -> None:
+        color = self.turn
+        mg, eg = MaydanEngine.mg_activity_table[color], MaydanEngine.eg_activity_table[color]
+        keys = PIECE_KEYS[color]
+        from_square, to_square = move.from_square, move.to_square
+        piece_type = cast(chess.PieceType, self.piece_type_at(from_square))
+
+        if piece_type == chess.KING and self.is_castling(move):
+            king_to, rook_from, rook_to = castling_squares(self, move)
+            self.mg_activity += (mg[chess.KING][king_to] - mg[chess.KING][from_square]
+                                 + mg[chess.ROOK][rook_to] - mg[chess.ROOK][rook_from])
+            self.eg_activity += (eg[chess.KING][king_to] - eg[chess.KING][from_square]
+                                 + eg[chess.ROOK][rook_to] - eg[chess.ROOK][rook_from])
+            self.piece_key ^= (keys[chess.KING][king_to] ^ keys[chess.KING][from_square]
+                               ^ keys[chess.ROOK][rook_to] ^ keys[chess.ROOK][rook_from])
+            return
+
+        new_piece_type = move.promotion or piece_type
+        self.mg_activity += mg[new_piece_type][to_square] - mg[piece_type][from_square]
+        self.eg_activity += eg[new_piece_type][to_square] - eg[piece_type][from_square]
+        self.phase += PHASE_WEIGHTS[new_piece_type] - PHASE_WEIGHTS[piece_type]
+        self.piece_key ^= keys[new_piece_type][to_square] ^ keys[piece_type][from_square]
+
+        if self.is_en_passant(move):
+            captured_square = chess.square(chess.square_file(to_square), chess.square_rank(from_square))
+            captured_type: Optional[chess.PieceType] = chess.PAWN
+        else:
+            captured_square = to_square
+            captured_type = self.piece_type_at(to_square)
+        if captured_type:
+            them = not color
+            self.mg_activity -= MaydanEngine.mg_activity_table[them][captured_type][captured_square]
+            self.eg_activity -= MaydanEngine.eg_activity_table[them][captured_type][captured_square]
+            self.phase -= PHASE_WEIGHTS[captured_type]
+            self.piece_key ^= PIECE_KEYS[them][captured_type][captured_square]
+
+
+def mate_info(board: chess.Board, mating_line: list[chess.Move]) -> chess.engine.InfoDict:
+    """Get the engine info for a forced mate by the side to move."""
+    return {"score": chess.engine.PovScore(chess.engine.Mate((len(mating_line) + 1) // 2), board.turn), "pv": mating_line}
+
+
+class EvalCache:
+    """
+    A fixed-size, direct-mapped cache of static evaluations keyed by Zobrist key.
+
+    Each slot holds one key and one evaluation from white's point of view. A new entry simply
+    replaces whatever was in its slot.
+    """
+
+    ENTRY_SIZE = 16  # An unsigned 64-bit key and a double.
+
+    def __init__(self, size_mb: int) -> None:
+        """:param size_mb: The size of the cache in megabytes. It is rounded down to a power of two entries."""
+        entries = 1 << max(0, (size_mb * 1024 * 1024 // self.ENTRY_SIZE).bit_length() - 1)
+        self.mask = entries - 1
+        self.keys = array.array("Q", bytes(8 * entries))
+        self.values = array.array("d", bytes(8 * entries))
+        self.hits = 0
+        self.misses = 0
+
+
 class MaydanEngine(MinimalEngine):
 
-    king_table = None
-    queen_table = None
-    rook_table = None
-    bishop_table = None
-    knight_table = None
-    pawn_table = None
+    # Loaded once per process at import, so boards can be set up before any engine is made.
+    mg_activity_table, eg_activity_table = activity_tables()
 
-    piece_to_activity_table = {}
     maximizer = 1
     maximizer_mapping = {chess.WHITE: 1, chess.BLACK: -1}
-    color_indexing = {chess.WHITE: 1, chess.BLACK: -1}
 
     piece_value = {chess.KING: 0, chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3.25, chess.ROOK: 5, chess.QUEEN: 9}
 
@@ -177,52 +456,81 @@ class MaydanEngine(MinimalEngine):
 
     max_time_in_qsearch = 3
 
+    default_eval_cache_mb = 0
+    eval_cache: Optional[EvalCache] = None
+
+    network: Optional[Network] = None
+
+    tablebase: Optional[chess.syzygy.Tablebase] = None
+    endgame_bitbases: Optional[bitbases.Bitbases] = None
+    syzygy_probe_limit = 7
+    # WDL results by Zobrist key, with None for positions that are not in the tablebases. They are kept between searches.
+    wdl_cache: dict[int, Optional[int]] = {}
+    tablebase_probes = 0
+    tablebase_hits = 0
+
+    best_value = 0.0
+
     def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_GO_EGTB_TYPE, stderr: Optional[int],
                  draw_or_resign: Configuration, game: Optional[model.Game] = None, name: Optional[str] = None,
                  **popen_args: str):
         super().__init__(commands, options, stderr, draw_or_resign, game, name=name, **popen_args)
-        eng_path = os.path.abspath("engines")
-        table_path = os.path.join(eng_path, "activity_tables")
-        assert os.path.isdir(table_path)
-        MaydanEngine.king_table = np.load(os.path.join(table_path, "king_activity_table.npy"))
-        MaydanEngine.queen_table = np.load(os.path.join(table_path, "queen_activity_table.npy"))
-        MaydanEngine.rook_table = np.load(os.path.join(table_path, "rook_activity_table.npy"))
-        MaydanEngine.bishop_table = np.load(os.path.join(table_path, "bishop_activity_table.npy"))
-        MaydanEngine.knight_table = np.load(os.path.join(table_path, "knight_activity_table.npy"))
-        MaydanEngine.pawn_table = np.load(os.path.join(table_path, "pawn_activity_table.npy"))
-
-
-        MaydanEngine.piece_to_activity_table[chess.PAWN] = MaydanEngine.pawn_table
-        MaydanEngine.piece_to_activity_table[chess.KNIGHT] = MaydanEngine.knight_table
-        MaydanEngine.piece_to_activity_table[chess.BISHOP] = MaydanEngine.bishop_table
-        MaydanEngine.piece_to_activity_table[chess.ROOK] = MaydanEngine.rook_table
-        MaydanEngine.piece_to_activity_table[chess.QUEEN] = MaydanEngine.queen_table
-        MaydanEngine.piece_to_activity_table[chess.KING] = MaydanEngine.king_table
+        eval_file = cast(str, options.get("EvalFile", ""))
+        MaydanEngine.network = load_network(eval_file) if eval_file else None
+        eval_cache_mb = int(cast(int, options.get("EvalHash", MaydanEngine.default_eval_cache_mb)))
+        MaydanEngine.eval_cache = EvalCache(eval_cache_mb) if eval_cache_mb > 0 else None
+        syzygy_path = cast(str, options.get("SyzygyPath", ""))
+        MaydanEngine.tablebase = open_tablebase(syzygy_path) if syzygy_path else None
+        MaydanEngine.syzygy_probe_limit = int(cast(int, options.get("SyzygyProbeLimit", 7)))
+        bitbase_path = cast(str, options.get("BitbasePath", bitbases.DEFAULT_DIRECTORY))
+        endgame_bitbases = bitbases.load_bitbases(bitbase_path) if bitbase_path else None
+        MaydanEngine.endgame_bitbases = endgame_bitbases if endgame_bitbases and endgame_bitbases.tables else None
+        self.mate_solver_nodes = int(cast(int, options.get("MateSolverNodes", 100_000)))
+        self.mate_table_entries = int(cast(int, options.get("MateTableEntries", 1 << 20)))
 
 
 
     def search(self, board: chess.Board, *args: HOMEMADE_ARGS_TYPE) -> PlayResult:
-        return PlayResult(self.find_best_move(board, 4, board.turn), None)
+        move = self.find_best_move(board, 4, board.turn)
+        info: chess.engine.InfoDict = {"nodes": MaydanEngine.num_evaluated_nodes}
+        if MaydanEngine.best_value == float("inf") and self.mate_solver_nodes > 0:
+            mating_line = self.solve_mate(board)
+            if mating_line:
+                return PlayResult(mating_line[0], None, info=mate_info(board, mating_line) | info)
+        return PlayResult(move, None, info=info)
+
+    def solve_mate(self, board: chess.Board) -> Optional[list[chess.Move]]:
+        """Look for a forced mate with the proof-number solver, within the MateSolverNodes node limit."""
+        from engines.mate_solver import solve_mate  # The solver searches with SearchBoard, so it imports this module.
+        mating_line = solve_mate(board, self.mate_solver_nodes, self.mate_table_entries)
+        logger.info("Mate solver: {}".format(board.variation_san(mating_line) if mating_line else "no mate found"))
+        return mating_line
     
 
     def find_best_move(self, board: chess.Board, depth: int, maximizer: chess.Color) -> MOVE:
 
 
-        if maximizer == chess.BLACK:
-            MaydanEngine.maximizer = -1
+        MaydanEngine.maximizer = MaydanEngine.maximizer_mapping[maximizer]
         MaydanEngine.num_evaluated_nodes = 0
+        if MaydanEngine.eval_cache is not None:
+            MaydanEngine.eval_cache.hits = MaydanEngine.eval_cache.misses = 0
+        MaydanEngine.tablebase_probes = MaydanEngine.tablebase_hits = 0
+        board = SearchBoard.from_board(board)
 
 
         rv = float("-inf")
         alpha = float("-inf")
         beta = float("inf")
         best_move = None
+        pieces = chess.popcount(board.occupied)
         for move in sorted_moves(board, depth):
             
 
             board.push(move)
-            new_depth = q_search(board, depth, 0)
-            cv = min_value(board, new_depth, 0, alpha, beta)
+            cv = tablebase_value(board, pieces)
+            if cv is None:
+                new_depth = q_search(board, depth, 0)
+                cv = min_value(board, new_depth, 0, alpha, beta)
             board.pop()
 
 
@@ -232,6 +540,11 @@ class MaydanEngine(MinimalEngine):
         
 
         logger.info("Evaluated {} nodes".format(MaydanEngine.num_evaluated_nodes))
+        if MaydanEngine.eval_cache is not None:
+            logger.info("Eval cache: {} hits, {} misses".format(MaydanEngine.eval_cache.hits, MaydanEngine.eval_cache.misses))
+        if MaydanEngine.tablebase is not None or MaydanEngine.endgame_bitbases is not None:
+            logger.info("Tablebase: {} probes, {} cached".format(MaydanEngine.tablebase_probes, MaydanEngine.tablebase_hits))
+        MaydanEngine.best_value = rv
         logger.info("The move with the highest value ({}) is {}".format(rv, best_move))
         
 
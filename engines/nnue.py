@@ -0,0 +1,216 @@
+"""
+A small NNUE-style evaluation network for MaydanEngine.
+
+The input is HalfKP-like: for each side's point of view, every non-king piece is one feature
+indexed by (own king square, piece, piece square), with the board mirrored for black. The first
+layer is an int16 accumulator per point of view that the search board updates with row adds and
+subtracts as moves are made, and only recomputes when that side's king moves. A tiny dense head
+turns the two accumulators into a score in pawns.
+
+The weights are read from a memory-mapped file, once per process. Write one with `write_network`.
+
+Benchmark the network against the activity tables with: python -m engines.nnue [weights file]
+"""
+import mmap
+import os
+import struct
+import sys
+import chess
+import numpy as np
+import numpy.typing as npt
+from typing import Any, Iterable, Optional
+
+NETWORK_MAGIC = b"MDNNUE\0\0"
+NETWORK_VERSION = 1
+HEADER = struct.Struct("<8sHIHH14x")  # magic, version, features, accumulator size, hidden size; padded to 32 bytes
+
+PIECE_KINDS = 10  # Pawn to queen, for both colors. Kings are not features.
+NUM_FEATURES = 64 * PIECE_KINDS * 64
+ACTIVATION_SCALE = 127  # Accumulator values are clipped to [0, ACTIVATION_SCALE] and scaled to [0, 1].
+MAX_FEATURES = 30  # Non-king pieces that can be on the board at once.
+
+PieceChange = tuple[chess.Color, chess.PieceType, chess.Square]
+
+_networks: dict[str, "Network"] = {}
+
+
+def feature_index(perspective: chess.Color, king_square: chess.Square, color: chess.Color,
+                  piece_type: chess.PieceType, square: chess.Square) -> int:
+    """
+    Get the input feature of a piece from one side's point of view.
+
+    :param perspective: The side whose point of view is used. Black sees the board mirrored vertically.
+    :param king_square: The square of that side's king.
+    """
+    flip = 0 if perspective == chess.WHITE else 56
+    kind = (piece_type - 1) * 2 + (color != perspective)
+    return ((king_square ^ flip) * PIECE_KINDS + kind) * 64 + (square ^ flip)
+
+
+def check_accumulator_range(feature_weights: npt.NDArray[np.int16], feature_bias: npt.NDArray[np.int16]) -> None:
+    """
+    Make sure that no position can overflow the int16 accumulators.
+
+    :raises ValueError: If the bias plus the largest weights of MAX_FEATURES pieces can leave the int16 range.
+    """
+    largest = np.abs(feature_weights.astype(np.int32)).max(axis=0) if len(feature_weights) else 0
+    worst_case = int((np.abs(feature_bias.astype(np.int32)) + MAX_FEATURES * largest).max())
+    if worst_case > np.iinfo(np.int16).max:
+        raise ValueError(f"The first layer weights can add up to {worst_case}, which does not fit in 16 bits.")
+
+
+def board_features(board: chess.Board, perspective: chess.Color) -> list[int]:
+    """Get the active input features of a position from one side's point of view."""
+    king_square = board.king(perspective)
+    if king_square is None:
+        return []
+    return [feature_index(perspective, king_square, piece.color, piece.piece_type, square)
+            for square, piece in board.piece_map().items() if piece.piece_type != chess.KING]
+
+
+class Network:
+    """The weights of an evaluation network, memory-mapped from a file."""
+
+    def __init__(self, network_path: str) -> None:
+        """:param network_path: A file written by `write_network`."""
+        with open(network_path, "rb") as network_file:
+            self._mapping = mmap.mmap(network_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, features, accumulator_size, hidden_size = HEADER.unpack_from(self._mapping)
+        if magic != NETWORK_MAGIC or version != NETWORK_VERSION or features != NUM_FEATURES:
+            raise ValueError(f"{network_path} is not a version {NETWORK_VERSION} MaydanEngine network.")
+        self.accumulator_size = accumulator_size
+        self.hidden_size = hidden_size
+
+        offset = HEADER.size
+
+        def section(dtype: str, shape: tuple[int, ...]) -> npt.NDArray[Any]:
+            nonlocal offset
+            values = np.frombuffer(self._mapping, dtype=dtype, count=int(np.prod(shape)), offset=offset)
+            offset += values.nbytes
+            return values.reshape(shape)
+
+        self.feature_weights: npt.NDArray[np.int16] = section("<i2", (NUM_FEATURES, accumulator_size))
+        self.feature_bias: npt.NDArray[np.int16] = section("<i2", (accumulator_size,))
+        self.hidden_weights: npt.NDArray[np.float32] = section("<f4", (2 * accumulator_size, hidden_size))
+        self.hidden_bias: npt.NDArray[np.float32] = section("<f4", (hidden_size,))
+        self.output_weights: npt.NDArray[np.float32] = section("<f4", (hidden_size,))
+        self.output_bias = float(section("<f4", (1,))[0])
+        if offset != len(self._mapping):
+            raise ValueError(f"{network_path} has {len(self._mapping) - offset} unexpected trailing bytes.")
+        check_accumulator_range(self.feature_weights, self.feature_bias)
+
+    def refresh(self, board: chess.Board, perspective: chess.Color) -> npt.NDArray[np.int16]:
+        """Compute one side's accumulator from scratch. `check_accumulator_range` keeps the int16 sums exact."""
+        features = board_features(board, perspective)
+        accumulator: npt.NDArray[np.int16] = self.feature_bias + self.feature_weights[features].sum(axis=0, dtype=np.int16)
+        return accumulator
+
+    def new_accumulator(self, board: chess.Board) -> npt.NDArray[np.int16]:
+        """Compute both accumulators, indexed by [int(color)], from scratch."""
+        accumulator = np.empty((len(chess.COLORS), self.accumulator_size), dtype=np.int16)
+        for perspective in chess.COLORS:
+            accumulator[int(perspective)] = self.refresh(board, perspective)
+        return accumulator
+
+    def update(self, accumulator: npt.NDArray[np.int16], board: chess.Board, removed: Iterable[PieceChange],
+               added: Iterable[PieceChange], skip: Optional[chess.Color] = None) -> npt.NDArray[np.int16]:
+        """
+        Get the accumulators after a move as a new array, leaving the old one for unmaking the move.
+
+        :param board: The board before the move, used for the king squares.
+        :param removed: The pieces taken off the board by the move, kings excluded.
+        :param added: The pieces put on the board by the move, kings excluded.
+        :param skip: A side whose king moved. Its accumulator has to be refreshed after the move is made.
+        """
+        updated = accumulator.copy()
+        for perspective in chess.COLORS:
+            king_square = board.king(perspective)
+            if perspective == skip or king_square is None:
+                continue
+            row = updated[int(perspective)]
+            for color, piece_type, square in removed:
+                row -= self.feature_weights[feature_index(perspective, king_square, color, piece_type, square)]
+            for color, piece_type, square in added:
+                row += self.feature_weights[feature_index(perspective, king_square, color, piece_type, square)]
+        return updated
+
+    def evaluate(self, accumulator: npt.NDArray[np.int16], turn: chess.Color) -> float:
+        """Get the score of the position in pawns from white's point of view."""
+        inputs = np.clip(accumulator[[int(turn), int(not turn)]].reshape(-1), 0, ACTIVATION_SCALE)
+        hidden = np.clip(inputs @ self.hidden_weights / ACTIVATION_SCALE + self.hidden_bias, 0.0, 1.0)
+        score = float(hidden @ self.output_weights) + self.output_bias
+        return score if turn == chess.WHITE else -score
+
+
+def load_network(network_path: str) -> Network:
+    """Memory-map a network file. Each file is mapped once per process and reused afterwards."""
+    network_path = os.path.abspath(network_path)
+    if network_path not in _networks:
+        _networks[network_path] = Network(network_path)
+    return _networks[network_path]
+
+
+def write_network(network_path: str, feature_weights: npt.NDArray[np.int16], feature_bias: npt.NDArray[np.int16],
+                  hidden_weights: npt.NDArray[np.float32], hidden_bias: npt.NDArray[np.float32],
+                  output_weights: npt.NDArray[np.float32], output_bias: float) -> None:
+    """Write the network weights in the format that `Network` memory-maps."""
+    accumulator_size, hidden_size = feature_bias.shape[0], hidden_bias.shape[0]
+    expected_shapes = [(NUM_FEATURES, accumulator_size), (accumulator_size,), (2 * accumulator_size, hidden_size),
+                       (hidden_size,), (hidden_size,)]
+    arrays: list[npt.NDArray[Any]] = [feature_weights, feature_bias, hidden_weights, hidden_bias, output_weights]
+    for values, shape in zip(arrays, expected_shapes):
+        if values.shape != shape:
+            raise ValueError(f"Expected weights of shape {shape}, got {values.shape}.")
+    check_accumulator_range(feature_weights, feature_bias)
+    with open(network_path, "wb") as network_file:
+        network_file.write(HEADER.pack(NETWORK_MAGIC, NETWORK_VERSION, NUM_FEATURES, accumulator_size, hidden_size))
+        network_file.write(feature_weights.astype("<i2").tobytes())
+        network_file.write(feature_bias.astype("<i2").tobytes())
+        for values in arrays[2:]:
+            network_file.write(values.astype("<f4").tobytes())
+        network_file.write(np.array([output_bias], dtype="<f4").tobytes())
+
+
+def random_network(network_path: str, accumulator_size: int = 64, hidden_size: int = 32, seed: int = 0) -> None:
+    """Write a network with small random weights, for tests and benchmarks."""
+    rng = np.random.default_rng(seed)
+    write_network(network_path,
+                  rng.integers(-8, 9, (NUM_FEATURES, accumulator_size), dtype=np.int16),
+                  rng.integers(0, 64, accumulator_size, dtype=np.int16),
+                  rng.normal(0, 0.1, (2 * accumulator_size, hidden_size)).astype(np.float32),
+                  rng.normal(0, 0.1, hidden_size).astype(np.float32),
+                  rng.normal(0, 0.5, hidden_size).astype(np.float32),
+                  0.0)
+
+
+def benchmark(network_path: str, depth: int = 3) -> None:
+    """Print the search speed with the activity tables and with a network."""
+    import time
+    import tempfile
+    from lib.config import Configuration
+    from lib.types import OPTIONS_GO_EGTB_TYPE
+    from engines.maydan_engine import MaydanEngine
+    fens = [chess.STARTING_FEN,
+            "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+            "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if not network_path:
+            network_path = os.path.join(temp_dir, "random.nnue")
+            random_network(network_path)
+        table_options: OPTIONS_GO_EGTB_TYPE = {"EvalHash": 0}
+        network_options: OPTIONS_GO_EGTB_TYPE = {"EvalHash": 0, "EvalFile": network_path}
+        for name, options in (("activity tables", table_options), ("network", network_options)):
+            engine = MaydanEngine([], options, None, Configuration({}))
+            nodes, seconds = 0, 0.0
+            for fen in fens:
+                start = time.perf_counter()
+                board = chess.Board(fen)
+                engine.find_best_move(board, depth, board.turn)
+                seconds += time.perf_counter() - start
+                nodes += MaydanEngine.num_evaluated_nodes
+            print(f"{name}: {nodes} nodes in {seconds:.2f} s, {nodes / seconds:.0f} nps")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "")
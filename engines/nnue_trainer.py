@@ -0,0 +1,296 @@
+"""
+Train MaydanEngine's evaluation network on the CPU with NumPy.
+
+Training data is a text file with one position per line: `FEN;score;result`. The score is in pawns
+and the result is 1, 0.5 or 0, both from white's point of view. A directory of shards written by
+`engines.datagen` can be used instead. The data is read in chunks, so it can be larger than memory.
+Each chunk is turned into sparse features with NumPy, shuffled and trained on in mini-batches.
+The trained weights are written in the format that `engines.nnue` memory-maps.
+
+Train a network with: python -m engines.nnue_trainer data.txt network.nnue
+"""
+import argparse
+import os
+import time
+import chess
+import numpy as np
+import numpy.typing as npt
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Optional
+from engines import datagen, nnue
+
+PIECE_CODES = {symbol: code for code, symbol in enumerate(datagen.SYMBOLS)}
+MAX_FEATURES = nnue.MAX_FEATURES
+PADDING = nnue.NUM_FEATURES  # Index of an all-zero row used to pad positions with fewer than MAX_FEATURES pieces.
+SCORE_SCALE = 4.0  # Pawns. A score of SCORE_SCALE is mapped to a win probability of about 73%.
+
+FloatArray = npt.NDArray[np.float32]
+IndexArray = npt.NDArray[np.int64]
+
+
+@dataclass
+class Chunk:
+    """
+    Positions read from a data file.
+
+    `pieces` has one row per position with a piece code per square (0 for empty, 1-6 for white pawn to
+    king and 7-12 for black pawn to king). `score` and `result` are from white's point of view.
+    """
+
+    pieces: npt.NDArray[np.int8]
+    white_to_move: npt.NDArray[np.bool_]
+    score: FloatArray
+    result: FloatArray
+
+    def __len__(self) -> int:
+        """Get the number of positions."""
+        return len(self.pieces)
+
+
+def parse_placement(placement: str) -> list[int]:
+    """Convert the piece placement field of a FEN to piece codes indexed by square."""
+    codes = [0] * 64
+    for rank_index, rank in enumerate(placement.split("/")):
+        square = (7 - rank_index) * 8
+        for symbol in rank:
+            if symbol.isdigit():
+                square += int(symbol)
+            else:
+                codes[square] = PIECE_CODES[symbol]
+                square += 1
+    return codes
+
+
+def read_text_chunks(data_path: str, chunk_size: int) -> Iterator[Chunk]:
+    """Read a `FEN;score;result` file `chunk_size` lines at a time."""
+    def make_chunk(lines: list[str]) -> Chunk:
+        pieces, white_to_move, score, result = [], [], [], []
+        for line in lines:
+            fen, position_score, position_result = line.rsplit(";", 2)
+            fields = fen.split()
+            pieces.append(parse_placement(fields[0]))
+            white_to_move.append(len(fields) < 2 or fields[1] == "w")
+            score.append(float(position_score))
+            result.append(float(position_result))
+        return Chunk(np.array(pieces, dtype=np.int8), np.array(white_to_move), np.array(score, dtype=np.float32),
+                     np.array(result, dtype=np.float32))
+
+    with open(data_path) as data_file:
+        lines: list[str] = []
+        for line in data_file:
+            if line.strip():
+                lines.append(line.strip())
+            if len(lines) == chunk_size:
+                yield make_chunk(lines)
+                lines = []
+        if lines:
+            yield make_chunk(lines)
+
+
+def read_shard_chunks(directory: str, chunk_size: int) -> Iterator[Chunk]:
+    """Read the shards written by `engines.datagen` in a directory `chunk_size` positions at a time."""
+    for path in datagen.shard_paths(directory):
+        records = datagen.load_shard(path)
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            score = (chunk["score"] / 100).astype(np.float32)
+            result = ((chunk["result"] + 1) / 2).astype(np.float32)
+            yield Chunk(datagen.unpack_pieces(chunk), (chunk["flags"] & datagen.FLAG_WHITE_TO_MOVE) != 0, score, result)
+
+
+def chunk_features(pieces: npt.NDArray[np.int8], perspective: chess.Color) -> IndexArray:
+    """
+    Compute the input features of many positions from one side's point of view.
+
+    :return: An array of shape (positions, MAX_FEATURES) with the same indices as `nnue.board_features`,
+        padded with PADDING.
+    """
+    codes = pieces.astype(np.int64)
+    squares = np.arange(64)
+    piece_type = (codes - 1) % 6 + 1
+    is_white = (codes >= 1) & (codes <= 6)
+    own_king_code = 6 if perspective == chess.WHITE else 12
+    king_square = np.argmax(codes == own_king_code, axis=1)
+    flip = 0 if perspective == chess.WHITE else 56
+    kind = (piece_type - 1) * 2 + (is_white != (perspective == chess.WHITE))
+    indices = ((king_square[:, None] ^ flip) * nnue.PIECE_KINDS + kind) * 64 + (squares[None, :] ^ flip)
+    is_feature = (codes != 0) & (piece_type != chess.KING)
+    indices = np.where(is_feature, indices, PADDING)
+    return np.sort(indices, axis=1)[:, :MAX_FEATURES]
+
+
+class Trainer:
+    """A float32 copy of the network with its gradients and optimizer state."""
+
+    def __init__(self, accumulator_size: int = 64, hidden_size: int = 32, optimizer: str = "adam",
+                 learning_rate: float = 1e-3, result_weight: float = 0.5, seed: int = 0) -> None:
+        """
+        Initialize the network with small random weights.
+
+        The first layer is kept in activation units, where 1 is `nnue.ACTIVATION_SCALE` in the engine's
+        int16 accumulator, and is rounded to that grid when the network is written.
+
+        :param optimizer: "adam" or "sgd".
+        :param result_weight: How much the game result counts in the target versus the score.
+        """
+        if optimizer not in ("adam", "sgd"):
+            raise ValueError(f"Unknown optimizer {optimizer}. Expected adam or sgd.")
+        rng = np.random.default_rng(seed)
+        self.optimizer = optimizer
+        self.learning_rate = learning_rate
+        self.result_weight = result_weight
+        # The extra last row stays zero. It is the PADDING feature.
+        self.params: dict[str, FloatArray] = {
+            "feature_weights": np.vstack([rng.normal(0, 0.02, (nnue.NUM_FEATURES, accumulator_size)),
+                                          np.zeros((1, accumulator_size))]).astype(np.float32),
+            "feature_bias": np.full(accumulator_size, 0.25, dtype=np.float32),
+            "hidden_weights": rng.normal(0, 1 / np.sqrt(2 * accumulator_size),
+                                         (2 * accumulator_size, hidden_size)).astype(np.float32),
+            "hidden_bias": np.zeros(hidden_size, dtype=np.float32),
+            "output_weights": rng.normal(0, 1 / np.sqrt(hidden_size), hidden_size).astype(np.float32),
+            "output_bias": np.zeros(1, dtype=np.float32),
+        }
+        self.moments = {name: np.zeros_like(values) for name, values in self.params.items()}
+        self.velocities = {name: np.zeros_like(values) for name, values in self.params.items()}
+        self.steps = 0
+
+    def forward(self, own_features: IndexArray, other_features: IndexArray) -> tuple[FloatArray, dict[str, Any]]:
+        """Compute the scores in pawns for the side to move, and the values needed by `backward`."""
+        p = self.params
+        own = p["feature_bias"] + p["feature_weights"][own_features].sum(axis=1)
+        other = p["feature_bias"] + p["feature_weights"][other_features].sum(axis=1)
+        accumulated = np.concatenate([own, other], axis=1)
+        inputs = np.clip(accumulated, 0.0, 1.0)
+        hidden_sum = inputs @ p["hidden_weights"] + p["hidden_bias"]
+        hidden = np.clip(hidden_sum, 0.0, 1.0)
+        scores = hidden @ p["output_weights"] + p["output_bias"][0]
+        return scores, {"accumulated": accumulated, "inputs": inputs, "hidden_sum": hidden_sum, "hidden": hidden}
+
+    def targets(self, chunk_score: FloatArray, chunk_result: FloatArray, white_to_move: npt.NDArray[np.bool_]) -> FloatArray:
+        """Blend the scores and results into win probabilities for the side to move."""
+        sign = np.where(white_to_move, 1.0, -1.0).astype(np.float32)
+        result = np.where(white_to_move, chunk_result, 1.0 - chunk_result)
+        score_probability = 1.0 / (1.0 + np.exp(-sign * chunk_score / SCORE_SCALE))
+        target: FloatArray = ((1.0 - self.result_weight) * score_probability + self.result_weight * result).astype(np.float32)
+        return target
+
+    def step(self, own_features: IndexArray, other_features: IndexArray, target: FloatArray) -> float:
+        """Train on one mini-batch and get its mean squared error in win probability."""
+        p = self.params
+        scores, cache = self.forward(own_features, other_features)
+        probability = 1.0 / (1.0 + np.exp(-scores / SCORE_SCALE))
+        error = probability - target
+        loss = float(np.mean(error ** 2))
+
+        d_scores = 2.0 * error * probability * (1.0 - probability) / SCORE_SCALE / len(target)
+        grads: dict[str, FloatArray] = {
+            "output_weights": cache["hidden"].T @ d_scores,
+            "output_bias": np.array([d_scores.sum()], dtype=np.float32),
+        }
+        d_hidden = d_scores[:, None] * p["output_weights"][None, :]
+        d_hidden *= (cache["hidden_sum"] > 0.0) & (cache["hidden_sum"] < 1.0)
+        grads["hidden_weights"] = cache["inputs"].T @ d_hidden
+        grads["hidden_bias"] = d_hidden.sum(axis=0)
+        d_inputs = d_hidden @ p["hidden_weights"].T
+        d_inputs *= (cache["accumulated"] > 0.0) & (cache["accumulated"] < 1.0)
+        accumulator_size = p["feature_bias"].shape[0]
+        d_own, d_other = d_inputs[:, :accumulator_size], d_inputs[:, accumulator_size:]
+        grads["feature_bias"] = d_own.sum(axis=0) + d_other.sum(axis=0)
+
+        # The first layer gradient is sparse: only the rows of features in the batch are non-zero.
+        features = np.concatenate([own_features.reshape(-1), other_features.reshape(-1)])
+        rows, inverse = np.unique(features, return_inverse=True)
+        row_grads = np.zeros((len(rows), accumulator_size), dtype=np.float32)
+        feature_grads = np.concatenate([np.repeat(d_own, own_features.shape[1], axis=0),
+                                        np.repeat(d_other, other_features.shape[1], axis=0)])
+        np.add.at(row_grads, inverse, feature_grads)
+        keep = rows != PADDING
+
+        self.steps += 1
+        self._update("feature_weights", row_grads[keep], rows[keep])
+        for name, grad in grads.items():
+            self._update(name, grad.astype(np.float32), slice(None))
+        return loss
+
+    def _update(self, name: str, grad: FloatArray, index: Any) -> None:
+        if self.optimizer == "sgd":
+            self.params[name][index] -= self.learning_rate * grad
+            return
+        beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+        moment = beta1 * self.moments[name][index] + (1 - beta1) * grad
+        velocity = beta2 * self.velocities[name][index] + (1 - beta2) * grad ** 2
+        self.moments[name][index] = moment
+        self.velocities[name][index] = velocity
+        corrected_moment = moment / (1 - beta1 ** self.steps)
+        corrected_velocity = velocity / (1 - beta2 ** self.steps)
+        self.params[name][index] -= self.learning_rate * corrected_moment / (np.sqrt(corrected_velocity) + epsilon)
+
+    def quantized_first_layer(self) -> tuple[npt.NDArray[np.int16], npt.NDArray[np.int16]]:
+        """Round the first layer to the engine's int16 accumulator units, keeping every sum in range."""
+        scale = nnue.ACTIVATION_SCALE
+        bias = np.clip(np.round(self.params["feature_bias"] * scale), -8192, 8192)
+        limit = (np.iinfo(np.int16).max - np.abs(bias).max()) // MAX_FEATURES
+        weights = np.clip(np.round(self.params["feature_weights"][:nnue.NUM_FEATURES] * scale), -limit, limit)
+        return weights.astype(np.int16), bias.astype(np.int16)
+
+    def write(self, network_path: str) -> None:
+        """Write the network in the format that `nnue.Network` memory-maps."""
+        feature_weights, feature_bias = self.quantized_first_layer()
+        p = self.params
+        nnue.write_network(network_path, feature_weights, feature_bias, p["hidden_weights"], p["hidden_bias"],
+                           p["output_weights"], float(p["output_bias"][0]))
+
+
+def train(data_path: str, network_path: str, epochs: int = 1, batch_size: int = 1024, chunk_size: int = 65536,
+          trainer: Optional[Trainer] = None, seed: int = 0) -> Trainer:
+    """
+    Train a network on a data file and write it to `network_path`.
+
+    The data is streamed from disk once per epoch, so only one chunk is in memory at a time.
+    Positions are shuffled within each chunk.
+    """
+    trainer = trainer or Trainer(seed=seed)
+    rng = np.random.default_rng(seed)
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        positions, total_loss, batches = 0, 0.0, 0
+        read_chunks = read_shard_chunks if os.path.isdir(data_path) else read_text_chunks
+        for chunk in read_chunks(data_path, chunk_size):
+            white_features = chunk_features(chunk.pieces, chess.WHITE)
+            black_features = chunk_features(chunk.pieces, chess.BLACK)
+            own = np.where(chunk.white_to_move[:, None], white_features, black_features)
+            other = np.where(chunk.white_to_move[:, None], black_features, white_features)
+            target = trainer.targets(chunk.score, chunk.result, chunk.white_to_move)
+            order = rng.permutation(len(chunk))
+            for batch_start in range(0, len(chunk), batch_size):
+                batch = order[batch_start:batch_start + batch_size]
+                total_loss += trainer.step(own[batch], other[batch], target[batch])
+                batches += 1
+            positions += len(chunk)
+        seconds = time.perf_counter() - start
+        print(f"Epoch {epoch}: loss {total_loss / max(batches, 1):.5f}, {positions} positions in {seconds:.1f} s, "
+              f"{positions / seconds:.0f} positions/s")
+    trainer.write(network_path)
+    return trainer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train MaydanEngine's evaluation network.")
+    parser.add_argument("data", help="A file with one FEN;score;result line per position, or a directory of shards "
+                                     "from engines.datagen.")
+    parser.add_argument("network", help="Where to write the trained network.")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--chunk-size", type=int, default=65536, help="Positions read from disk at a time.")
+    parser.add_argument("--optimizer", choices=["adam", "sgd"], default="adam")
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--result-weight", type=float, default=0.5, help="Weight of the game result in the target.")
+    parser.add_argument("--accumulator-size", type=int, default=64)
+    parser.add_argument("--hidden-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    train(args.data, args.network, args.epochs, args.batch_size, args.chunk_size,
+          Trainer(args.accumulator_size, args.hidden_size, args.optimizer, args.learning_rate, args.result_weight,
+                  args.seed),
+          args.seed)
@@ -0,0 +1,171 @@
+"""
+Count the leaf nodes of the move tree (perft) to check and time move generation.
+
+Every board class that the search uses has to give the same counts as `chess.Board`. The suite has positions
+with known counts, including en passant, castling and promotion edge cases, and can be run with each board class
+to compare their speed. The root moves can be split across processes.
+
+Count the nodes of a position with: python -m engines.perft "FEN" depth [--divide] [--processes N] [--board search]
+Run the suite with: python -m engines.perft --suite [--max-nodes N]
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+import chess
+from dataclasses import dataclass
+from typing import Optional
+from engines.maydan_engine import SearchBoard
+
+BOARD_TYPES: dict[str, type[chess.Board]] = {"chess": chess.Board, "search": SearchBoard}
+
+
+@dataclass
+class PerftPosition:
+    """A position with known perft counts."""
+
+    name: str
+    fen: str
+    nodes: dict[int, int]  # The number of leaf nodes at each depth.
+
+
+PERFT_SUITE = [
+    PerftPosition("Start position", chess.STARTING_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    PerftPosition("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                  {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    PerftPosition("Rook endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    PerftPosition("Promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    PerftPosition("Promotion to a checked square", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  {1: 44, 2: 1486, 3: 62379}),
+    PerftPosition("Illegal en passant capture", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", {6: 1134888}),
+    PerftPosition("Pinned en passant capture", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", {6: 1015133}),
+    PerftPosition("En passant capture gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {6: 1440467}),
+    PerftPosition("Short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", {6: 661072}),
+    PerftPosition("Long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", {6: 803711}),
+    PerftPosition("Castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", {4: 1274206}),
+    PerftPosition("Castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", {4: 1720476}),
+    PerftPosition("Promotion out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", {6: 3821001}),
+    PerftPosition("Discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", {5: 1004658}),
+    PerftPosition("Promotion gives check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", {6: 217342}),
+    PerftPosition("Underpromotion gives check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", {6: 92683}),
+    PerftPosition("Self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", {6: 2217}),
+    PerftPosition("Stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", {7: 567584}),
+    PerftPosition("Stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+]
+
+
+def perft(board: chess.Board, depth: int) -> int:
+    """Count the leaf nodes `depth` plies below `board`. The last ply is counted without making the moves."""
+    if depth <= 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def make_board(fen: str, board_type: str = "chess") -> chess.Board:
+    """Set up a position on one of the `BOARD_TYPES`."""
+    return BOARD_TYPES[board_type](fen)
+
+
+def _perft_after(fen: str, move: str, depth: int, board_type: str) -> int:
+    """Count the leaf nodes below a root move. This runs in the worker processes."""
+    board = make_board(fen, board_type)
+    board.push(chess.Move.from_uci(move))
+    return perft(board, depth - 1)
+
+
+def divide(fen: str, depth: int, board_type: str = "chess", processes: int = 1) -> dict[chess.Move, int]:
+    """
+    Count the leaf nodes below each root move.
+
+    :param processes: The number of processes to split the root moves across. With 1, everything runs in this process.
+    """
+    board = make_board(fen, board_type)
+    moves = list(board.legal_moves)
+    tasks = [(fen, move.uci(), depth, board_type) for move in moves]
+    if processes > 1 and len(moves) > 1:
+        with multiprocessing.Pool(min(processes, len(moves))) as pool:
+            counts = pool.starmap(_perft_after, tasks)
+    else:
+        counts = [_perft_after(*task) for task in tasks]
+    return dict(zip(moves, counts))
+
+
+def timed_perft(fen: str, depth: int, board_type: str = "chess", processes: int = 1) -> tuple[int, float]:
+    """Count the leaf nodes below a position and the seconds it took."""
+    start = time.perf_counter()
+    nodes = sum(divide(fen, depth, board_type, processes).values()) if depth > 0 else 1
+    return nodes, time.perf_counter() - start
+
+
+def run_suite(board_types: Optional[list[str]] = None, max_nodes: int = 1_000_000, processes: int = 1) -> list[str]:
+    """
+    Check the counts of the suite with each board type and print the speed of each.
+
+    :param max_nodes: Depths with more leaf nodes than this are skipped.
+    :return: The wrong counts found.
+    """
+    errors = []
+    for board_type in board_types or list(BOARD_TYPES):
+        total_nodes = 0
+        total_seconds = 0.0
+        for position in PERFT_SUITE:
+            for depth, expected in sorted(position.nodes.items()):
+                if expected > max_nodes:
+                    continue
+                nodes, seconds = timed_perft(position.fen, depth, board_type, processes)
+                total_nodes += nodes
+                total_seconds += seconds
+                if nodes != expected:
+                    errors.append(f"{board_type}: {position.name} depth {depth} has {nodes} nodes, not {expected}.")
+        print(f"{board_type}: {total_nodes} nodes in {total_seconds:.2f} s, {nodes_per_second(total_nodes, total_seconds)}")
+    return errors
+
+
+def nodes_per_second(nodes: int, seconds: float) -> str:
+    """Format the speed of a perft run."""
+    return f"{nodes / seconds:.0f} nodes/s" if seconds > 0 else "- nodes/s"
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run perft from the command line. The exit code is 1 if a suite count is wrong."""
+    parser = argparse.ArgumentParser(description="Count the move tree below a position to check move generation.")
+    parser.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    parser.add_argument("depth", nargs="?", type=int, default=4)
+    parser.add_argument("--board", choices=[*BOARD_TYPES, "all"], default="chess",
+                        help="The board class to generate moves with. 'all' compares them.")
+    parser.add_argument("--divide", action="store_true", help="Print the count below each root move.")
+    parser.add_argument("--processes", type=int, default=1, help="Split the root moves across this many processes.")
+    parser.add_argument("--suite", action="store_true", help="Check the counts of the built-in positions.")
+    parser.add_argument("--max-nodes", type=int, default=1_000_000, help="The largest suite count to check.")
+    args = parser.parse_args(argv)
+    board_types = list(BOARD_TYPES) if args.board == "all" else [args.board]
+
+    if args.suite:
+        errors = run_suite(board_types, args.max_nodes, args.processes)
+        for error in errors:
+            print(error)
+        return 1 if errors else 0
+
+    for board_type in board_types:
+        start = time.perf_counter()
+        counts = divide(args.fen, args.depth, board_type, args.processes)
+        seconds = time.perf_counter() - start
+        if args.divide:
+            for move, count in counts.items():
+                print(f"{move.uci()}: {count}")
+        nodes = sum(counts.values())
+        print(f"{board_type}: {nodes} nodes in {seconds:.2f} s, {nodes_per_second(nodes, seconds)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
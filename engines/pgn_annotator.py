@@ -0,0 +1,189 @@
+"""
+Annotate stored games with an engine's evaluation and principal variation of every position.
+
+The games saved in `pgn_directory` only have evaluations for the moves the bot searched itself. This tool reads PGN
+files one game at a time and has the engine from a bot config analyse the position before every move that has no
+evaluation yet. The annotations are laid out like the bot's: the principal variation is added as a variation from
+the position, with the evaluation and depth at its end.
+
+Games are annotated in worker processes, each with one engine for all its games, and are written in input order
+through `chess.pgn.StringExporter` to a file with the same name in the output directory. Games that are already in
+that file are skipped, so running the tool again only annotates the games added since.
+
+Annotate games with: python -m engines.pgn_annotator games/ annotated/ --config config.yml --depth 8 --processes 4
+"""
+import argparse
+import collections
+import io
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+import chess
+import chess.engine
+import chess.pgn
+from collections.abc import Iterator
+from typing import Optional
+from lib.config import Configuration, load_config
+from lib.engine_wrapper import EngineWrapper, create_engine
+from engines.batch_analysis import engine_info, start_worker_engine, worker_engine
+
+AnnotationTask = tuple[str, str, chess.engine.Limit, str]  # Output path, PGN, budget per position, annotator name.
+
+
+def pgn_paths(inputs: list[str]) -> list[str]:
+    """Get the PGN files given directly or found in the given directories."""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".pgn")))
+        else:
+            paths.append(path)
+    return paths
+
+
+def game_key(headers: chess.pgn.Headers) -> str:
+    """Identify a game by its headers, leaving out the one this tool adds."""
+    return "\n".join(f"{name}: {value}" for name, value in headers.items() if name != "Annotator")
+
+
+def annotated_keys(path: str) -> set[str]:
+    """Get the keys of the games already written to an output file."""
+    keys: set[str] = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path) as file:
+        while (headers := chess.pgn.read_headers(file)) is not None:
+            keys.add(game_key(headers))
+    return keys
+
+
+def is_annotated(node: chess.pgn.ChildNode) -> bool:
+    """Check whether the bot already wrote its analysis of the position before a move."""
+    return node.eval() is not None or len(node.parent.variations) > 1
+
+
+def annotate_game(engine: EngineWrapper, game: chess.pgn.Game, limit: chess.engine.Limit) -> int:
+    """
+    Analyse the position before every move of the main line that has no analysis yet.
+
+    :return: The number of positions analysed.
+    """
+    analysed = 0
+    for node in list(game.mainline()):
+        if is_annotated(node):
+            continue
+        info = engine_info(engine, node.parent.board(), limit)
+        analysed += 1
+        if "score" not in info:
+            continue
+        pv = info.get("pv", [])
+        pv_node = node.parent.add_line(pv) if pv else node
+        pv_node.set_eval(info["score"], info.get("depth"))
+    return analysed
+
+
+def annotate_pgn(engine: EngineWrapper, task: AnnotationTask) -> tuple[str, str, int]:
+    """
+    Annotate one game given as PGN text.
+
+    :return: The output path, the annotated PGN and the number of positions analysed.
+    """
+    output_path, pgn, limit, annotator = task
+    game = chess.pgn.read_game(io.StringIO(pgn)) or chess.pgn.Game()
+    analysed = annotate_game(engine, game, limit)
+    game.headers["Annotator"] = annotator
+    return output_path, game.accept(chess.pgn.StringExporter()), analysed
+
+
+def _annotate_pgn(task: AnnotationTask) -> tuple[str, str, int]:
+    """Annotate one game with the worker's engine. This runs in the worker processes."""
+    return annotate_pgn(worker_engine(), task)
+
+
+def annotated_games(tasks: Iterator[AnnotationTask], config: Configuration,
+                    processes: int = 1) -> Iterator[tuple[str, str, int]]:
+    """
+    Annotate games, yielding them in the order of the tasks as soon as they are ready.
+
+    Only a few games per worker are read ahead, so archives larger than memory can be annotated.
+    """
+    if processes <= 1:
+        with create_engine(config) as engine:
+            for task in tasks:
+                yield annotate_pgn(engine, task)
+        return
+    pool = multiprocessing.Pool(processes, initializer=start_worker_engine, initargs=(config,))
+    try:
+        running = collections.deque(pool.apply_async(_annotate_pgn, (task,))
+                                    for task in itertools.islice(tasks, 2 * processes))
+        while running:
+            yield running.popleft().get()
+            running.extend(pool.apply_async(_annotate_pgn, (task,)) for task in itertools.islice(tasks, 1))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def run(inputs: list[str], output_directory: str, config: Configuration, limit: chess.engine.Limit,
+        processes: int = 1) -> int:
+    """
+    Annotate the games of PGN files that are not in the output directory yet.
+
+    :return: The number of games annotated.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    skipped = 0
+
+    def tasks() -> Iterator[AnnotationTask]:
+        nonlocal skipped
+        for path in pgn_paths(inputs):
+            output_path = os.path.join(output_directory, os.path.basename(path))
+            if os.path.abspath(output_path) == os.path.abspath(path):
+                raise ValueError(f"Annotating {path} would overwrite it. Choose another output directory.")
+            done = annotated_keys(output_path)
+            with open(path) as file:
+                while (game := chess.pgn.read_game(file)) is not None:
+                    if game_key(game.headers) in done:
+                        skipped += 1
+                    else:
+                        yield output_path, str(game), limit, config.engine.name
+
+    start = time.perf_counter()
+    games = positions = 0
+    for output_path, pgn, analysed in annotated_games(tasks(), config, processes):
+        with open(output_path, "a") as file:
+            file.write(pgn + "\n\n")
+        games += 1
+        positions += analysed
+    seconds = time.perf_counter() - start
+    print(f"Annotated {games} games ({positions} positions) in {seconds:.1f} s, "
+          f"{positions / seconds if seconds else 0:.1f} positions/s. Skipped {skipped} games annotated before.")
+    return games
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Annotate games from the command line."""
+    parser = argparse.ArgumentParser(description="Annotate PGN files with an engine's evaluations.")
+    parser.add_argument("inputs", nargs="+", help="PGN files or directories of PGN files, like the pgn_directory.")
+    parser.add_argument("output", help="The directory to write the annotated files to.")
+    parser.add_argument("--config", default="config.yml", help="The bot config that sets the engine.")
+    parser.add_argument("--time", type=float, help="Seconds per position.")
+    parser.add_argument("--nodes", type=int, help="Nodes per position.")
+    parser.add_argument("--depth", type=int, help="Search depth per position.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="The number of engines to run.")
+    args = parser.parse_args(argv)
+    if args.time is None and args.nodes is None and args.depth is None:
+        parser.error("Set a budget with --time, --nodes or --depth.")
+
+    run(args.inputs, args.output, load_config(args.config),
+        chess.engine.Limit(time=args.time, nodes=args.nodes, depth=args.depth), args.processes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Replay the searches captured in real games with any engine build.
+
+With the `capture` section of the config enabled, the bot appends the inputs of each search to a JSONL file. This tool
+runs every captured search again with the engine from a bot config: the same position and move history, time limit,
+draw offer and root moves. Pondering is left off, so each search ends with its own move. The time and nodes of each
+search are compared with the captured ones, which turns slow moves from real games into regression benchmarks.
+
+Searches run one at a time, so their times are not disturbed by each other.
+
+Replay searches with: python -m engines.replay captures/searches.jsonl --config config.yml --min-seconds 5
+"""
+import argparse
+import csv
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+from lib.config import Configuration, load_config
+from lib.engine_wrapper import EngineWrapper, create_engine
+from lib.search_capture import CapturedSearch, config_hash, read_captures
+
+
+@dataclass
+class ReplayResult:
+    """A captured search and the same search run again."""
+
+    game_id: str
+    ply: int
+    captured_move: Optional[str]
+    move: Optional[str]
+    captured_seconds: float
+    seconds: float
+    captured_nodes: Optional[int]
+    nodes: Optional[int]
+
+    @property
+    def time_change(self) -> Optional[float]:
+        """Get the relative change of the search time, or None if the captured search took no time."""
+        return self.seconds / self.captured_seconds - 1 if self.captured_seconds > 0 else None
+
+    @property
+    def node_change(self) -> Optional[int]:
+        """Get the change of the number of nodes, if both searches reported them."""
+        return self.nodes - self.captured_nodes if self.nodes is not None and self.captured_nodes is not None else None
+
+    def describe(self) -> str:
+        """Describe the differences in one line."""
+        move = self.move if self.move == self.captured_move else f"{self.captured_move} -> {self.move}"
+        time_change = f" ({self.time_change:+.0%})" if self.time_change is not None else ""
+        nodes = f", nodes {self.captured_nodes} -> {self.nodes}" if self.node_change is not None else ""
+        return (f"{self.game_id} ply {self.ply}: {move}, "
+                f"{self.captured_seconds:.3f} s -> {self.seconds:.3f} s{time_change}{nodes}")
+
+
+def replay_search(engine: EngineWrapper, search: CapturedSearch) -> ReplayResult:
+    """Run one captured search again."""
+    board = search.board()
+    start = time.perf_counter()
+    result = engine.search(board, search.time_limit(), False, search.draw_offered, search.root_move_list())
+    seconds = time.perf_counter() - start
+    return ReplayResult(search.game_id, search.ply, search.move, result.move.uci() if result.move else None,
+                        search.seconds, round(seconds, 4), search.nodes, result.info.get("nodes"))
+
+
+def replay(searches: list[CapturedSearch], config: Configuration) -> list[ReplayResult]:
+    """
+    Run captured searches again with one engine, printing each comparison as it is made.
+
+    :param config: The bot's config, which sets the engine and its options.
+    """
+    different = sum(search.config_hash != config_hash(config.engine) for search in searches)
+    if different:
+        print(f"{different} of {len(searches)} searches were captured with a different engine config.")
+    results = []
+    with create_engine(config) as engine:
+        for search in searches:
+            results.append(replay_search(engine, search))
+            print(results[-1].describe())
+    return results
+
+
+def write_csv(results: list[ReplayResult], path: str) -> None:
+    """Write the comparisons with one row per search."""
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(ReplayResult.__dataclass_fields__))
+        writer.writeheader()
+        writer.writerows(asdict(result) for result in results)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Replay captured searches from the command line."""
+    parser = argparse.ArgumentParser(description="Replay captured searches and compare their time and nodes.")
+    parser.add_argument("captures", help="A capture file written by the bot.")
+    parser.add_argument("--config", default="config.yml", help="The bot config that sets the engine to replay with.")
+    parser.add_argument("--game", help="Only replay the searches of this game.")
+    parser.add_argument("--min-seconds", type=float, default=0, help="Only replay searches that took this long.")
+    parser.add_argument("--csv", help="Where to write the comparisons as CSV.")
+    args = parser.parse_args(argv)
+
+    searches = [search for search in read_captures(args.captures)
+                if search.seconds >= args.min_seconds and (args.game is None or search.game_id == args.game)]
+    results = replay(searches, load_config(args.config))
+    captured = sum(result.captured_seconds for result in results)
+    replayed = sum(result.seconds for result in results)
+    changed = sum(result.move != result.captured_move for result in results)
+    print(f"Replayed {len(results)} searches: {captured:.2f} s captured, {replayed:.2f} s now. "
+          f"{changed} played a different move.")
+    if args.csv:
+        write_csv(results, args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
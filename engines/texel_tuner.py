@@ -0,0 +1,270 @@
+"""
+Tune MaydanEngine's piece values and activity tables on game results (Texel tuning).
+
+The evaluation is linear in the tables, so every position is turned once into sparse features: one per piece,
+pointing at the table entry that the piece reads. The tuner then minimizes the squared error between each game's
+result and the win probability `1 / (1 + 10 ** (-scale * eval / 400))` of the position's evaluation in centipawns,
+with full-batch gradient descent (Adam) over the whole data set. Every step is a few NumPy passes over the features,
+so millions of positions take minutes on a CPU.
+
+Only quiet positions are used: positions from `engines.datagen` shards are skipped when the side to move is in check
+or the engine's move was a capture or promotion. A `FEN;score;result` text file, as read by `engines.nnue_trainer`,
+is used as it is.
+
+The material values are tuned together with the tables, as an amount added to every square of a piece's tables.
+The engine counts material with its own fixed values, so the difference between the tuned and the engine's values is
+folded into the exported tables, which evaluate exactly like the tuned weights. The tables are written as the `.npy`
+files of `activity_tables/` together with a bundle the engine can load.
+
+Tune the tables with: python -m engines.texel_tuner data/ --epochs 500 --output engines/activity_tables
+"""
+import argparse
+import math
+import os
+import sys
+import time
+import chess
+import numpy as np
+import numpy.typing as npt
+from dataclasses import dataclass
+from typing import Optional, cast
+from engines import datagen, eval_tables, nnue_trainer
+from engines.maydan_engine import PHASE_WEIGHTS, TOTAL_PHASE, MaydanEngine
+
+NUM_PIECE_TYPES = len(chess.PIECE_TYPES)
+NUM_WEIGHTS = NUM_PIECE_TYPES * 64  # One table entry per piece type and square, in the row order of the `.npy` files.
+CHUNK_SIZE = 1 << 20  # Positions turned into features at a time.
+
+FloatArray = npt.NDArray[np.float64]
+# Table weights of shape (phase, piece_type - 1, 64), indexed like a flattened `.npy` table: rank 8 comes first.
+Weights = npt.NDArray[np.float64]
+
+
+@dataclass
+class Features:
+    """
+    The sparse features of many positions, stored row by row.
+
+    The features of position `i` are `columns[offsets[i]:offsets[i + 1]]`. A column below NUM_WEIGHTS adds a table
+    entry for a white piece and a column `NUM_WEIGHTS + j` subtracts entry `j` for a black piece.
+    """
+
+    offsets: npt.NDArray[np.int64]
+    columns: npt.NDArray[np.intp]  # NumPy gathers and counts fastest with native indices.
+    middlegame: FloatArray  # The weight of the middlegame tables in each position, between 0 and 1.
+    result: FloatArray  # 1 if white won, 0.5 for a draw and 0 if black won.
+
+    def __len__(self) -> int:
+        """Get the number of positions."""
+        return len(self.result)
+
+
+def piece_features(pieces: npt.NDArray[np.int8]) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.int64], FloatArray]:
+    """
+    Compute the features of many positions given as piece codes per square (see `engines.nnue_trainer.Chunk`).
+
+    :return: The feature columns in position order, the number of features of each position and the weight of the
+        middlegame tables in each position.
+    """
+    rows, squares = np.nonzero(pieces)
+    codes = pieces[rows, squares].astype(np.int64)
+    piece_index = (codes - 1) % NUM_PIECE_TYPES
+    is_white = codes <= NUM_PIECE_TYPES
+    # White reads its tables upside down (rank 1 is the last row), black reads them as they are and is negated.
+    columns = np.where(is_white, piece_index * 64 + (squares ^ 56), NUM_WEIGHTS + piece_index * 64 + squares)
+    counts = np.bincount(rows, minlength=len(pieces))
+    phase = np.bincount(rows, weights=np.take(PHASE_WEIGHTS, piece_index + 1), minlength=len(pieces))
+    return columns.astype(np.intp), counts.astype(np.int64), np.minimum(phase, TOTAL_PHASE) / TOTAL_PHASE
+
+
+def read_positions(data_path: str, chunk_size: int = CHUNK_SIZE) -> Features:
+    """Read the quiet positions of a directory of shards or a `FEN;score;result` file and compute their features."""
+    columns, counts, middlegame, result = [], [], [], []
+    if os.path.isdir(data_path):
+        for path in datagen.shard_paths(data_path):
+            records = datagen.load_shard(path)
+            for start in range(0, len(records), chunk_size):
+                chunk = records[start:start + chunk_size]
+                chunk = chunk[(chunk["flags"] & (datagen.FLAG_IN_CHECK | datagen.FLAG_NOISY)) == 0]
+                chunk_columns, chunk_counts, chunk_middlegame = piece_features(datagen.unpack_pieces(chunk))
+                columns.append(chunk_columns)
+                counts.append(chunk_counts)
+                middlegame.append(chunk_middlegame)
+                result.append((chunk["result"] + 1) / 2)
+    else:
+        for text_chunk in nnue_trainer.read_text_chunks(data_path, chunk_size):
+            chunk_columns, chunk_counts, chunk_middlegame = piece_features(text_chunk.pieces)
+            columns.append(chunk_columns)
+            counts.append(chunk_counts)
+            middlegame.append(chunk_middlegame)
+            result.append(text_chunk.result.astype(np.float64))
+    all_counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(all_counts)]).astype(np.int64)
+    return Features(offsets, np.concatenate(columns) if columns else np.zeros(0, dtype=np.intp),
+                    np.concatenate(middlegame) if middlegame else np.zeros(0),
+                    np.concatenate(result) if result else np.zeros(0))
+
+
+def load_weights(table_dir: str = eval_tables.TABLE_DIR) -> tuple[Weights, FloatArray]:
+    """
+    Get the engine's current weights as a starting point.
+
+    :return: The tables of `table_dir` and the engine's piece values in centipawns, indexed by piece_type - 1.
+    """
+    tables = np.zeros((len(eval_tables.PHASE_FILE_SUFFIXES), NUM_PIECE_TYPES, 64))
+    for phase, suffix in eval_tables.PHASE_FILE_SUFFIXES.items():
+        for piece_type, name in eval_tables.PIECE_NAMES.items():
+            table = np.load(os.path.join(table_dir, f"{name}{suffix}_activity_table.npy"))
+            tables[phase, piece_type - 1] = table.reshape(64)
+    return tables, engine_piece_values()
+
+
+def engine_piece_values() -> FloatArray:
+    """Get the piece values that the engine counts material with, in centipawns, indexed by piece_type - 1."""
+    return np.array([100 * MaydanEngine.piece_value[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.float64)
+
+
+def evaluate(features: Features, tables: Weights, piece_values: FloatArray) -> FloatArray:
+    """Get the evaluation of every position in centipawns from white's point of view."""
+    entries = (tables + piece_values[np.newaxis, :, np.newaxis]).reshape(len(tables), NUM_WEIGHTS)
+    # Both phases are summed in one pass, as the real and imaginary parts of complex numbers,
+    # because one gather of 8-byte values is much faster than two gathers or a gather of rows.
+    phases = (entries[eval_tables.MIDDLEGAME] + 1j * entries[eval_tables.ENDGAME]).astype(np.complex64)
+    sums = np.add.reduceat(np.take(np.concatenate([phases, -phases]), features.columns), features.offsets[:-1])
+    result: FloatArray = features.middlegame * sums.real + (1 - features.middlegame) * sums.imag
+    return result
+
+
+def win_probability(evaluation: FloatArray, scale: float) -> FloatArray:
+    """Map evaluations in centipawns to expected scores."""
+    probability: FloatArray = 1 / (1 + np.power(10.0, -scale * evaluation / 400))
+    return probability
+
+
+def loss(features: Features, evaluation: FloatArray, scale: float) -> float:
+    """Get the mean squared error between the results and the expected scores."""
+    return float(np.mean((features.result - win_probability(evaluation, scale)) ** 2))
+
+
+def fit_scale(features: Features, evaluation: FloatArray, low: float = 0.05, high: float = 10.0,
+              iterations: int = 40) -> float:
+    """Find the scale that maps the evaluations best to the results, by golden-section search."""
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(iterations):
+        left, right = high - ratio * (high - low), low + ratio * (high - low)
+        if loss(features, evaluation, left) < loss(features, evaluation, right):
+            high = right
+        else:
+            low = left
+    return (low + high) / 2
+
+
+def gradients(features: Features, tables: Weights, piece_values: FloatArray,
+              scale: float) -> tuple[float, Weights, FloatArray]:
+    """
+    Get the loss and its gradients with respect to the tables and the piece values.
+
+    :return: The loss, the gradient of the tables and the gradient of the piece values.
+    """
+    evaluation = evaluate(features, tables, piece_values)
+    probability = win_probability(evaluation, scale)
+    error = probability - features.result
+    slope = 2 * error * probability * (1 - probability) * math.log(10) * scale / 400 / len(features)
+    counts = np.diff(features.offsets)
+
+    def column_sums(weights: FloatArray) -> FloatArray:
+        # With weights, the counts are floats.
+        per_column = cast(FloatArray, np.bincount(features.columns, weights=np.repeat(weights, counts),
+                                                  minlength=2 * NUM_WEIGHTS))
+        signed: FloatArray = per_column[:NUM_WEIGHTS] - per_column[NUM_WEIGHTS:]
+        return signed.reshape(NUM_PIECE_TYPES, 64)
+
+    table_gradient = np.empty_like(tables)
+    table_gradient[eval_tables.MIDDLEGAME] = column_sums(slope * features.middlegame)
+    table_gradient[eval_tables.ENDGAME] = column_sums(slope) - table_gradient[eval_tables.MIDDLEGAME]
+    piece_value_gradient: FloatArray = table_gradient.sum(axis=(0, 2))
+    return float(np.mean(error ** 2)), table_gradient, piece_value_gradient
+
+
+def tune(features: Features, tables: Weights, piece_values: FloatArray, scale: float, epochs: int = 500,
+         learning_rate: float = 1.0, report_every: int = 50) -> tuple[Weights, FloatArray]:
+    """
+    Minimize the loss with Adam, using every position in every step.
+
+    :param learning_rate: About the most a weight changes in one step, in centipawns.
+    :return: The tuned tables and piece values.
+    """
+    tables, piece_values = tables.copy(), piece_values.copy()
+    moments = [(np.zeros_like(tables), np.zeros_like(tables)), (np.zeros_like(piece_values), np.zeros_like(piece_values))]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-12
+    for epoch in range(1, epochs + 1):
+        epoch_loss, table_gradient, piece_value_gradient = gradients(features, tables, piece_values, scale)
+        for weights, gradient, (mean, square) in zip((tables, piece_values), (table_gradient, piece_value_gradient),
+                                                     moments):
+            mean *= beta1
+            mean += (1 - beta1) * gradient
+            square *= beta2
+            square += (1 - beta2) * gradient ** 2
+            weights -= learning_rate * (mean / (1 - beta1 ** epoch)) / (np.sqrt(square / (1 - beta2 ** epoch)) + epsilon)
+        piece_values[chess.KING - 1] = 0  # Both sides always have a king, so its value does not matter.
+        if report_every and (epoch % report_every == 0 or epoch == 1):
+            print(f"Epoch {epoch}: loss {epoch_loss:.6f}")
+    return tables, piece_values
+
+
+def export_tables(tables: Weights, piece_values: FloatArray) -> npt.NDArray[np.int32]:
+    """
+    Fold the difference between the tuned piece values and the engine's into the tables and round them.
+
+    :return: Integer tables of shape (phase, piece_type - 1, 8, 8), laid out like the `.npy` files.
+    """
+    offsets = piece_values - engine_piece_values()
+    exported = np.rint(tables + offsets[np.newaxis, :, np.newaxis]).astype(np.int32)
+    return exported.reshape(len(tables), NUM_PIECE_TYPES, 8, 8)
+
+
+def write_tables(tables: npt.NDArray[np.int32], table_dir: str) -> str:
+    """
+    Save exported tables as `.npy` files in `table_dir` and pack them into a bundle there.
+
+    :return: The path of the bundle.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    for phase, suffix in eval_tables.PHASE_FILE_SUFFIXES.items():
+        for piece_type, name in eval_tables.PIECE_NAMES.items():
+            np.save(os.path.join(table_dir, f"{name}{suffix}_activity_table.npy"), tables[phase, piece_type - 1])
+    bundle_path = os.path.join(table_dir, os.path.basename(eval_tables.BUNDLE_PATH))
+    eval_tables.write_bundle(eval_tables.pack_tables(table_dir), bundle_path)
+    return bundle_path
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Tune the tables from the command line."""
+    parser = argparse.ArgumentParser(description="Tune MaydanEngine's piece values and activity tables.")
+    parser.add_argument("data", help="A directory of engines.datagen shards or a FEN;score;result file.")
+    parser.add_argument("--output", default=eval_tables.TABLE_DIR, help="Where to write the tables and the bundle.")
+    parser.add_argument("--tables", default=eval_tables.TABLE_DIR, help="The tables to start from.")
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--learning-rate", type=float, default=1.0, help="In centipawns.")
+    parser.add_argument("--scale", type=float, help="The evaluation scale. By default, it is fitted to the data.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    features = read_positions(args.data)
+    if not len(features):
+        parser.error(f"There are no quiet positions in {args.data}.")
+    print(f"Read {len(features)} positions in {time.perf_counter() - start:.1f} s")
+    tables, piece_values = load_weights(args.tables)
+    scale = args.scale or fit_scale(features, evaluate(features, tables, piece_values))
+    print(f"Scale {scale:.3f}, starting loss {loss(features, evaluate(features, tables, piece_values), scale):.6f}")
+    tables, piece_values = tune(features, tables, piece_values, scale, args.epochs, args.learning_rate)
+    values = ", ".join(f"{chess.piece_name(piece_type)} {piece_values[piece_type - 1] / 100:.2f}"
+                       for piece_type in chess.PIECE_TYPES[:-1])
+    print(f"Tuned piece values: {values}")
+    bundle_path = write_tables(export_tables(tables, piece_values), args.output)
+    print(f"Wrote {bundle_path} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Play two engine configurations against each other to measure the difference in strength.
+
+Both engines are set up from bot config files with `create_engine`, so any homemade, UCI or XBoard engine can play.
+Each opening is played twice, with each engine as white once. Games are played with real clocks in a pool of
+worker processes and every game is saved as a PGN file. After each game, the Elo difference is estimated with a 95%
+confidence interval, and a sequential probability ratio test (SPRT) stops the match as soon as it can tell whether
+the first engine is at least `elo1` stronger than the second (H1) or no stronger than `elo0` (H0).
+
+Run a match with: python -m engines.tournament new.yml old.yml --openings openings.epd --time 10 --increment 0.1
+"""
+import argparse
+import datetime
+import itertools
+import math
+import multiprocessing
+import os
+import sys
+import time
+import chess
+import chess.engine
+import chess.pgn
+from dataclasses import dataclass
+from typing import Optional
+from lib.config import Configuration, load_config
+from lib.engine_wrapper import EngineWrapper, create_engine
+
+MAX_PLIES = 400  # Longer games are adjudicated as draws.
+
+
+@dataclass
+class TimeControl:
+    """The clock of each player."""
+
+    base: float  # Seconds.
+    increment: float  # Seconds.
+
+
+@dataclass
+class GameResult:
+    """The result of one game, from the point of view of the first engine."""
+
+    round: int
+    opening: str
+    first_engine_white: bool
+    result: str  # "1-0", "0-1" or "1/2-1/2".
+    termination: str
+    plies: int
+
+    @property
+    def score(self) -> float:
+        """Get the first engine's score: 1 for a win, 0.5 for a draw and 0 for a loss."""
+        if self.result == "1/2-1/2":
+            return 0.5
+        return 1.0 if (self.result == "1-0") == self.first_engine_white else 0.0
+
+
+@dataclass
+class MatchScore:
+    """The wins, draws and losses of the first engine."""
+
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    @property
+    def games(self) -> int:
+        """Get the number of games played."""
+        return self.wins + self.draws + self.losses
+
+    def add(self, result: GameResult) -> None:
+        """Count the result of a game."""
+        if result.score == 1:
+            self.wins += 1
+        elif result.score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def mean_and_variance(self) -> tuple[float, float]:
+        """Get the mean score per game and the variance of the score of one game."""
+        mean = (self.wins + 0.5 * self.draws) / self.games
+        variance = (self.wins * (1 - mean) ** 2 + self.draws * (0.5 - mean) ** 2 + self.losses * mean ** 2) / self.games
+        return mean, variance
+
+    def elo(self) -> tuple[float, float]:
+        """
+        Estimate the Elo difference between the engines.
+
+        :return: The estimate and the half width of its 95% confidence interval. Both are infinite if one engine
+            scored every point.
+        """
+        mean, variance = self.mean_and_variance()
+        if mean in (0, 1):
+            return elo_difference(mean), math.inf
+        margin = 1.96 * math.sqrt(variance / self.games)
+        low, high = elo_difference(mean - margin), elo_difference(mean + margin)
+        return elo_difference(mean), (high - low) / 2
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        """Get the log-likelihood ratio of H1 (the difference is `elo1`) against H0 (the difference is `elo0`)."""
+        if self.games == 0:
+            return 0.0
+        mean, variance = self.mean_and_variance()
+        if variance == 0:
+            return 0.0
+        score0, score1 = expected_score(elo0), expected_score(elo1)
+        return (score1 - score0) * (2 * mean - score0 - score1) * self.games / (2 * variance)
+
+
+def expected_score(elo: float) -> float:
+    """Get the expected score per game of a player `elo` points stronger than their opponent."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score: float) -> float:
+    """Get the Elo difference that gives an expected score of `score`."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def sprt_bounds(alpha: float, beta: float) -> tuple[float, float]:
+    """Get the log-likelihood ratios at which H0 and H1 are accepted."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def read_openings(path: Optional[str]) -> list[str]:
+    """Read the opening positions from a file with one FEN or EPD per line. Without a file, only the start position is used."""
+    if path is None:
+        return [chess.STARTING_FEN]
+    openings = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                try:
+                    board = chess.Board(line)
+                except ValueError:
+                    board, _ = chess.Board.from_epd(line)
+                openings.append(board.fen())
+    return openings
+
+
+def engine_move(engine: EngineWrapper, board: chess.Board, clocks: dict[chess.Color, float],
+                time_control: TimeControl) -> tuple[Optional[chess.Move], float]:
+    """Ask an engine for a move and return it with the time it took."""
+    limit = chess.engine.Limit(white_clock=clocks[chess.WHITE], black_clock=clocks[chess.BLACK],
+                               white_inc=time_control.increment, black_inc=time_control.increment)
+    start = time.perf_counter()
+    result = engine.search(board.copy(), limit, False, False, chess.engine.PlayResult(None, None))
+    return result.move, time.perf_counter() - start
+
+
+def play_game(round_number: int, opening: str, first_engine_white: bool, configs: tuple[Configuration, Configuration],
+              time_control: TimeControl, pgn_directory: Optional[str], max_plies: int = MAX_PLIES) -> GameResult:
+    """Play one game between new instances of the engines. This runs in the worker processes."""
+    white_config, black_config = configs if first_engine_white else configs[::-1]
+    board = chess.Board(opening)
+    last_ply = board.ply() + max_plies
+    clocks = {chess.WHITE: time_control.base, chess.BLACK: time_control.base}
+    result, termination = "1/2-1/2", "adjudication"
+    with create_engine(white_config) as white, create_engine(black_config) as black:
+        engines = {chess.WHITE: white, chess.BLACK: black}
+        while True:
+            outcome = board.outcome(claim_draw=True)
+            if outcome:
+                result, termination = outcome.result(), outcome.termination.name.lower()
+                break
+            if board.ply() >= last_ply:
+                break
+            mover = board.turn
+            move, seconds = engine_move(engines[mover], board, clocks, time_control)
+            clocks[mover] -= seconds
+            if clocks[mover] < 0:
+                termination = "time forfeit"
+                result = "1/2-1/2" if board.has_insufficient_material(not mover) else ("0-1" if mover else "1-0")
+                break
+            if move is None or move not in board.legal_moves:
+                result, termination = ("0-1" if mover else "1-0"), "illegal move"
+                break
+            clocks[mover] += time_control.increment
+            board.push(move)
+
+    game_result = GameResult(round_number, opening, first_engine_white, result, termination,
+                             len(board.move_stack))
+    if pgn_directory:
+        write_pgn(board, game_result, (white_config.engine.name, black_config.engine.name), time_control, pgn_directory)
+    return game_result
+
+
+def write_pgn(board: chess.Board, result: GameResult, names: tuple[str, str], time_control: TimeControl,
+              pgn_directory: str) -> None:
+    """Save a game as round<number>.pgn."""
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Engine match"
+    game.headers["Date"] = datetime.date.today().strftime("%Y.%m.%d")
+    game.headers["Round"] = str(result.round)
+    game.headers["White"], game.headers["Black"] = names
+    game.headers["Result"] = result.result
+    game.headers["Termination"] = result.termination
+    game.headers["TimeControl"] = f"{time_control.base:g}+{time_control.increment:g}"
+    os.makedirs(pgn_directory, exist_ok=True)
+    with open(os.path.join(pgn_directory, f"round{result.round}.pgn"), "w") as file:
+        print(game, file=file)
+
+
+def run_match(configs: tuple[Configuration, Configuration], openings: list[str], time_control: TimeControl,
+              rounds: int, processes: int = 1, pgn_directory: Optional[str] = None, elo0: float = 0,
+              elo1: float = 5, alpha: float = 0.05, beta: float = 0.05, max_plies: int = MAX_PLIES) -> MatchScore:
+    """
+    Play up to `rounds` game pairs, stopping early when the SPRT accepts a hypothesis.
+
+    :param configs: The bot configs of the first and second engine.
+    :param openings: The start positions, used in turn. Each is played once with each engine as white.
+    :param processes: The number of games to play at a time.
+    :return: The score of the first engine.
+    """
+    tasks = iter([(game_number + 1, openings[(game_number // 2) % len(openings)], game_number % 2 == 0, configs,
+                   time_control, pgn_directory, max_plies) for game_number in range(2 * rounds)])
+    lower, upper = sprt_bounds(alpha, beta)
+    score = MatchScore()
+    with multiprocessing.Pool(processes) as pool:
+        running = [pool.apply_async(play_game, task) for task in itertools.islice(tasks, processes)]
+        while running:
+            result = running.pop(0).get()
+            score.add(result)
+            elo, margin = score.elo()
+            llr = score.llr(elo0, elo1)
+            print(f"Game {result.round}: {result.result} ({result.termination}). "
+                  f"Score {score.wins}-{score.losses}-{score.draws}, Elo {elo:.1f} +/- {margin:.1f}, "
+                  f"LLR {llr:.2f} [{lower:.2f}, {upper:.2f}]")
+            if llr <= lower or llr >= upper:
+                print(f"SPRT accepted {'H1' if llr >= upper else 'H0'} after {score.games} games.")
+                # Let the games in progress finish, so that their engines are shut down properly. They are not counted.
+                for game in running:
+                    game.wait()
+                break
+            running.extend(pool.apply_async(play_game, task) for task in itertools.islice(tasks, 1))
+    return score
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run a match from the command line."""
+    parser = argparse.ArgumentParser(description="Play two engines against each other and test the Elo difference.")
+    parser.add_argument("first", help="The bot config of the first engine, usually the new version.")
+    parser.add_argument("second", help="The bot config of the second engine, usually the old version.")
+    parser.add_argument("--openings", help="A file with one FEN or EPD per line.")
+    parser.add_argument("--time", type=float, default=10, help="Seconds on each clock at the start of a game.")
+    parser.add_argument("--increment", type=float, default=0.1, help="Seconds added to a clock after each move.")
+    parser.add_argument("--rounds", type=int, default=1000, help="The most game pairs to play.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="The number of games at a time.")
+    parser.add_argument("--pgn-directory", help="Where to save the games.")
+    parser.add_argument("--elo0", type=float, default=0, help="The Elo difference of the null hypothesis.")
+    parser.add_argument("--elo1", type=float, default=5, help="The Elo difference of the alternative hypothesis.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="The chance of accepting H1 when H0 is true.")
+    parser.add_argument("--beta", type=float, default=0.05, help="The chance of accepting H0 when H1 is true.")
+    args = parser.parse_args(argv)
+
+    configs = (load_config(args.first), load_config(args.second))
+    score = run_match(configs, read_openings(args.openings), TimeControl(args.time, args.increment), args.rounds,
+                      args.processes, args.pgn_directory, args.elo0, args.elo1, args.alpha, args.beta)
+    if score.games:
+        elo, margin = score.elo()
+        print(f"Final score {score.wins}-{score.losses}-{score.draws} in {score.games} games, Elo {elo:.1f} +/- {margin:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
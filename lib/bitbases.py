@@ -0,0 +1,581 @@
+"""
+Endgame bitbases built by retrograde analysis.
+
+A bitbase stores the win/draw/loss result of every position of one endgame (e.g. KRK) in two bit planes:
+one for positions won by the side to move and one for positions it loses. They are generated once with NumPy
+and memory-mapped for O(1) probes by MaydanEngine and by `engine_wrapper.get_egtb_move`.
+
+The 50-move rule is ignored, so the results match Syzygy's WDL tables without cursed wins or blessed losses.
+
+Generate and validate the bitbases with: python -m lib.bitbases [directory] [endgame ...]
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import chess
+import numpy as np
+import numpy.typing as npt
+from collections.abc import Iterator
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+BITBASE_MAGIC = b"MDBITBAS"
+BITBASE_VERSION = 1
+HEADER = struct.Struct("<8sH8sQ14x")  # magic, version, endgame name, positions; padded to 40 bytes
+
+ENDGAMES = ["KPK", "KRK", "KQK", "KBNK", "KRKP"]
+MAX_PIECES = 4
+DEFAULT_DIRECTORY = os.path.join("engines", "bitbases")
+CHUNK_SIZE = 1 << 20  # Positions handled by one NumPy operation during generation.
+
+WIN, DRAW, LOSS = 1, 0, -1  # Results for the side to move.
+RESULT_TO_WDL = {WIN: 2, DRAW: 0, LOSS: -2}
+INSUFFICIENT_MATERIAL = {"KK", "KBK", "KNK", "KKB", "KKN"}
+PROMOTIONS = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]
+PIECE_ORDER = "KQRBNP"
+PIECE_VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+
+Piece = tuple[chess.Color, chess.PieceType]
+IndexArray = npt.NDArray[np.int64]
+SquareArray = npt.NDArray[np.int64]
+BitboardArray = npt.NDArray[np.uint64]
+ResultArray = npt.NDArray[np.int8]
+
+
+def _bitboard_table(bitboards: list[int]) -> BitboardArray:
+    return np.array(bitboards, dtype=np.uint64)
+
+
+SQUARE_BB = _bitboard_table([chess.BB_SQUARES[square] for square in chess.SQUARES])
+BETWEEN = np.array([[chess.between(a, b) for b in chess.SQUARES] for a in chess.SQUARES], dtype=np.uint64)
+EMPTY_BOARD_ATTACKS = {
+    chess.KNIGHT: _bitboard_table(list(chess.BB_KNIGHT_ATTACKS)),
+    chess.BISHOP: _bitboard_table([chess.BB_DIAG_ATTACKS[square][0] for square in chess.SQUARES]),
+    chess.ROOK: _bitboard_table([chess.BB_RANK_ATTACKS[square][0] | chess.BB_FILE_ATTACKS[square][0]
+                                 for square in chess.SQUARES]),
+    chess.QUEEN: _bitboard_table([chess.BB_DIAG_ATTACKS[square][0] | chess.BB_RANK_ATTACKS[square][0]
+                                  | chess.BB_FILE_ATTACKS[square][0] for square in chess.SQUARES]),
+    chess.KING: _bitboard_table(list(chess.BB_KING_ATTACKS)),
+}
+PAWN_ATTACKS = {color: _bitboard_table(list(chess.BB_PAWN_ATTACKS[color])) for color in chess.COLORS}
+SLIDERS = {chess.BISHOP, chess.ROOK, chess.QUEEN}
+
+
+def _target_table(piece_type: chess.PieceType) -> npt.NDArray[np.int64]:
+    """List the squares a piece attacks on an empty board, padded with -1."""
+    targets = [list(chess.SquareSet(int(bitboard))) for bitboard in EMPTY_BOARD_ATTACKS[piece_type]]
+    table = np.full((64, max(map(len, targets))), -1, dtype=np.int64)
+    for square, squares in enumerate(targets):
+        table[square, :len(squares)] = squares
+    return table
+
+
+TARGETS = {piece_type: _target_table(piece_type) for piece_type in EMPTY_BOARD_ATTACKS}
+
+
+def material_name(pieces: list[Piece]) -> str:
+    """Get the name of an endgame, like KRKP, with white's pieces first."""
+    def side(color: chess.Color) -> str:
+        symbols = [chess.piece_symbol(piece_type).upper() for piece_color, piece_type in pieces if piece_color == color]
+        return "".join(sorted(symbols, key=PIECE_ORDER.index))
+    return side(chess.WHITE) + side(chess.BLACK)
+
+
+def canonical_name(name: str) -> tuple[str, bool]:
+    """
+    Get the name under which an endgame is stored. The stronger side is always white.
+
+    :return: The stored name, and whether the colors are swapped compared to `name`.
+    """
+    black_king = name.index("K", 1)
+    white, black = name[:black_king], name[black_king:]
+
+    def strength(side: str) -> tuple[int, list[int]]:
+        return sum(PIECE_VALUES[symbol] for symbol in side), [-PIECE_ORDER.index(symbol) for symbol in side]
+
+    if strength(black) > strength(white):
+        return black + white, True
+    return name, False
+
+
+class Endgame:
+    """
+    The positions of one endgame and their indices.
+
+    The index of a position is `turn * 64**n + sum(square_k * 64**(n - 1 - k))`, where the n pieces are
+    white's king and pieces in name order followed by black's, and turn is `int(board.turn)`.
+    Impossible positions, like overlapping pieces, have indices too and are stored as draws.
+    """
+
+    def __init__(self, name: str) -> None:
+        """:param name: The endgame's name, like KRKP. White's pieces come first."""
+        self.name = name
+        black_king = name.index("K", 1)
+        self.pieces: list[Piece] = [(chess.WHITE if index < black_king else chess.BLACK,
+                                     chess.PIECE_SYMBOLS.index(symbol.lower())) for index, symbol in enumerate(name)]
+        self.weights = [64 ** (len(self.pieces) - 1 - slot) for slot in range(len(self.pieces))]
+        self.positions_per_turn = 64 ** len(self.pieces)
+        self.size = 2 * self.positions_per_turn
+
+    def decode(self, indices: IndexArray) -> list[SquareArray]:
+        """Get the square of each piece from position indices."""
+        return [(indices // weight) % 64 for weight in self.weights]
+
+    def encode(self, squares: list[SquareArray], turn: chess.Color) -> IndexArray:
+        """Get the indices of positions from the square of each piece."""
+        indices = np.full(len(squares[0]), int(turn) * self.positions_per_turn, dtype=np.int64)
+        for weight, piece_squares in zip(self.weights, squares):
+            indices += piece_squares * weight
+        return indices
+
+    def index(self, board: chess.Board, swapped: bool) -> int:
+        """
+        Get the index of a position on a board.
+
+        :param swapped: Whether the board has the colors swapped compared to this endgame.
+        """
+        flip = 56 if swapped else 0
+        index = int(board.turn != swapped) * self.positions_per_turn
+        for weight, (color, piece_type) in zip(self.weights, self.pieces):
+            index += (chess.lsb(board.pieces_mask(piece_type, color != swapped)) ^ flip) * weight
+        return int(index)
+
+    def board(self, index: int) -> chess.Board:
+        """Set up the position with an index on a board."""
+        board = chess.Board(None)
+        for weight, (color, piece_type) in zip(self.weights, self.pieces):
+            board.set_piece_at(index // weight % 64, chess.Piece(piece_type, color))
+        board.turn = index >= self.positions_per_turn
+        return board
+
+
+def occupancy(squares: list[SquareArray]) -> BitboardArray:
+    """Get the bitboard of occupied squares."""
+    occupied = np.zeros(len(squares[0]), dtype=np.uint64)
+    for piece_squares in squares:
+        occupied |= SQUARE_BB[piece_squares]
+    return occupied
+
+
+def attacks(piece: Piece, from_squares: SquareArray, targets: SquareArray, occupied: BitboardArray) -> npt.NDArray[np.bool_]:
+    """Find out whether a piece attacks a target square."""
+    color, piece_type = piece
+    table = PAWN_ATTACKS[color] if piece_type == chess.PAWN else EMPTY_BOARD_ATTACKS[piece_type]
+    hits: npt.NDArray[np.bool_] = (table[from_squares] & SQUARE_BB[targets]) != 0
+    if piece_type in SLIDERS:
+        hits &= (BETWEEN[from_squares, targets] & occupied) == 0
+    return hits
+
+
+def in_check(pieces: list[Piece], squares: list[SquareArray], color: chess.Color,
+             occupied: BitboardArray) -> npt.NDArray[np.bool_]:
+    """Find out whether one side's king is attacked."""
+    king = pieces.index((color, chess.KING))
+    check = np.zeros(len(squares[0]), dtype=bool)
+    for piece, piece_squares in zip(pieces, squares):
+        if piece[0] != color:
+            check |= attacks(piece, piece_squares, squares[king], occupied)
+    return check
+
+
+def legal_positions(pieces: list[Piece], squares: list[SquareArray], turn: chess.Color) -> npt.NDArray[np.bool_]:
+    """Find the possible positions: no shared squares, no pawns on the back ranks, and the side not to move not in check."""
+    legal = np.ones(len(squares[0]), dtype=bool)
+    for slot, (piece, piece_squares) in enumerate(zip(pieces, squares)):
+        for other_squares in squares[slot + 1:]:
+            legal &= piece_squares != other_squares
+        if piece[1] == chess.PAWN:
+            legal &= (piece_squares >= 8) & (piece_squares < 56)
+    return legal & ~in_check(pieces, squares, not turn, occupancy(squares))
+
+
+def _chunks(start: int, stop: int) -> Iterator[IndexArray]:
+    for chunk_start in range(start, stop, CHUNK_SIZE):
+        yield np.arange(chunk_start, min(stop, chunk_start + CHUNK_SIZE), dtype=np.int64)
+
+
+class Bitbase:
+    """The results of one endgame, memory-mapped from a file."""
+
+    def __init__(self, bitbase_path: str) -> None:
+        """:param bitbase_path: A file written by `generate`."""
+        with open(bitbase_path, "rb") as bitbase_file:
+            self._mapping = mmap.mmap(bitbase_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, name, positions = HEADER.unpack_from(self._mapping)
+        self.endgame = Endgame(name.rstrip(b"\0").decode())
+        plane_size = (positions + 7) // 8
+        if (magic != BITBASE_MAGIC or version != BITBASE_VERSION or positions != self.endgame.size
+                or len(self._mapping) != HEADER.size + 2 * plane_size):
+            raise ValueError(f"{bitbase_path} is not a version {BITBASE_VERSION} bitbase.")
+        self._wins = np.frombuffer(self._mapping, dtype=np.uint8, count=plane_size, offset=HEADER.size)
+        self._losses = np.frombuffer(self._mapping, dtype=np.uint8, count=plane_size, offset=HEADER.size + plane_size)
+        self._loss_offset = HEADER.size + plane_size
+
+    def result(self, index: int) -> int:
+        """Get the result of one position for the side to move."""
+        byte, bit = HEADER.size + (index >> 3), 7 - (index & 7)
+        return int(((self._mapping[byte] >> bit) & 1) - ((self._mapping[self._loss_offset + (index >> 3)] >> bit) & 1))
+
+    def results(self, indices: IndexArray) -> ResultArray:
+        """Get the results of many positions for the side to move."""
+        bits = (7 - (indices & 7)).astype(np.uint8)
+        wins = (self._wins[indices >> 3] >> bits) & 1
+        losses = (self._losses[indices >> 3] >> bits) & 1
+        results: ResultArray = wins.astype(np.int8) - losses.astype(np.int8)
+        return results
+
+
+class Bitbases:
+    """All the bitbases in a directory."""
+
+    def __init__(self, directory: str) -> None:
+        """Map every bitbase file in `directory`. A missing directory has no bitbases."""
+        self.tables: dict[str, Bitbase] = {}
+        if os.path.isdir(directory):
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith(".bin"):
+                    bitbase = Bitbase(os.path.join(directory, file_name))
+                    self.tables[bitbase.endgame.name] = bitbase
+
+    def probe_wdl(self, board: chess.Board) -> Optional[int]:
+        """
+        Get the result of a position like `chess.syzygy.Tablebase.probe_wdl`: 2 for a win for the side to move,
+        0 for a draw and -2 for a loss.
+
+        :return: None if the endgame has no bitbase.
+        """
+        if chess.popcount(board.occupied) > MAX_PIECES or board.castling_rights:
+            return None
+        name = material_name([(piece.color, piece.piece_type) for piece in board.piece_map().values()])
+        if name in INSUFFICIENT_MATERIAL:
+            return 0
+        stored_name, swapped = canonical_name(name)
+        bitbase = self.tables.get(stored_name)
+        if bitbase is None:
+            return None
+        return RESULT_TO_WDL[bitbase.result(bitbase.endgame.index(board, swapped))]
+
+    def results(self, pieces: list[Piece], squares: list[SquareArray], turn: chess.Color) -> ResultArray:
+        """
+        Get the results of many positions with the same pieces for the side to move.
+
+        :raises KeyError: If the endgame has no bitbase.
+        """
+        name = material_name(pieces)
+        if name in INSUFFICIENT_MATERIAL:
+            return np.zeros(len(squares[0]), dtype=np.int8)
+        stored_name, swapped = canonical_name(name)
+        bitbase = self.tables[stored_name]
+        flip = 56 if swapped else 0
+        stored_squares = [squares[pieces.index((color != swapped, piece_type))] ^ flip
+                          for color, piece_type in bitbase.endgame.pieces]
+        return bitbase.results(bitbase.endgame.encode(stored_squares, turn != swapped))
+
+
+_bitbases: dict[str, Bitbases] = {}
+
+
+def load_bitbases(directory: str) -> Bitbases:
+    """Map the bitbases in a directory. Each directory is mapped once per process and reused afterwards."""
+    directory = os.path.abspath(directory)
+    if directory not in _bitbases:
+        _bitbases[directory] = Bitbases(directory)
+    return _bitbases[directory]
+
+
+def dependencies(name: str) -> list[str]:
+    """Get the endgames that captures and promotions lead to, as stored names."""
+    endgame = Endgame(name)
+    children = set()
+    for slot, (color, piece_type) in enumerate(endgame.pieces):
+        if piece_type != chess.KING:
+            children.add(material_name(endgame.pieces[:slot] + endgame.pieces[slot + 1:]))
+        if piece_type == chess.PAWN:
+            for promotion in PROMOTIONS:
+                promoted = endgame.pieces[:slot] + [(color, promotion)] + endgame.pieces[slot + 1:]
+                children.add(material_name(promoted))
+                for captured, (captured_color, captured_type) in enumerate(promoted):
+                    if captured_color != color and captured_type != chess.KING:
+                        children.add(material_name(promoted[:captured] + promoted[captured + 1:]))
+    return sorted({canonical_name(child)[0] for child in children} - INSUFFICIENT_MATERIAL)
+
+
+class _Generator:
+    """Retrograde analysis of one endgame."""
+
+    def __init__(self, name: str, bitbases: Bitbases) -> None:
+        self.endgame = Endgame(name)
+        self.pieces = self.endgame.pieces
+        self.bitbases = bitbases
+        size = self.endgame.size
+        self.legal = np.zeros(size, dtype=bool)
+        self.known = np.zeros(size, dtype=bool)
+        self.result = np.zeros(size, dtype=np.int8)
+        self.remaining = np.zeros(size, dtype=np.int8)  # Moves within the endgame that are not known to lose.
+        self.draw_escape = np.zeros(size, dtype=bool)  # Whether a capture or promotion draws.
+
+    def run(self) -> ResultArray:
+        """Solve every position of the endgame."""
+        for turn in chess.COLORS:
+            for indices in self._turn_chunks(turn):
+                self.legal[indices] = legal_positions(self.pieces, self.endgame.decode(indices), turn)
+        for turn in chess.COLORS:
+            for indices in self._turn_chunks(turn):
+                self._count_moves(indices[self.legal[indices]], turn)
+        self.known |= ~self.legal
+
+        frontier = np.flatnonzero(self.legal & self.known & (self.result != DRAW))
+        while len(frontier):
+            new_positions = []
+            for turn in chess.COLORS:
+                turn_frontier = frontier[(frontier >= self.endgame.positions_per_turn) == turn]
+                for start in range(0, len(turn_frontier), CHUNK_SIZE):
+                    new_positions.extend(self._propagate(turn_frontier[start:start + CHUNK_SIZE], turn))
+            frontier = np.concatenate(new_positions) if new_positions else np.zeros(0, dtype=np.int64)
+        return self.result
+
+    def _turn_chunks(self, turn: chess.Color) -> Iterator[IndexArray]:
+        start = int(turn) * self.endgame.positions_per_turn
+        return _chunks(start, start + self.endgame.positions_per_turn)
+
+    def _count_moves(self, indices: IndexArray, turn: chess.Color) -> None:
+        """Count each position's moves within the endgame and score its captures and promotions."""
+        squares = self.endgame.decode(indices)
+        occupied = occupancy(squares)
+        count = np.zeros(len(indices), dtype=np.int8)
+        has_move = np.zeros(len(indices), dtype=bool)
+        wins = np.zeros(len(indices), dtype=bool)
+        draws = np.zeros(len(indices), dtype=bool)
+        for slot, (color, piece_type) in enumerate(self.pieces):
+            if color != turn:
+                continue
+            for to_squares, valid, promotes in self._moves(slot, squares, occupied, turn):
+                captures: list[tuple[Optional[int], npt.NDArray[np.bool_]]]
+                captures = [(other, valid & (squares[other] == to_squares)) for other, (other_color, other_type)
+                            in enumerate(self.pieces) if other_color != turn and other_type != chess.KING]
+                quiet = valid.copy()
+                for _, capture in captures:
+                    quiet &= ~capture
+                if promotes:
+                    captures.append((None, quiet))
+                else:
+                    child = self._child_indices(indices, squares, slot, to_squares, turn)
+                    moved = quiet & self.legal[np.where(quiet, child, 0)]
+                    count += moved
+                    has_move |= moved
+                # Captures and promotions leave the endgame. Their results come from the endgames they lead to.
+                for captured, mask in captures:
+                    if not mask.any():
+                        continue
+                    for new_type in (PROMOTIONS if promotes else [piece_type]):
+                        results, legal = self._exit_results(squares, mask, slot, captured, to_squares, new_type, turn)
+                        has_move[mask] |= legal
+                        wins[mask] |= legal & (results == LOSS)
+                        draws[mask] |= legal & (results == DRAW)
+        self.remaining[indices] = count
+        self.draw_escape[indices] = draws
+        checked = in_check(self.pieces, squares, turn, occupied)
+        no_moves = ~has_move
+        self.result[indices[no_moves & checked]] = LOSS
+        self.result[indices[wins]] = WIN
+        self.result[indices[has_move & ~wins & (count == 0) & ~draws]] = LOSS
+        self.known[indices[no_moves | wins | (has_move & (count == 0) & ~draws)]] = True
+
+    def _moves(self, slot: int, squares: list[SquareArray], occupied: BitboardArray,
+               turn: chess.Color) -> Iterator[tuple[SquareArray, npt.NDArray[np.bool_], bool]]:
+        """
+        Generate the pseudo-legal moves of one piece. Moves onto the piece's own side are excluded.
+
+        :return: The target squares, which positions have the move, and whether the moves are pawn promotions.
+        """
+        color, piece_type = self.pieces[slot]
+        from_squares = squares[slot]
+        own = np.zeros(len(from_squares), dtype=np.uint64)
+        for other, (other_color, _) in enumerate(self.pieces):
+            if other_color == color:
+                own |= SQUARE_BB[squares[other]]
+        if piece_type != chess.PAWN:
+            targets = TARGETS[piece_type][from_squares]
+            for column in range(targets.shape[1]):
+                to_squares = targets[:, column]
+                valid = to_squares >= 0
+                to_squares = np.where(valid, to_squares, 0)
+                valid &= (own & SQUARE_BB[to_squares]) == 0
+                if piece_type in SLIDERS:
+                    valid &= (BETWEEN[from_squares, to_squares] & occupied) == 0
+                yield to_squares, valid, False
+            return
+
+        forward = 8 if color == chess.WHITE else -8
+        last_rank = 7 if color == chess.WHITE else 0
+        start_rank = 1 if color == chess.WHITE else 6
+        one_step = from_squares + forward
+        empty = (occupied & SQUARE_BB[one_step]) == 0
+        promotes = (one_step >> 3) == last_rank
+        yield one_step, empty & ~promotes, False
+        yield one_step, empty & promotes, True
+        two_steps = np.clip(from_squares + 2 * forward, 0, 63)
+        double = empty & ((from_squares >> 3) == start_rank) & ((occupied & SQUARE_BB[two_steps]) == 0)
+        yield two_steps, double, False
+        for other, (other_color, other_type) in enumerate(self.pieces):
+            if other_color != color and other_type != chess.KING:
+                captures = (PAWN_ATTACKS[color][from_squares] & SQUARE_BB[squares[other]]) != 0
+                target_promotes = (squares[other] >> 3) == last_rank
+                yield squares[other], captures & ~target_promotes, False
+                yield squares[other], captures & target_promotes, True
+
+    def _child_indices(self, indices: IndexArray, squares: list[SquareArray], slot: int, to_squares: SquareArray,
+                       turn: chess.Color) -> IndexArray:
+        """Get the indices after one piece moves without capturing."""
+        turn_change = (1 - 2 * int(turn)) * self.endgame.positions_per_turn
+        children: IndexArray = indices + turn_change + (to_squares - squares[slot]) * self.endgame.weights[slot]
+        return children
+
+    def _exit_results(self, squares: list[SquareArray], mask: npt.NDArray[np.bool_], slot: int, captured: Optional[int],
+                      to_squares: SquareArray, piece_type: chess.PieceType,
+                      turn: chess.Color) -> tuple[ResultArray, npt.NDArray[np.bool_]]:
+        """
+        Look up the results of captures and promotions in the bitbases of the endgames they lead to.
+
+        :return: The results for the opponent, and whether each move is legal.
+        """
+        pieces = list(self.pieces)
+        child_squares = [piece_squares[mask] for piece_squares in squares]
+        child_squares[slot] = to_squares[mask]
+        pieces[slot] = (pieces[slot][0], piece_type)
+        if captured is not None:
+            del pieces[captured]
+            del child_squares[captured]
+        legal = legal_positions(pieces, child_squares, not turn)
+        results = np.zeros(len(legal), dtype=np.int8)
+        if legal.any():
+            results[legal] = self.bitbases.results(pieces, [piece_squares[legal] for piece_squares in child_squares],
+                                                   not turn)
+        return results, legal
+
+    def _propagate(self, children: IndexArray, turn: chess.Color) -> list[IndexArray]:
+        """
+        Update the positions that can move to newly solved positions.
+
+        A position that can move to a loss is a win. A position whose every move leads to a win is a loss.
+        :return: The newly solved positions.
+        """
+        results = self.result[children]
+        new_positions = []
+        for child_result in (LOSS, WIN):
+            selected = children[results == child_result]
+            if not len(selected):
+                continue
+            parents = np.concatenate(list(self._parents(selected, turn)))
+            parents = parents[~self.known[parents]]
+            if child_result == LOSS:
+                parents = np.unique(parents)
+                self.result[parents] = WIN
+            else:
+                parents, counts = np.unique(parents, return_counts=True)
+                self.remaining[parents] -= counts.astype(np.int8)
+                parents = parents[(self.remaining[parents] == 0) & ~self.draw_escape[parents]]
+                self.result[parents] = LOSS
+            self.known[parents] = True
+            new_positions.append(parents)
+        return new_positions
+
+    def _parents(self, children: IndexArray, turn: chess.Color) -> Iterator[IndexArray]:
+        """Generate the legal positions that reach the children with a move that is not a capture or promotion."""
+        mover = not turn
+        squares = self.endgame.decode(children)
+        occupied = occupancy(squares)
+        for slot, (color, piece_type) in enumerate(self.pieces):
+            if color != mover:
+                continue
+            to_squares = squares[slot]
+            if piece_type == chess.PAWN:
+                backward = -8 if color == chess.WHITE else 8
+                one_step = to_squares + backward
+                start_rank = 1 if color == chess.WHITE else 6
+                empty = (one_step >= 8) & (one_step < 56)
+                empty &= (occupied & SQUARE_BB[np.clip(one_step, 0, 63)]) == 0
+                two_steps = np.clip(to_squares + 2 * backward, 0, 63)
+                double = empty & ((two_steps >> 3) == start_rank) & ((to_squares + 2 * backward) == two_steps)
+                double &= (occupied & SQUARE_BB[two_steps]) == 0
+                candidates = [(np.clip(one_step, 0, 63), empty), (two_steps, double)]
+            else:
+                targets = TARGETS[piece_type][to_squares]
+                candidates = []
+                for column in range(targets.shape[1]):
+                    from_squares = targets[:, column]
+                    valid = from_squares >= 0
+                    from_squares = np.where(valid, from_squares, 0)
+                    valid &= (occupied & SQUARE_BB[from_squares]) == 0
+                    if piece_type in SLIDERS:
+                        valid &= (BETWEEN[from_squares, to_squares] & occupied) == 0
+                    candidates.append((from_squares, valid))
+            for from_squares, valid in candidates:
+                parents = self._child_indices(children, squares, slot, from_squares, turn)
+                valid &= self.legal[np.where(valid, parents, 0)]
+                yield parents[valid]
+
+
+def generate(name: str, directory: str = DEFAULT_DIRECTORY) -> None:
+    """Generate an endgame's bitbase, and those of the endgames it leads to that are missing, into `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    for dependency in dependencies(name):
+        if not os.path.exists(os.path.join(directory, f"{dependency}.bin")):
+            generate(dependency, directory)
+    _bitbases.pop(os.path.abspath(directory), None)
+    bitbases = load_bitbases(directory)
+    start = time.perf_counter()
+    results = _Generator(name, bitbases).run()
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as bitbase_file:
+        bitbase_file.write(HEADER.pack(BITBASE_MAGIC, BITBASE_VERSION, name.encode(), len(results)))
+        bitbase_file.write(np.packbits(results == WIN).tobytes())
+        bitbase_file.write(np.packbits(results == LOSS).tobytes())
+    _bitbases.pop(os.path.abspath(directory), None)
+    logger.info(f"Generated {name}: {np.count_nonzero(results == WIN)} wins and {np.count_nonzero(results == LOSS)} losses "
+                f"for the side to move in {time.perf_counter() - start:.1f} s")
+
+
+def validate(name: str, directory: str = DEFAULT_DIRECTORY, samples: int = 10000, seed: int = 0) -> None:
+    """
+    Check random positions of a bitbase against python-chess's move generation. Each result has to be
+    checkmate, stalemate, or the best result of the legal moves according to the bitbases.
+
+    :raises ValueError: If a position's result does not match.
+    """
+    bitbases = load_bitbases(directory)
+    endgame = bitbases.tables[name].endgame
+    rng = np.random.default_rng(seed)
+    checked = 0
+    while checked < samples:
+        board = endgame.board(int(rng.integers(endgame.size)))
+        if not board.is_valid():
+            continue
+        checked += 1
+        if board.is_checkmate():
+            expected = -2
+        elif board.is_stalemate() or board.is_insufficient_material():
+            expected = 0
+        else:
+            expected = -2
+            for move in board.legal_moves:
+                board.push(move)
+                child = bitbases.probe_wdl(board)
+                board.pop()
+                if child is None:
+                    raise ValueError(f"There is no bitbase for {board.fen()} after {move}.")
+                expected = max(expected, -child)
+        if bitbases.probe_wdl(board) != expected:
+            raise ValueError(f"{name} gives {bitbases.probe_wdl(board)} for {board.fen()}, but its moves give {expected}.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    target_directory = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DIRECTORY
+    for endgame_name in sys.argv[2:] or ENDGAMES:
+        generate(endgame_name, target_directory)
+        validate(endgame_name, target_directory)
+        logger.info(f"Validated {endgame_name}")
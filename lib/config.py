@@ -165,6 +165,16 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "online_moves", key="max_out_of_book_moves", default=10)
     set_config_default(CONFIG, "engine", "online_moves", key="max_retries", default=2, force_empty_values=True)
     set_config_default(CONFIG, "engine", "online_moves", key="max_depth", default=math.inf, force_empty_values=True)
+    set_config_default(CONFIG, "engine", "online_moves", key="prefetch_replies", default=0)
+    set_config_default(CONFIG, "engine", "online_moves", key="max_wait", default=10)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="path", default="online_cache/responses.sqlite3",
+                       force_empty_values=True)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", key="max_entries", default=100000)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", "ttl_days", key="chessdb", default=7)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", "ttl_days", key="lichess_cloud_analysis", default=7)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", "ttl_days", key="lichess_opening_explorer", default=30)
+    set_config_default(CONFIG, "engine", "online_moves", "cache", "ttl_days", key="lichess_tablebase", default=365)
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="source", default="lichess")
     set_config_default(CONFIG, "engine", "online_moves", "online_egtb", key="min_time", default=20)
@@ -193,6 +203,17 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="max_pieces", default=5)
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="move_quality", default="best")
     set_config_default(CONFIG, "engine", "lichess_bot_tbs", "gaviota", key="min_dtm_to_consider_as_wdl_1", default=120)
+    set_config_default(CONFIG, "engine", "lichess_bot_tbs", "bitbases", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "lichess_bot_tbs", "bitbases", key="paths", default=["engines/bitbases"])
+    set_config_default(CONFIG, "engine", "profiling", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "profiling", key="plies", default=[], force_empty_values=True)
+    change_value_to_list(CONFIG, "engine", "profiling", key="plies")
+    set_config_default(CONFIG, "engine", "profiling", key="min_time", default=0)
+    set_config_default(CONFIG, "engine", "profiling", key="directory", default="profiles", force_empty_values=True)
+    set_config_default(CONFIG, "engine", "profiling", key="top", default=20)
+    set_config_default(CONFIG, "engine", "capture", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "capture", key="path", default="captures/searches.jsonl", force_empty_values=True)
+    set_config_default(CONFIG, "engine", "capture", key="min_time", default=0)
     set_config_default(CONFIG, "engine", "polyglot", key="enabled", default=False)
     set_config_default(CONFIG, "engine", "polyglot", key="max_depth", default=8)
     set_config_default(CONFIG, "engine", "polyglot", key="selection", default="weighted_random")
@@ -292,6 +313,8 @@ def validate_config(CONFIG: CONFIG_DICT_TYPE) -> None:
             online_section = (CONFIG["engine"].get(section) or {}).get(subsection) or {}
             config_assert(online_section.get("move_quality") != "suggest" or not online_section.get("enabled"),
                           f"XBoard engines can't be used with `move_quality` set to `suggest` in {subsection}.")
+        bitbase_section = (CONFIG["engine"].get("lichess_bot_tbs") or {}).get("bitbases") or {}
+        config_assert(not bitbase_section.get("enabled"), "XBoard engines can't be used with bitbases, which suggest moves.")
 
     config_warn(CONFIG["challenge"]["concurrency"] > 0, "With challenge.concurrency set to 0, the bot won't accept or create "
                                                         "any challenges.")
@@ -12,13 +12,18 @@ import datetime
 import time
 import random
 import math
+import concurrent.futures
+import threading
 import test_bot.lichess
 from collections import Counter
 from collections.abc import Callable
-from lib import model, lichess
+from lib import model, lichess, bitbases
+from lib.profiling import SearchProfiler
+from lib.search_capture import append_capture, capture_search
 from lib.config import Configuration, change_value_to_list
 from lib.timer import Timer, msec, seconds, msec_str, sec_str, to_seconds
-from lib.types import (ReadableType, ChessDBMoveType, LichessEGTBMoveType, OPTIONS_GO_EGTB_TYPE, OPTIONS_TYPE,
+from lib.types import (ReadableType, ChessDBMoveType, LichessEGTBMoveType, OnlineType, ONLINE_REQUEST_TYPE,
+                       OPTIONS_GO_EGTB_TYPE, OPTIONS_TYPE,
                        COMMANDS_TYPE, MOVE, InfoStrDict, InfoDictKeys, InfoDictValue, GO_COMMANDS_TYPE, EGTPATH_TYPE,
                        ENGINE_INPUT_ARGS_TYPE, ENGINE_INPUT_KWARGS_TYPE)
 from extra_game_handlers import game_specific_options
@@ -66,6 +71,10 @@ def create_engine(engine_config: Configuration, game: Optional[model.Game] = Non
         raise ValueError(
             f"    Invalid engine type: {engine_type}. Expected xboard, uci, or homemade.")
     options = remove_managed_options(cfg.lookup(f"{engine_type}_options") or Configuration({}))
+    if engine_type == "homemade" and cfg.lichess_bot_tbs and cfg.lichess_bot_tbs.syzygy.enabled:
+        # Let homemade engines probe the same tablebases inside their search.
+        syzygy_cfg = cfg.lichess_bot_tbs.syzygy
+        options = {"SyzygyPath": os.pathsep.join(syzygy_cfg.paths), "SyzygyProbeLimit": syzygy_cfg.max_pieces} | options
     logger.debug(f"Starting engine: {commands}")
     return Engine(commands, options, stderr, cfg.draw_or_resign, game, cwd=cfg.working_dir)
 
@@ -97,6 +106,7 @@ class EngineWrapper:
         self.go_commands = Configuration(cast(GO_COMMANDS_TYPE, options.pop("go_commands", {})) or {})
         self.move_commentary: list[InfoStrDict] = []
         self.comment_start_index = -1
+        self.profiler: Optional[SearchProfiler] = None
 
     def configure(self, options: OPTIONS_GO_EGTB_TYPE, game: Optional[model.Game]) -> None:
         """
@@ -182,7 +192,7 @@ class EngineWrapper:
                                                is_correspondence, correspondence_move_time)
 
             try:
-                best_move = self.search(board, time_limit, can_ponder, draw_offered, best_move)
+                best_move = self.configured_search(board, game, time_limit, can_ponder, draw_offered, best_move, engine_cfg)
             except chess.engine.EngineError as error:
                 BadMove = (chess.IllegalMoveError, chess.InvalidMoveError)
                 if any(isinstance(e, BadMove) for e in error.args):
@@ -202,6 +212,51 @@ class EngineWrapper:
             li.resign(game.id)
         else:
             li.make_move(game.id, best_move)
+            prefetch_online_moves(li, board, game, best_move, engine_cfg)
+
+    def configured_search(self, board: chess.Board, game: model.Game, time_limit: chess.engine.Limit, ponder: bool,
+                          draw_offered: bool, root_moves: MOVE, engine_cfg: Configuration) -> chess.engine.PlayResult:
+        """
+        Search, profiling and capturing the search if the `profiling` and `capture` sections of the config ask for it.
+
+        :param board: The current position.
+        :param game: The game that the bot is playing.
+        :param time_limit: Conditions for how long the engine can search.
+        :param ponder: Whether the engine can ponder.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :param engine_cfg: The `engine` section of the config.
+        :return: The move to play.
+        """
+        start = time.perf_counter()
+        if engine_cfg.profiling.enabled:
+            result = self.profiled_search(board, game, time_limit, ponder, draw_offered, root_moves, engine_cfg.profiling)
+        else:
+            result = self.search(board, time_limit, ponder, draw_offered, root_moves)
+        if engine_cfg.capture.enabled:
+            search = capture_search(board, game.id, time_limit, ponder, draw_offered, root_moves, result,
+                                    time.perf_counter() - start, engine_cfg)
+            append_capture(engine_cfg.capture, search)
+        return result
+
+    def profiled_search(self, board: chess.Board, game: model.Game, time_limit: chess.engine.Limit, ponder: bool,
+                        draw_offered: bool, root_moves: MOVE, profiling_cfg: Configuration) -> chess.engine.PlayResult:
+        """
+        Search while profiling the searches chosen in the `profiling` section of the config.
+
+        :param board: The current position.
+        :param game: The game that the bot is playing.
+        :param time_limit: Conditions for how long the engine can search.
+        :param ponder: Whether the engine can ponder.
+        :param draw_offered: Whether the bot was offered a draw.
+        :param root_moves: If it is a list, the engine will only play a move that is in `root_moves`.
+        :param profiling_cfg: The `profiling` section of the config.
+        :return: The move to play.
+        """
+        if self.profiler is None:
+            self.profiler = SearchProfiler(profiling_cfg, game.id)
+        ply = len(board.move_stack) + 1
+        return self.profiler.search(ply, lambda: self.search(board, time_limit, ponder, draw_offered, root_moves))
 
     def add_go_commands(self, time_limit: chess.engine.Limit) -> chess.engine.Limit:
         """Add extra commands to send to the engine. For example, to search for 1000 nodes or up to depth 10."""
@@ -451,6 +506,9 @@ class EngineWrapper:
         :param game: The final game state from lichess.
         :param board: The final board state.
         """
+        if self.profiler is not None:
+            self.profiler.write_summary()
+
         termination = game.state.get("status")
         winner = game.state.get("winner")
         winning_color = chess.WHITE if winner == "white" else chess.BLACK
@@ -738,6 +796,17 @@ def check_for_draw_offer(game: model.Game) -> bool:
     return bool(game.state.get(f"{game.opponent_color[0]}draw"))
 
 
+def polyglot_books(board: chess.Board, polyglot_cfg: Configuration) -> list[str]:
+    """Get the opening books for the variant of the board."""
+    if board.chess960:
+        variant = "chess960"
+    else:
+        variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
+
+    change_value_to_list(polyglot_cfg.config, "book", key=variant)
+    return cast(list[str], polyglot_cfg.book.lookup(variant))
+
+
 def get_book_move(board: chess.Board, game: model.Game,
                   polyglot_cfg: Configuration) -> chess.engine.PlayResult:
     """Get a move from an opening book."""
@@ -747,15 +816,7 @@ def get_book_move(board: chess.Board, game: model.Game,
     if not use_book or len(board.move_stack) > max_game_length:
         return no_book_move
 
-    if board.chess960:
-        variant = "chess960"
-    else:
-        variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
-
-    change_value_to_list(polyglot_cfg.config, "book", key=variant)
-    books = polyglot_cfg.book.lookup(variant)
-
-    for book in books:
+    for book in polyglot_books(board, polyglot_cfg):
         with chess.polyglot.open_reader(book) as reader:
             try:
                 selection = polyglot_cfg.selection
@@ -815,12 +876,9 @@ def get_online_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game, onli
     lichess_cloud_cfg = online_moves_cfg.lichess_cloud_analysis
     opening_explorer_cfg = online_moves_cfg.lichess_opening_explorer
 
-    for online_source, cfg in ((get_chessdb_move, chessdb_cfg),
-                               (get_lichess_cloud_move, lichess_cloud_cfg),
-                               (get_opening_explorer_move, opening_explorer_cfg)):
-        best_move, comment = online_source(li, board, game, cfg)
-        if best_move:
-            return chess.engine.PlayResult(chess.Move.from_uci(best_move), None, comment)
+    best_move, comment = get_online_book_move(li, board, game, online_moves_cfg)
+    if best_move:
+        return chess.engine.PlayResult(chess.Move.from_uci(best_move), None, comment)
 
     out_of_online_opening_book_moves[game.id] += 1
     used_opening_books = chessdb_cfg.enabled or lichess_cloud_cfg.enabled or opening_explorer_cfg.enabled
@@ -829,25 +887,134 @@ def get_online_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game, onli
     return chess.engine.PlayResult(None, None)
 
 
-def get_chessdb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
-                     chessdb_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
-    """Get a move from chessdb.cn's opening book."""
+def get_online_book_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
+                         online_moves_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """
+    Ask the enabled online opening books at the same time and take the move of the first in priority order that has one.
+
+    The priority is chessdb.cn, then lichess's cloud analysis, then lichess's opening explorer. The books are waited for
+    until a deadline set by `online_book_wait_time`. Then the move of the first book that has answered is taken, and the
+    books that have not answered yet are not waited for.
+    """
+    all_sources = ((get_chessdb_move, online_moves_cfg.chessdb_book),
+                   (get_lichess_cloud_move, online_moves_cfg.lichess_cloud_analysis),
+                   (get_opening_explorer_move, online_moves_cfg.lichess_opening_explorer))
+    sources = [(online_source, cfg) for online_source, cfg in all_sources if cfg.enabled]
+    if not sources:
+        return None, {}
+
+    deadline = time.monotonic() + to_seconds(online_book_wait_time(board, game, online_moves_cfg))
+    executor = concurrent.futures.ThreadPoolExecutor(len(sources), thread_name_prefix=f"online-books-{game.id}")
+    try:
+        # The books get their own copy of the board, since a book that answers late may still use it after the game
+        # has moved on.
+        futures = [(online_source.__name__, executor.submit(online_source, li, board.copy(stack=False), game, cfg))
+                   for online_source, cfg in sources]
+        for name, future in futures:
+            try:
+                best_move, comment = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except concurrent.futures.TimeoutError:
+                logger.info(f"No answer from {name} in time for game {game.id}")
+                continue
+            if best_move:
+                return best_move, comment
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None, {}
+
+
+def online_book_wait_time(board: chess.Board, game: model.Game, online_moves_cfg: Configuration) -> datetime.timedelta:
+    """Get how long to wait for the online opening books: at most `max_wait`, and at most a 20th of the clock time left."""
+    time_left = msec(game.state[wbtime(board)])
+    return min(seconds(online_moves_cfg.max_wait), time_left / 20)
+
+
+def online_requests(board: chess.Board, game: model.Game, online_moves_cfg: Configuration) -> list[ONLINE_REQUEST_TYPE]:
+    """Get the requests to the online sources that `get_online_move` may send for a position."""
+    requests = [online_egtb_request(board, game, online_moves_cfg.online_egtb)]
+    max_opening_moves = online_moves_cfg.max_depth * 2 - 1
+    if (len(board.move_stack) <= max_opening_moves
+            and out_of_online_opening_book_moves[game.id] < online_moves_cfg.max_out_of_book_moves):
+        requests.extend([chessdb_request(board, game, online_moves_cfg.chessdb_book),
+                         lichess_cloud_request(board, game, online_moves_cfg.lichess_cloud_analysis),
+                         opening_explorer_request(board, game, online_moves_cfg.lichess_opening_explorer)])
+    return [request for request in requests if request is not None]
+
+
+def likely_replies(board: chess.Board, result: chess.engine.PlayResult, polyglot_cfg: Configuration,
+                   count: int) -> list[chess.Move]:
+    """
+    Guess the opponent's most likely replies to our move.
+
+    :param board: The position after our move.
+    :param result: Our move, with the reply that the engine expects as its ponder move or in its principal variation.
+    :return: The expected reply first, then the moves of the opening books with the most weight.
+    """
+    pv = result.info.get("pv", [])
+    replies = [result.ponder] if result.ponder else pv[1:2]
+    if polyglot_cfg.enabled:
+        for book in polyglot_books(board, polyglot_cfg):
+            with chess.polyglot.open_reader(book) as reader:
+                entries = sorted(reader.find_all(board), key=lambda entry: entry.weight, reverse=True)
+                replies.extend(entry.move for entry in entries)
+    unique_replies = [move for move in dict.fromkeys(replies) if board.is_legal(move)]
+    return unique_replies[:count]
+
+
+def prefetch_online_moves(li: LICHESS_TYPE, board: chess.Board, game: model.Game, result: chess.engine.PlayResult,
+                          engine_cfg: Configuration) -> None:
+    """
+    Ask the online sources about the positions after the opponent's likely replies while the opponent thinks.
+
+    The answers are fetched in a background thread and kept by `li`, which uses them when `get_online_move` sends the
+    same requests after the opponent plays one of these replies.
+
+    :param board: The position before our move.
+    :param result: Our move.
+    """
+    count = engine_cfg.online_moves.prefetch_replies
+    if not count or result.move is None:
+        return
+
+    after_move = board.copy()
+    after_move.push(result.move)
+    requests: list[ONLINE_REQUEST_TYPE] = []
+    for reply in likely_replies(after_move, result, engine_cfg.polyglot, count):
+        after_move.push(reply)
+        requests.extend(online_requests(after_move, game, engine_cfg.online_moves))
+        after_move.pop()
+    if requests:
+        logger.debug(f"Prefetching {len(requests)} online answers for game {game.id}")
+        threading.Thread(target=li.prefetch_online_books, args=(requests,), daemon=True).start()
+
+
+def chessdb_request(board: chess.Board, game: model.Game, chessdb_cfg: Configuration) -> Optional[ONLINE_REQUEST_TYPE]:
+    """Get the request to chessdb.cn's opening book for a position, or None if the book is not used for it."""
     use_chessdb = chessdb_cfg.enabled
     time_left = msec(game.state[wbtime(board)])
     min_time = seconds(chessdb_cfg.min_time)
     if not use_chessdb or time_left < min_time or board.uci_variant != "chess":
+        return None
+
+    action = {"best": "querypv",
+              "good": "querybest",
+              "all": "query"}
+    params: dict[str, Union[str, int]] = {"action": action[chessdb_cfg.move_quality], "board": board.fen(), "json": 1}
+    return "https://www.chessdb.cn/cdb.php", params, False
+
+
+def get_chessdb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
+                     chessdb_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """Get a move from chessdb.cn's opening book."""
+    request = chessdb_request(board, game, chessdb_cfg)
+    if request is None:
         return None, {}
 
     move = None
     comment: chess.engine.InfoDict = {}
-    site = "https://www.chessdb.cn/cdb.php"
     quality = chessdb_cfg.move_quality
-    action = {"best": "querypv",
-              "good": "querybest",
-              "all": "query"}
     try:
-        params: dict[str, Union[str, int]] = {"action": action[quality], "board": board.fen(), "json": 1}
-        data = li.online_book_get(site, params=params)
+        data = li.online_book_get(*request)
         if data["status"] == "ok":
             if quality == "best":
                 depth = data["depth"]
@@ -868,28 +1035,34 @@ def get_chessdb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
     return move, comment
 
 
-def get_lichess_cloud_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
-                           lichess_cloud_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
-    """Get a move from the lichess's cloud analysis."""
-    side = wbtime(board)
-    time_left = msec(game.state[side])
+def lichess_cloud_request(board: chess.Board, game: model.Game,
+                          lichess_cloud_cfg: Configuration) -> Optional[ONLINE_REQUEST_TYPE]:
+    """Get the request to lichess's cloud analysis for a position, or None if the cloud analysis is not used for it."""
+    time_left = msec(game.state[wbtime(board)])
     min_time = seconds(lichess_cloud_cfg.min_time)
     use_lichess_cloud = lichess_cloud_cfg.enabled
     if not use_lichess_cloud or time_left < min_time:
+        return None
+
+    multipv = 1 if lichess_cloud_cfg.move_quality == "best" else 5
+    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)  # `str` is there only for mypy.
+    return "https://lichess.org/api/cloud-eval", {"fen": board.fen(), "multiPv": multipv, "variant": variant}, False
+
+
+def get_lichess_cloud_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
+                           lichess_cloud_cfg: Configuration) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """Get a move from the lichess's cloud analysis."""
+    request = lichess_cloud_request(board, game, lichess_cloud_cfg)
+    if request is None:
         return None, {}
 
     move = None
     comment: chess.engine.InfoDict = {}
-
+    side = wbtime(board)
     quality = lichess_cloud_cfg.move_quality
-    multipv = 1 if quality == "best" else 5
-    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)  # `str` is there only for mypy.
 
     try:
-        data = li.online_book_get("https://lichess.org/api/cloud-eval",
-                                  params={"fen": board.fen(),
-                                          "multiPv": multipv,
-                                          "variant": variant})
+        data = li.online_book_get(*request)
         if "error" not in data:
             depth = data["depth"]
             knodes = data["knodes"]
@@ -922,38 +1095,45 @@ def get_lichess_cloud_move(li: LICHESS_TYPE, board: chess.Board, game: model.Gam
     return move, comment
 
 
-def get_opening_explorer_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
-                              opening_explorer_cfg: Configuration
-                              ) -> tuple[Optional[str], chess.engine.InfoDict]:
-    """Get a move from lichess's opening explorer."""
+def opening_explorer_request(board: chess.Board, game: model.Game,
+                             opening_explorer_cfg: Configuration) -> Optional[ONLINE_REQUEST_TYPE]:
+    """Get the request to lichess's opening explorer for a position, or None if the explorer is not used for it."""
     side = wbtime(board)
     time_left = msec(game.state[side])
     min_time = seconds(opening_explorer_cfg.min_time)
     source = opening_explorer_cfg.source
     if not opening_explorer_cfg.enabled or time_left < min_time or source == "master" and board.uci_variant != "chess":
+        return None
+
+    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)  # `str` is there only for mypy
+    if source == "masters":
+        return "https://explorer.lichess.ovh/masters", {"fen": board.fen(), "moves": 100}, False
+    elif source == "player":
+        player = opening_explorer_cfg.player_name or game.username
+        return "https://explorer.lichess.ovh/player", {"player": player, "fen": board.fen(), "moves": 100,
+                                                       "variant": variant, "recentGames": 0,
+                                                       "color": "white" if side == "wtime" else "black"}, True
+    else:
+        return "https://explorer.lichess.ovh/lichess", {"fen": board.fen(), "moves": 100, "variant": variant,
+                                                        "topGames": 0, "recentGames": 0}, False
+
+
+def get_opening_explorer_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
+                              opening_explorer_cfg: Configuration
+                              ) -> tuple[Optional[str], chess.engine.InfoDict]:
+    """Get a move from lichess's opening explorer."""
+    request = opening_explorer_request(board, game, opening_explorer_cfg)
+    if request is None:
         return None, {}
 
     move = None
     comment: chess.engine.InfoDict = {}
-    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)  # `str` is there only for mypy
+    side = wbtime(board)
+    source_names = {"masters": "Masters", "player": "Player"}
     try:
-        params: dict[str, Union[str, int]]
-        if source == "masters":
-            params = {"fen": board.fen(), "moves": 100}
-            response = li.online_book_get("https://explorer.lichess.ovh/masters", params)
-            comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Masters)"}
-        elif source == "player":
-            player = opening_explorer_cfg.player_name
-            if not player:
-                player = game.username
-            params = {"player": player, "fen": board.fen(), "moves": 100, "variant": variant,
-                      "recentGames": 0, "color": "white" if side == "wtime" else "black"}
-            response = li.online_book_get("https://explorer.lichess.ovh/player", params, True)
-            comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Player)"}
-        else:
-            params = {"fen": board.fen(), "moves": 100, "variant": variant, "topGames": 0, "recentGames": 0}
-            response = li.online_book_get("https://explorer.lichess.ovh/lichess", params)
-            comment = {"string": "lichess-bot-source:Lichess Opening Explorer (Lichess)"}
+        response = li.online_book_get(*request)
+        source_name = source_names.get(opening_explorer_cfg.source, "Lichess")
+        comment = {"string": f"lichess-bot-source:Lichess Opening Explorer ({source_name})"}
         moves = []
         for possible_move in response["moves"]:
             games_played = possible_move["white"] + possible_move["black"] + possible_move["draws"]
@@ -975,18 +1155,15 @@ def get_opening_explorer_move(li: LICHESS_TYPE, board: chess.Board, game: model.
     return move, comment
 
 
-def get_online_egtb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game, online_egtb_cfg: Configuration
-                         ) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
-    """
-    Get a move from an online egtb (either by lichess or chessdb).
-
-    If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
-    """
+def online_egtb_request(board: chess.Board, game: model.Game,
+                        online_egtb_cfg: Configuration) -> Optional[ONLINE_REQUEST_TYPE]:
+    """Get the request to an online egtb for a position, or None if the online egtb is not used for it."""
     use_online_egtb = online_egtb_cfg.enabled
     pieces = chess.popcount(board.occupied)
     source = online_egtb_cfg.source
     minimum_time = seconds(online_egtb_cfg.min_time)
     time_left = game.state[wbtime(board)]
+    max_lichess_pieces = 7 if board.uci_variant == "chess" else 6
     if (not use_online_egtb
             or msec(time_left) < minimum_time
             or board.uci_variant not in ["chess", "antichess", "atomic"]
@@ -994,18 +1171,37 @@ def get_online_egtb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game,
             or board.uci_variant != "chess"
             and source == "chessdb"
             or pieces > online_egtb_cfg.max_pieces
+            or pieces > max_lichess_pieces
+            and source == "lichess"
             or board.castling_rights):
+        return None
+
+    if source == "lichess":
+        variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
+        return f"https://tablebase.lichess.ovh/{variant}", {"fen": board.fen()}, False
+    action = "querypv" if online_egtb_cfg.move_quality == "best" else "queryall"
+    return "https://www.chessdb.cn/cdb.php", {"action": action, "board": board.fen(), "json": 1}, False
+
+
+def get_online_egtb_move(li: LICHESS_TYPE, board: chess.Board, game: model.Game, online_egtb_cfg: Configuration
+                         ) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
+    """
+    Get a move from an online egtb (either by lichess or chessdb).
 
+    If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
+    """
+    request = online_egtb_request(board, game, online_egtb_cfg)
+    if request is None:
         return None, -3, {}
 
     quality = online_egtb_cfg.move_quality
-    variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
 
     try:
-        if source == "lichess":
-            return get_lichess_egtb_move(li, game, board, quality, variant)
-        elif source == "chessdb":
-            return get_chessdb_egtb_move(li, game, board, quality)
+        data = li.online_book_get(*request)
+        if online_egtb_cfg.source == "lichess":
+            return get_lichess_egtb_move(data, game, quality)
+        elif online_egtb_cfg.source == "chessdb":
+            return get_chessdb_egtb_move(data, game, quality)
     except Exception:
         pass
 
@@ -1024,6 +1220,9 @@ def get_egtb_move(board: chess.Board, game: model.Game, lichess_bot_tbs: Configu
     if best_move is None:
         best_move, wdl = get_gaviota(board, game, lichess_bot_tbs.gaviota)
         source = "lichess-bot-source:Gaviota EGTB"
+    if best_move is None and lichess_bot_tbs.bitbases:
+        best_move, wdl = get_bitbase_move(board, game, lichess_bot_tbs.bitbases)
+        source = "lichess-bot-source:Bitbases"
     if best_move:
         can_offer_draw = draw_or_resign_cfg.offer_draw_enabled
         offer_draw_for_zero = draw_or_resign_cfg.offer_draw_for_egtb_zero
@@ -1041,10 +1240,10 @@ def get_egtb_move(board: chess.Board, game: model.Game, lichess_bot_tbs: Configu
     return chess.engine.PlayResult(None, None)
 
 
-def get_lichess_egtb_move(li: LICHESS_TYPE, game: model.Game, board: chess.Board, quality: str,
-                          variant: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
+def get_lichess_egtb_move(data: OnlineType, game: model.Game,
+                          quality: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
-    Get a move from lichess's egtb.
+    Get a move from the answer of lichess's egtb.
 
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
@@ -1055,50 +1254,44 @@ def get_lichess_egtb_move(li: LICHESS_TYPE, game: model.Game, board: chess.Board
                    "cursed-win": 1,
                    "maybe-win": 1,
                    "win": 2}
-    pieces = chess.popcount(board.occupied)
-    max_pieces = 7 if board.uci_variant == "chess" else 6
-    if pieces <= max_pieces:
-        data = li.online_book_get(f"https://tablebase.lichess.ovh/{variant}",
-                                  params={"fen": board.fen()})
-        if quality == "best":
-            move = data["moves"][0]["uci"]
-            wdl = name_to_wld[data["moves"][0]["category"]] * -1
-            dtz = data["moves"][0]["dtz"] * -1
-            dtm = data["moves"][0]["dtm"]
+    if quality == "best":
+        move = data["moves"][0]["uci"]
+        wdl = name_to_wld[data["moves"][0]["category"]] * -1
+        dtz = data["moves"][0]["dtz"] * -1
+        dtm = data["moves"][0]["dtm"]
+        if dtm:
+            dtm *= -1
+        logger.info(f"Got move {move} from tablebase.lichess.ovh (wdl: {wdl}, dtz: {dtz}, dtm: {dtm}) for game {game.id}")
+    else:  # quality == "suggest":
+        best_wdl = name_to_wld[data["moves"][0]["category"]] * -1
+
+        def good_enough(possible_move: LichessEGTBMoveType) -> bool:
+            return name_to_wld[possible_move["category"]] * -1 == best_wdl
+
+        possible_moves = list(filter(good_enough, data["moves"]))
+        if len(possible_moves) > 1:
+            move_list = [move["uci"] for move in possible_moves]
+            wdl = best_wdl
+            logger.info(f"Suggesting moves from tablebase.lichess.ovh (wdl: {wdl}) for game {game.id}")
+            return move_list, wdl, {"string": "lichess-bot-source:Lichess EGTB"}
+        else:
+            best_move = possible_moves[0]
+            move = best_move["uci"]
+            wdl = name_to_wld[best_move["category"]] * -1
+            dtz = best_move["dtz"] * -1
+            dtm = best_move["dtm"]
             if dtm:
                 dtm *= -1
-            logger.info(f"Got move {move} from tablebase.lichess.ovh (wdl: {wdl}, dtz: {dtz}, dtm: {dtm}) for game {game.id}")
-        else:  # quality == "suggest":
-            best_wdl = name_to_wld[data["moves"][0]["category"]] * -1
-
-            def good_enough(possible_move: LichessEGTBMoveType) -> bool:
-                return name_to_wld[possible_move["category"]] * -1 == best_wdl
-
-            possible_moves = list(filter(good_enough, data["moves"]))
-            if len(possible_moves) > 1:
-                move_list = [move["uci"] for move in possible_moves]
-                wdl = best_wdl
-                logger.info(f"Suggesting moves from tablebase.lichess.ovh (wdl: {wdl}) for game {game.id}")
-                return move_list, wdl, {"string": "lichess-bot-source:Lichess EGTB"}
-            else:
-                best_move = possible_moves[0]
-                move = best_move["uci"]
-                wdl = name_to_wld[best_move["category"]] * -1
-                dtz = best_move["dtz"] * -1
-                dtm = best_move["dtm"]
-                if dtm:
-                    dtm *= -1
-                logger.info(f"Got move {move} from tablebase.lichess.ovh (wdl: {wdl}, dtz: {dtz}, dtm: {dtm})"
-                            f" for game {game.id}")
+            logger.info(f"Got move {move} from tablebase.lichess.ovh (wdl: {wdl}, dtz: {dtz}, dtm: {dtm})"
+                        f" for game {game.id}")
 
-        return move, wdl, {"string": "lichess-bot-source:Lichess EGTB"}
-    return None, -3, {}
+    return move, wdl, {"string": "lichess-bot-source:Lichess EGTB"}
 
 
-def get_chessdb_egtb_move(li: LICHESS_TYPE, game: model.Game, board: chess.Board,
+def get_chessdb_egtb_move(data: OnlineType, game: model.Game,
                           quality: str) -> tuple[Union[str, list[str], None], int, chess.engine.InfoDict]:
     """
-    Get a move from chessdb's egtb.
+    Get a move from the answer of chessdb's egtb.
 
     If `move_quality` is `suggest`, then it will return a list of moves for the engine to choose from.
     """
@@ -1114,9 +1307,6 @@ def get_chessdb_egtb_move(li: LICHESS_TYPE, game: model.Game, board: chess.Board
                                    (0, 'i', 0),
                                    (20000, 'i', 20000 - score)], 30000 - score, score)
 
-    action = "querypv" if quality == "best" else "queryall"
-    data = li.online_book_get("https://www.chessdb.cn/cdb.php",
-                              params={"action": action, "board": board.fen(), "json": 1})
     if data["status"] == "ok":
         if quality == "best":
             score = data["score"]
@@ -1271,6 +1461,40 @@ def get_gaviota(board: chess.Board, game: model.Game,
             return None, -3
 
 
+def get_bitbase_move(board: chess.Board, game: model.Game,
+                     bitbase_cfg: Configuration) -> tuple[Union[chess.Move, list[chess.Move], None], int]:
+    """
+    Get moves from local bitbases.
+
+    Bitbases only know wins, draws and losses, so all the moves with the best WDL are suggested to the engine.
+    """
+    if (not bitbase_cfg.enabled
+            or chess.popcount(board.occupied) > bitbases.MAX_PIECES
+            or board.uci_variant != "chess"):
+        return None, -3
+    for path in bitbase_cfg.paths:
+        tables = bitbases.load_bitbases(path)
+        moves = {}
+        for move in board.legal_moves:
+            board_copy = board.copy()
+            board_copy.push(move)
+            wdl = tables.probe_wdl(board_copy)
+            if wdl is None:
+                break
+            moves[move] = -wdl
+        else:
+            if not moves:
+                continue
+            best_wdl = max(moves.values())
+            good_moves = [chess_move for chess_move, wdl in moves.items() if wdl == best_wdl]
+            if len(good_moves) > 1:
+                logger.info(f"Suggesting moves from bitbases (wdl: {best_wdl}) for game {game.id}")
+                return good_moves, best_wdl
+            logger.info(f"Got move {good_moves[0].uci()} from bitbases (wdl: {best_wdl}) for game {game.id}")
+            return good_moves[0], best_wdl
+    return None, -3
+
+
 def dtm_scorer(tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase], board: chess.Board) -> int:
     """Score a position based on a gaviota DTM egtb."""
     dtm = -tablebase.probe_dtm(board)
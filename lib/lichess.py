@@ -9,11 +9,13 @@ import logging
 import traceback
 from collections import defaultdict
 import datetime
+import time
+from lib.online_cache import OnlineCache, online_request_key
 from lib.timer import Timer, seconds, sec_str
 from typing import Optional, Union, cast
 import chess.engine
 from lib.types import (UserProfileType, REQUESTS_PAYLOAD_TYPE, GameType, PublicDataType, OnlineType,
-                       ChallengeType, TOKEN_TESTS_TYPE, BackoffDetails)
+                       ChallengeType, TOKEN_TESTS_TYPE, BackoffDetails, ONLINE_REQUEST_TYPE)
 
 
 ENDPOINTS = {
@@ -71,7 +73,8 @@ def backoff_handler(details: BackoffDetails) -> None:
 class Lichess:
     """Communication with lichess.org (and chessdb.cn for getting moves)."""
 
-    def __init__(self, token: str, url: str, version: str, logging_level: int, max_retries: int) -> None:
+    def __init__(self, token: str, url: str, version: str, logging_level: int, max_retries: int,
+                 online_cache: Optional[OnlineCache] = None) -> None:
         """
         Communication with lichess.org (and chessdb.cn for getting moves).
 
@@ -80,6 +83,7 @@ class Lichess:
         :param version: The lichess-bot version running.
         :param logging_level: The logging level (logging.INFO or logging.DEBUG).
         :param max_retries: The maximum amount of retries for online moves (e.g. chessdb's opening book).
+        :param online_cache: Where to keep the answers of online sources, if they are kept.
         """
         self.version = version
         self.header = {
@@ -93,6 +97,8 @@ class Lichess:
         self.logging_level = logging_level
         self.max_retries = max_retries
         self.rate_limit_timers: defaultdict[str, Timer] = defaultdict(Timer)
+        self.prefetched_responses: dict[str, OnlineType] = {}
+        self.online_cache = online_cache
 
         # Confirm that the OAuth token has the proper permission to play on lichess
         token_response = cast(TOKEN_TESTS_TYPE, self.api_post("token_test", data=token))
@@ -378,6 +384,15 @@ class Lichess:
     def online_book_get(self, path: str, params: Optional[dict[str, Union[str, int]]] = None,
                         stream: bool = False) -> OnlineType:
         """Get an external move from online sources (chessdb or lichess.org)."""
+        prefetched = self.prefetched_responses.pop(online_request_key(path, params), None)
+        if prefetched is not None:
+            logger.debug(f"Using the prefetched answer from {path}")
+            return prefetched
+        if self.online_cache:
+            cached = self.online_cache.get(path, params)
+            if cached is not None:
+                return cached
+
         @backoff.on_exception(backoff.constant,
                               (RemoteDisconnected, ConnectionError, HTTPError, ReadTimeout),
                               max_time=60,
@@ -390,7 +405,29 @@ class Lichess:
         def online_book_get() -> OnlineType:
             json_response: OnlineType = self.other_session.get(path, timeout=2, params=params, stream=stream).json()
             return json_response
-        return online_book_get()
+
+        start = time.perf_counter()
+        response = online_book_get()
+        if self.online_cache:
+            self.online_cache.put(path, params, response, time.perf_counter() - start)
+        return response
+
+    def prefetch_online_books(self, requests: list[ONLINE_REQUEST_TYPE]) -> None:
+        """
+        Get answers from online sources ahead of time. `online_book_get` returns them when the same request is made.
+
+        Answers prefetched by an earlier call that were not used are dropped.
+        """
+        responses: dict[str, OnlineType] = {}
+        self.prefetched_responses = responses
+        for path, params, stream in requests:
+            key = online_request_key(path, params)
+            if key in responses:
+                continue
+            try:
+                responses[key] = self.online_book_get(path, params, stream)
+            except Exception:
+                logger.debug(f"Could not prefetch the answer from {path}", exc_info=True)
 
     def is_online(self, user_id: str) -> bool:
         """Check if lichess.org thinks the bot is online or not."""
@@ -14,7 +14,6 @@ import datetime
 import backoff
 import os
 import io
-import copy
 import math
 import sys
 import yaml
@@ -26,6 +25,7 @@ import importlib.metadata
 import test_bot.lichess
 from lib.config import load_config, Configuration
 from lib.conversation import Conversation, ChatLine
+from lib.online_cache import OnlineCache
 from lib.timer import Timer, seconds, msec, hours, to_seconds
 from lib.types import (UserProfileType, EventType, GameType, GameEventType, CONTROL_QUEUE_TYPE, CORRESPONDENCE_QUEUE_TYPE,
                        LOGGING_QUEUE_TYPE, PGN_QUEUE_TYPE)
@@ -697,7 +697,7 @@ def play_game(li: LICHESS_TYPE,
         goodbye_spectators = get_greeting("goodbye_spectators", config.greeting, keyword_map)
 
         disconnect_time = correspondence_disconnect_time if not game.state.get("moves") else seconds(0)
-        prior_game = None
+        prior_game: Optional[model.GameSnapshot] = None
         board = chess.Board()
         game_stream = itertools.chain([json.dumps(game.state).encode("utf-8")], lines)
         quit_after_all_games_finish = config.quit_after_all_games_finish
@@ -711,7 +711,7 @@ def play_game(li: LICHESS_TYPE,
                     conversation.react(ChatLine(upd))
                 elif u_type == "gameState":
                     game.state = upd
-                    board = setup_board(game)
+                    board = update_board(board, game)
                     takeback_field = game.state.get("btakeback") if game.is_white else game.state.get("wtakeback")
 
                     if not is_game_over(game) and is_engine_move(game, prior_game, board):
@@ -747,7 +747,7 @@ def play_game(li: LICHESS_TYPE,
                     wbinc = upd[engine_wrapper.wbinc(board)]
                     terminate_time = msec(wbtime) + msec(wbinc) + seconds(60)
                     game.ping(abort_time, terminate_time, disconnect_time)
-                    prior_game = copy.deepcopy(game)
+                    prior_game = game.snapshot()
                 elif u_type == "ping" and should_exit_game(board, game, prior_game, li, is_correspondence):
                     stay_in_game = False
             except (HTTPError, ReadTimeout, RemoteDisconnected, ChunkedEncodingError, ConnectionError, StopIteration) as e:
@@ -853,16 +853,38 @@ def setup_board(game: model.Game) -> chess.Board:
         VariantBoard = find_variant(game.variant_name)
         board = VariantBoard()
 
-    for move in game.state["moves"].split():
+    push_moves(board, game.state["moves"].split())
+    return board
+
+
+def update_board(board: chess.Board, game: model.Game) -> chess.Board:
+    """
+    Bring the board from the last game update up to date by pushing only the moves played since then.
+
+    The board is set up from the start instead when it has no moves yet, or when its moves are not the first moves of
+    the game, as after a takeback.
+    """
+    moves = game.state["moves"].split()
+    played = board.move_stack
+    if (not played
+            or len(played) > len(moves)
+            or any(move.uci() != uci for move, uci in zip(played, moves))):
+        return setup_board(game)
+
+    push_moves(board, moves[len(played):])
+    return board
+
+
+def push_moves(board: chess.Board, moves: list[str]) -> None:
+    """Play moves given in UCI on the board, skipping illegal ones."""
+    for move in moves:
         try:
             board.push_uci(move)
         except ValueError:
             logger.exception(f"Ignoring illegal move {move} on board {board.fen()}")
 
-    return board
-
 
-def is_engine_move(game: model.Game, prior_game: Optional[model.Game], board: chess.Board) -> bool:
+def is_engine_move(game: model.Game, prior_game: Optional[model.GameSnapshot], board: chess.Board) -> bool:
     """Check whether it is the engine's turn."""
     return game_changed(game, prior_game) and bot_to_move(game, board)
 
@@ -884,7 +906,7 @@ def is_game_over(game: model.Game) -> bool:
     return status != "started"
 
 
-def should_exit_game(board: chess.Board, game: model.Game, prior_game: Optional[model.Game], li: LICHESS_TYPE,
+def should_exit_game(board: chess.Board, game: model.Game, prior_game: Optional[model.GameSnapshot], li: LICHESS_TYPE,
                      is_correspondence: bool) -> bool:
     """Whether we should exit a game."""
     if (is_correspondence
@@ -923,14 +945,12 @@ def final_queue_entries(control_queue: CONTROL_QUEUE_TYPE, correspondence_queue:
                                    "complete": is_game_over(game)}})
 
 
-def game_changed(current_game: model.Game, prior_game: Optional[model.Game]) -> bool:
+def game_changed(current_game: model.Game, prior_game: Optional[model.GameSnapshot]) -> bool:
     """Check whether the current game state is different from the previous game state."""
     if prior_game is None:
         return True
 
-    current_game_moves_str = current_game.state["moves"]
-    prior_game_moves_str = prior_game.state["moves"]
-    return current_game_moves_str != prior_game_moves_str
+    return current_game.state["moves"] != prior_game.moves
 
 
 def tell_user_game_result(game: model.Game, board: chess.Board) -> None:
@@ -1200,9 +1220,11 @@ def start_lichess_bot() -> None:
     logger.info("Engine configuration OK")
 
     max_retries = CONFIG.engine.online_moves.max_retries
+    cache_cfg = CONFIG.engine.online_moves.cache
+    online_cache = OnlineCache(cache_cfg) if cache_cfg.enabled else None
     check_python_version()
     log_python_and_libraries()
-    li = lichess.Lichess(CONFIG.token, CONFIG.url, __version__, logging_level, max_retries)
+    li = lichess.Lichess(CONFIG.token, CONFIG.url, __version__, logging_level, max_retries, online_cache)
 
     user_profile = li.get_profile()
     username = user_profile["username"]
@@ -1214,6 +1236,8 @@ def start_lichess_bot() -> None:
 
     if is_bot:
         start(li, user_profile, CONFIG, logging_level, args.logfile, auto_log_filename)
+        if online_cache:
+            logger.info(online_cache.summary())
     else:
         logger.error(f"{username} is not a bot account. Please upgrade it to a bot account!")
     logging.shutdown()
@@ -4,6 +4,7 @@ from urllib.parse import urljoin
 import logging
 import datetime
 from enum import Enum
+from typing import NamedTuple
 from lib.timer import Timer, msec, seconds, sec_str, to_msec, to_seconds, years
 from lib.config import Configuration
 from collections import defaultdict
@@ -151,6 +152,10 @@ class Termination(str, Enum):
 class Game:
     """Store information about a game."""
 
+    __slots__ = ("username", "id", "speed", "clock_initial", "clock_increment", "perf_name", "variant_name", "mode",
+                 "white", "black", "initial_fen", "state", "is_white", "my_color", "opponent_color", "me", "opponent",
+                 "base_url", "game_start", "abort_time", "terminate_time", "disconnect_time")
+
     def __init__(self, game_info: GameEventType, username: str, base_url: str, abort_time: datetime.timedelta) -> None:
         """:param abort_time: How long to wait before aborting the game."""
         self.username = username
@@ -257,6 +262,10 @@ class Game:
 
         return result.value
 
+    def snapshot(self) -> "GameSnapshot":
+        """Keep what is needed to tell whether a later update of the game changed it."""
+        return GameSnapshot(self.state["moves"])
+
     def __str__(self) -> str:
         """Get a string representation of `Game`."""
         return f"{self.url()} {self.perf_name} vs {self.opponent} ({self.id})"
@@ -266,9 +275,17 @@ class Game:
         return self.__str__()
 
 
+class GameSnapshot(NamedTuple):
+    """The state of a game at one update, to compare with the next update without copying the whole game."""
+
+    moves: str  # The moves string of the game state, which is not copied since strings cannot change.
+
+
 class Player:
     """Store information about a player."""
 
+    __slots__ = ("title", "rating", "provisional", "aiLevel", "is_bot", "name")
+
     def __init__(self, player_info: PlayerType) -> None:
         """:param player_info: Contains information about a player."""
         self.title = player_info.get("title")
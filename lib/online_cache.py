@@ -0,0 +1,146 @@
+"""Keep the answers of online books and tablebases on disk, shared by all the games the bot plays."""
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional, Union
+from urllib.parse import urlencode
+from lib.config import Configuration
+from lib.types import OnlineType
+
+logger = logging.getLogger(__name__)
+
+SOURCES = {"https://www.chessdb.cn/": "chessdb",
+           "https://lichess.org/api/cloud-eval": "lichess_cloud_analysis",
+           "https://explorer.lichess.ovh/": "lichess_opening_explorer",
+           "https://tablebase.lichess.ovh/": "lichess_tablebase"}
+KEEPS_HALFMOVE_CLOCK = {"lichess_tablebase"}  # Sources whose answers can depend on the fifty-move rule.
+FEN_PARAMETERS = ("fen", "board")
+EVICT_EVERY = 100  # Responses stored between checks of the size of the cache.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, source TEXT NOT NULL, response TEXT NOT NULL,
+                                      stored REAL NOT NULL, used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+CREATE TABLE IF NOT EXISTS stats (source TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0,
+                                  misses INTEGER NOT NULL DEFAULT 0, fetches INTEGER NOT NULL DEFAULT 0,
+                                  fetch_seconds REAL NOT NULL DEFAULT 0);
+"""
+
+
+def online_request_key(path: str, params: Optional[dict[str, Union[str, int]]]) -> str:
+    """Identify a request to an online source by its url and parameters, whatever their order."""
+    return f"{path}?{urlencode(sorted((params or {}).items()))}"
+
+
+def online_source(path: str) -> Optional[str]:
+    """Get the name of the online source that a url belongs to, or None if it is not one that is cached."""
+    return next((source for prefix, source in SOURCES.items() if path.startswith(prefix)), None)
+
+
+def normalized_params(source: str, params: Optional[dict[str, Union[str, int]]]) -> dict[str, Union[str, int]]:
+    """
+    Leave the move counters out of the position, so the same position reached in different games has the same key.
+
+    The halfmove clock is kept for the sources that take the fifty-move rule into account.
+    """
+    normalized = dict(params or {})
+    fields = 5 if source in KEEPS_HALFMOVE_CLOCK else 4
+    for name in FEN_PARAMETERS:
+        if name in normalized:
+            normalized[name] = " ".join(str(normalized[name]).split()[:fields])
+    return normalized
+
+
+class OnlineCache:
+    """
+    An SQLite file of the answers of online sources, with a time to live per source and a maximum number of answers.
+
+    Every game process opens its own connections, so the cache can be given to the processes of all the games.
+    """
+
+    def __init__(self, cache_cfg: Configuration) -> None:
+        """:param cache_cfg: The `engine: online_moves: cache` section of the config."""
+        self.path = cache_cfg.path
+        self.max_entries = int(cache_cfg.max_entries)
+        self.ttl_seconds = {source: float(days) * 24 * 60 * 60 for source, days in cache_cfg.ttl_days.items()}
+        self.created = False
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the cache, creating it the first time."""
+        if not self.created:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        if not self.created:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self.created = True
+        return connection
+
+    def get(self, path: str, params: Optional[dict[str, Union[str, int]]]) -> Optional[OnlineType]:
+        """Get a stored answer to a request, if there is one that has not expired."""
+        source = online_source(path)
+        if source is None:
+            return None
+        key = online_request_key(path, normalized_params(source, params))
+        now = time.time()
+        try:
+            with closing(self.connect()) as connection, connection:
+                row = connection.execute("SELECT response, stored FROM responses WHERE key = ?", (key,)).fetchone()
+                hit = row is not None and now - row[1] <= self.ttl_seconds.get(source, 0)
+                if hit:
+                    connection.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                self.count(connection, source, "hits" if hit else "misses")
+        except sqlite3.Error:
+            logger.debug(f"Could not read the online cache {self.path}", exc_info=True)
+            return None
+        if not hit:
+            return None
+        response: OnlineType = json.loads(row[0])
+        return response
+
+    def put(self, path: str, params: Optional[dict[str, Union[str, int]]], response: OnlineType, seconds: float) -> None:
+        """
+        Store the answer to a request, with how long it took to get it.
+
+        Every `EVICT_EVERY` answers, the answers used longest ago are removed to keep at most `max_entries`.
+        """
+        source = online_source(path)
+        if source is None:
+            return
+        key = online_request_key(path, normalized_params(source, params))
+        now = time.time()
+        try:
+            with closing(self.connect()) as connection, connection:
+                cursor = connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                            (key, source, json.dumps(response), now, now))
+                self.count(connection, source, "fetches", seconds)
+                if (cursor.lastrowid or 0) % EVICT_EVERY == 0:
+                    connection.execute("DELETE FROM responses WHERE key IN "
+                                       "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                       (self.max_entries,))
+        except sqlite3.Error:
+            logger.debug(f"Could not write to the online cache {self.path}", exc_info=True)
+
+    def count(self, connection: sqlite3.Connection, source: str, column: str, seconds: float = 0) -> None:
+        """Add a hit, miss or fetch of a source to the stats."""
+        connection.execute(f"INSERT INTO stats (source, {column}, fetch_seconds) VALUES (?, 1, ?) "
+                           f"ON CONFLICT (source) DO UPDATE SET {column} = {column} + 1, "
+                           "fetch_seconds = fetch_seconds + excluded.fetch_seconds", (source, seconds))
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Get the hits, misses, fetches and average fetch time of each source since the cache was created."""
+        with closing(self.connect()) as connection:
+            rows = connection.execute("SELECT source, hits, misses, fetches, fetch_seconds FROM stats").fetchall()
+        return {source: {"hits": hits, "misses": misses, "fetches": fetches,
+                         "average_fetch_seconds": fetch_seconds / fetches if fetches else 0.0}
+                for source, hits, misses, fetches, fetch_seconds in rows}
+
+    def summary(self) -> str:
+        """Describe the stats in one line."""
+        return "Online cache: " + ", ".join(f"{source} {counts['hits']:.0f} hits, {counts['misses']:.0f} misses, "
+                                            f"{counts['average_fetch_seconds']:.2f} s per fetch"
+                                            for source, counts in sorted(self.stats().items()))
@@ -0,0 +1,82 @@
+"""Profile the engine's searches in real games."""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from collections.abc import Callable
+from typing import Optional
+from chess.engine import PlayResult
+from lib.config import Configuration
+
+logger = logging.getLogger(__name__)
+
+
+class SearchProfiler:
+    """Profile chosen searches of one game and sum up the hot spots at the end of the game."""
+
+    def __init__(self, profiling_cfg: Configuration, game_id: str) -> None:
+        """
+        :param profiling_cfg: The `engine: profiling` section of the config.
+        :param game_id: The id of the game, used to name the profile files.
+        """
+        self.plies = set(profiling_cfg.plies)
+        self.min_time = float(profiling_cfg.min_time)
+        self.directory = profiling_cfg.directory
+        self.top = int(profiling_cfg.top)
+        self.game_id = game_id
+        self.stats: Optional[pstats.Stats] = None
+        self.profiled_plies: list[int] = []
+
+    def search(self, ply: int, search: Callable[[], PlayResult]) -> PlayResult:
+        """
+        Run a search, profiling it if it is one of the chosen plies or if searches over a time limit are saved.
+
+        :param ply: The number of the half-move being searched for, starting at 1.
+        :param search: Runs the search.
+        :return: The result of the search.
+        """
+        if ply not in self.plies and self.min_time <= 0:
+            return search()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            result = search()
+        finally:
+            profile.disable()
+        elapsed = time.perf_counter() - start
+        if ply in self.plies or elapsed >= self.min_time > 0:
+            self.save(profile, ply, elapsed)
+        return result
+
+    def save(self, profile: cProfile.Profile, ply: int, elapsed: float) -> None:
+        """Write the profile of one search and add it to the game's summary."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.game_id}-ply{ply}.pstats")
+        profile.dump_stats(path)
+        logger.info(f"Saved the profile of the {elapsed:.2f} second search at ply {ply} to {path}")
+        if self.stats is None:
+            self.stats = pstats.Stats(profile, stream=io.StringIO())
+        else:
+            self.stats.add(profile)
+        self.profiled_plies.append(ply)
+
+    def write_summary(self) -> Optional[str]:
+        """
+        Write the functions with the most cumulative time over all the profiled searches of the game.
+
+        :return: The path of the summary, or None if no search was profiled.
+        """
+        if self.stats is None:
+            return None
+        stream = io.StringIO()
+        stream.write(f"Game {self.game_id}: profiled plies {', '.join(map(str, self.profiled_plies))}\n")
+        self.stats.stream = stream  # type: ignore[attr-defined]
+        self.stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        path = os.path.join(self.directory, f"{self.game_id}-summary.txt")
+        with open(path, "w") as file:
+            file.write(stream.getvalue())
+        logger.info(f"Saved the profiling summary of game {self.game_id} to {path}")
+        return path
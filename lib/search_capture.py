@@ -0,0 +1,102 @@
+"""Capture the inputs of the engine's searches in real games, so they can be replayed offline with `engines.replay`."""
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import chess
+import chess.engine
+import chess.variant
+from dataclasses import dataclass
+from typing import Any, Optional
+from lib.config import Configuration
+from lib.types import MOVE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CapturedSearch:
+    """The inputs of one search, with what the engine answered and how long it took."""
+
+    game_id: str
+    ply: int  # The half-move searched for, starting at 1.
+    variant: str  # The UCI name of the variant.
+    chess960: bool
+    initial_fen: str
+    moves: list[str]  # UCI moves from the initial position.
+    limit: dict[str, Any]  # The fields of the `chess.engine.Limit` that are set.
+    ponder: bool
+    draw_offered: bool
+    root_moves: Optional[list[str]]  # UCI moves the search was restricted to, if any.
+    engine: str
+    config_hash: str
+    move: Optional[str]  # UCI.
+    seconds: float
+    nodes: Optional[int]
+
+    def board(self) -> chess.Board:
+        """Set up the position with its move history."""
+        board = chess.variant.find_variant(self.variant)(self.initial_fen, chess960=self.chess960)
+        for move in self.moves:
+            board.push_uci(move)
+        return board
+
+    def time_limit(self) -> chess.engine.Limit:
+        """Get the limit the search was given."""
+        return chess.engine.Limit(**self.limit)
+
+    def root_move_list(self) -> MOVE:
+        """Get the root moves in the form that `EngineWrapper.search` takes."""
+        if self.root_moves is None:
+            return chess.engine.PlayResult(None, None)
+        return [chess.Move.from_uci(move) for move in self.root_moves]
+
+
+def config_hash(engine_cfg: Configuration) -> str:
+    """Get a short hash of the engine config, to tell apart captures made with different settings."""
+    settings = {name: value for name, value in engine_cfg.config.items() if name != "capture"}
+    text = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def capture_search(board: chess.Board, game_id: str, limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+                   root_moves: MOVE, result: chess.engine.PlayResult, seconds: float,
+                   engine_cfg: Configuration) -> CapturedSearch:
+    """Describe a search that has just finished."""
+    root = board.root()
+    limit_fields = {name: value for name, value in dataclasses.asdict(limit).items()
+                    if value is not None and name != "clock_id"}
+    return CapturedSearch(game_id, len(board.move_stack) + 1, board.uci_variant or "chess", board.chess960, root.fen(),
+                          [move.uci() for move in board.move_stack], limit_fields, ponder, draw_offered,
+                          [move.uci() for move in root_moves] if isinstance(root_moves, list) else None,
+                          engine_cfg.name, config_hash(engine_cfg), result.move.uci() if result.move else None,
+                          round(seconds, 4), result.info.get("nodes"))
+
+
+def append_capture(capture_cfg: Configuration, search: CapturedSearch) -> None:
+    """
+    Append a search to the capture file as one line of JSON, if it took at least the `min_time` of the config.
+
+    :param capture_cfg: The `engine: capture` section of the config.
+    """
+    if search.seconds < float(capture_cfg.min_time):
+        return
+    directory = os.path.dirname(capture_cfg.path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(capture_cfg.path, "a") as file:
+        file.write(json.dumps(dataclasses.asdict(search)) + "\n")
+    logger.debug(f"Captured the search at ply {search.ply} of game {search.game_id} to {capture_cfg.path}")
+
+
+def read_captures(path: str) -> list[CapturedSearch]:
+    """Read a capture file. A last line cut off while it was written is skipped."""
+    searches = []
+    with open(path) as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+            if line.strip():
+                searches.append(CapturedSearch(**json.loads(line)))
+    return searches
@@ -12,6 +12,7 @@ MOVE = Union[PlayResult, list[Move]]
 CORRESPONDENCE_QUEUE_TYPE = Queue[str]
 LOGGING_QUEUE_TYPE = Queue[logging.LogRecord]
 REQUESTS_PAYLOAD_TYPE = dict[str, Union[str, int, bool]]
+ONLINE_REQUEST_TYPE = tuple[str, dict[str, Union[str, int]], bool]  # The path, parameters and stream flag of a request.
 GO_COMMANDS_TYPE = dict[str, str]
 EGTPATH_TYPE = dict[str, str]
 OPTIONS_GO_EGTB_TYPE = dict[str, Union[str, int, bool, None, EGTPATH_TYPE, GO_COMMANDS_TYPE]]
@@ -10,7 +10,7 @@ from queue import Queue
 from typing import Union, Optional, Generator
 from lib.timer import to_msec
 from lib.types import (UserProfileType, ChallengeType, REQUESTS_PAYLOAD_TYPE, GameType, OnlineType, PublicDataType,
-                       BackoffDetails)
+                       BackoffDetails, ONLINE_REQUEST_TYPE)
 
 
 logger = logging.getLogger(__name__)
@@ -241,6 +241,9 @@ class Lichess:
         """Isn't used in tests."""
         return {}
 
+    def prefetch_online_books(self, requests: list[ONLINE_REQUEST_TYPE]) -> None:
+        """Isn't used in tests."""
+
     def is_online(self, user_id: str) -> bool:
         """Return that a bot is online."""
         return True
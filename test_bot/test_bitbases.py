@@ -0,0 +1,38 @@
+"""Tests for the endgame bitbases."""
+import chess
+import os
+import pathlib
+from lib import bitbases
+from lib.config import Configuration
+from engines.maydan_engine import MaydanEngine
+
+
+def test_bitbases(tmp_path: pathlib.Path) -> None:
+    """Test that generated bitbases agree with python-chess and are used in MaydanEngine's search."""
+    directory = str(tmp_path)
+    bitbases.generate("KPK", directory)
+    assert sorted(os.listdir(directory)) == ["KPK.bin", "KQK.bin", "KRK.bin"]
+    for name in ["KPK", "KQK", "KRK"]:
+        bitbases.validate(name, directory, samples=500)
+
+    tables = bitbases.load_bitbases(directory)
+    assert tables is bitbases.load_bitbases(directory)
+    assert tables.probe_wdl(chess.Board("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")) == 2
+    assert tables.probe_wdl(chess.Board("4k3/8/8/8/8/8/4P3/4K3 b - - 0 1")) == 0
+    # The same endgame with the colors swapped.
+    assert tables.probe_wdl(chess.Board("4k3/4p3/8/8/8/8/8/4K3 b - - 0 1")) == 2
+    assert tables.probe_wdl(chess.Board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")) == 0
+    assert tables.probe_wdl(chess.Board("4k3/8/8/8/8/8/8/4KB2 w - - 0 1")) == 0
+    assert tables.probe_wdl(chess.Board("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1")) is None
+    assert tables.probe_wdl(chess.Board("4k3/8/8/8/8/8/8/1N2KB2 w - - 0 1")) is None
+
+    engine = MaydanEngine([], {"BitbasePath": directory}, None, Configuration({}))
+    try:
+        assert MaydanEngine.endgame_bitbases is tables
+        # Taking the rook reaches a won KRK ending.
+        board = chess.Board("8/8/8/3k4/8/1r6/8/KR6 w - - 0 1")
+        assert engine.search(board).move == chess.Move.from_uci("b1b3")
+        assert MaydanEngine.tablebase_probes > 0
+    finally:
+        MaydanEngine.endgame_bitbases = None
+        MaydanEngine.wdl_cache = {}
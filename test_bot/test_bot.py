@@ -16,11 +16,11 @@ import logging
 from multiprocessing import Manager
 from queue import Queue
 import test_bot.lichess
-from lib import config
+from lib import config, model
 from lib.timer import Timer, to_seconds, seconds
 from typing import Optional
 from lib.engine_wrapper import test_suffix
-from lib.types import CONFIG_DICT_TYPE
+from lib.types import CONFIG_DICT_TYPE, GameEventType
 if "pytest" not in sys.modules:
     sys.exit(f"The script {os.path.basename(__file__)} should only be run by pytest.")
 from lib import lichess_bot
@@ -345,3 +345,33 @@ def test_buggy_engine() -> None:
     assert win
     assert os.path.isfile(os.path.join(CONFIG["pgn_directory"],
                                        "bo vs b - zzzzzzzz.pgn"))
+
+
+def test_update_board() -> None:
+    """Test that new moves are pushed onto the board of the last update and that takebacks set the board up again."""
+    game_event: GameEventType = {
+        "id": "zzzzzzzz", "variant": {"key": "chess960", "name": "Chess960", "short": "960"}, "speed": "bullet",
+        "perf": {"name": "Bullet"}, "rated": False, "createdAt": 1700000000000,
+        "white": {"id": "c", "name": "c", "title": None, "rating": 2000},
+        "black": {"id": "b", "name": "b", "title": "BOT", "rating": 3000},
+        "initialFen": "bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9",
+        "clock": {"initial": 90000, "increment": 1000}, "type": "gameFull",
+        "state": {"type": "gameState", "moves": "", "wtime": 90000, "btime": 90000, "winc": 1000, "binc": 1000,
+                  "status": "started"}}
+    game = model.Game(game_event, "b", "https://lichess.org/", datetime.timedelta(seconds=30))
+    board = lichess_bot.update_board(chess.Board(), game)
+    assert board == chess.Board(game.initial_fen, chess960=True)
+
+    moves = ["e2e4", "d6d5", "e4d5", "e6d5"]
+    for ply in range(1, len(moves) + 1):
+        game.state["moves"] = " ".join(moves[:ply])
+        updated = lichess_bot.update_board(board, game)
+        assert (updated is board) == (ply > 1)  # A board without moves is always set up again.
+        board = updated
+        assert board.move_stack[-1].uci() == moves[ply - 1]
+    assert board == lichess_bot.setup_board(game)
+
+    game.state["moves"] = " ".join(moves[:2] + ["h2h3"])  # A takeback and a different move.
+    updated = lichess_bot.update_board(board, game)
+    assert updated is not board and [move.uci() for move in updated.move_stack] == moves[:2] + ["h2h3"]
+    assert updated == lichess_bot.setup_board(game)
@@ -1,8 +1,12 @@
 """Test the functions that get the external moves."""
 import backoff
+import json
 import requests
+import requests.adapters
 import yaml
 import os
+import pathlib
+import time
 import chess
 import logging
 import test_bot.lichess
@@ -12,11 +16,12 @@ from copy import deepcopy
 from requests.exceptions import ConnectionError, HTTPError, ReadTimeout
 from http.client import RemoteDisconnected
 from lib.types import OnlineType, GameEventType
-from typing import Optional, Union, cast
+from typing import Any, Optional, Union, cast
 from lib.lichess import is_final, backoff_handler, Lichess
 from lib.config import Configuration, insert_default_values
 from lib.model import Game
-from lib.engine_wrapper import get_online_move, get_book_move
+from lib.online_cache import OnlineCache
+from lib.engine_wrapper import get_online_move, get_book_move, likely_replies, online_requests
 LICHESS_TYPE = Union[Lichess, test_bot.lichess.Lichess]
 
 
@@ -48,6 +53,48 @@ class MockLichess(Lichess):
         return online_book_get()
 
 
+class CannedAdapter(requests.adapters.BaseAdapter):
+    """Answer requests to online sources with fixed answers instead of going online."""
+
+    def __init__(self, answers: dict[str, OnlineType], delays: Optional[dict[str, float]] = None) -> None:
+        """
+        :param answers: The answer for each url, without its parameters.
+        :param delays: How many seconds to wait before answering requests to some urls.
+        """
+        super().__init__()
+        self.answers = answers
+        self.delays = delays or {}
+        self.urls: list[str] = []
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, timeout: Any = None, verify: Any = True,
+             cert: Any = None, proxies: Any = None) -> requests.Response:
+        """Answer a request."""
+        url = str(request.url)
+        path = url.split("?")[0]
+        self.urls.append(url)
+        time.sleep(self.delays.get(path, 0))
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = json.dumps(self.answers[path]).encode()
+        return response
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+
+class OfflineLichess(Lichess):
+    """A Lichess class whose online sources give fixed answers."""
+
+    def __init__(self, adapter: CannedAdapter, online_cache: Optional[OnlineCache] = None) -> None:
+        """Initialize only what getting online moves needs."""
+        self.max_retries = 1
+        self.other_session = requests.Session()
+        self.other_session.mount("https://", adapter)
+        self.prefetched_responses = {}
+        self.online_cache = online_cache
+
+
 def get_configs() -> tuple[Configuration, Configuration, Configuration, Configuration]:
     """Create the configs used for the tests."""
     with open("./config.yml.default") as file:
@@ -169,3 +216,64 @@ def test_external_moves() -> None:
 
     # Test opening book.
     assert get_book_move(chess.Board(opening_fen), game, polyglot_cfg).move == chess.Move.from_uci("h4f6")
+
+
+def test_prefetch_online_moves() -> None:
+    """Test that answers prefetched for the opponent's likely reply are used instead of asking the online source again."""
+    adapter = CannedAdapter({"https://lichess.org/api/cloud-eval": {"depth": 30, "knodes": 5000,
+                                                                    "pvs": [{"moves": "g1f3 b8c6", "cp": 30}]}})
+    li = OfflineLichess(adapter)
+    game = get_game()
+    online_cfg, _, draw_or_resign_cfg, _ = get_configs()
+    polyglot_cfg = Configuration({"enabled": False})
+
+    board = chess.Board()
+    board.push_uci("e2e4")
+    expected_reply = chess.Move.from_uci("e7e5")
+    result = chess.engine.PlayResult(chess.Move.from_uci("e2e4"), expected_reply)
+    assert likely_replies(board, result, polyglot_cfg, 2) == [expected_reply]
+
+    board.push(expected_reply)
+    requests = online_requests(board, game, online_cfg)
+    assert [path for path, _, _ in requests] == ["https://lichess.org/api/cloud-eval"]  # Too many pieces for the egtb.
+    li.prefetch_online_books(requests + requests)
+    assert len(adapter.urls) == 1
+
+    move = get_online_move_wrapper(li, board, game, online_cfg, draw_or_resign_cfg)
+    assert move.move == chess.Move.from_uci("g1f3") and len(adapter.urls) == 1
+    get_online_move_wrapper(li, board, game, online_cfg, draw_or_resign_cfg)
+    assert len(adapter.urls) == 2  # Each prefetched answer is used once.
+
+
+def test_online_books_deadline() -> None:
+    """Test that the online books are asked at the same time and that a book that answers too late is not waited for."""
+    chessdb_url = "https://www.chessdb.cn/cdb.php"
+    answers: dict[str, OnlineType] = {chessdb_url: {"status": "ok", "move": "d2d4"},
+                                      "https://lichess.org/api/cloud-eval": {"depth": 30, "knodes": 5000,
+                                                                             "pvs": [{"moves": "e2e4 e7e5", "cp": 30}]}}
+    game = get_game()
+    _, online_cfg, draw_or_resign_cfg, _ = get_configs()  # chessdb and the cloud analysis are enabled.
+    board = chess.Board()
+    move = get_online_move_wrapper(OfflineLichess(CannedAdapter(answers)), board, game, online_cfg, draw_or_resign_cfg)
+    assert move.move == chess.Move.from_uci("d2d4")  # chessdb comes first.
+
+    online_cfg.config["max_wait"] = 0.5
+    li = OfflineLichess(CannedAdapter(answers, {chessdb_url: 2}))
+    start = time.monotonic()
+    move = get_online_move_wrapper(li, board, game, online_cfg, draw_or_resign_cfg)
+    assert move.move == chess.Move.from_uci("e2e4") and time.monotonic() - start < 1.5
+
+
+def test_online_cache_is_used(tmp_path: pathlib.Path) -> None:
+    """Test that an answer kept by another game is used instead of asking the online source again."""
+    adapter = CannedAdapter({"https://lichess.org/api/cloud-eval": {"depth": 30, "knodes": 5000,
+                                                                    "pvs": [{"moves": "e2e4 e7e5", "cp": 30}]}})
+    game = get_game()
+    online_cfg, _, draw_or_resign_cfg, _ = get_configs()
+    cache_cfg = online_cfg.cache | {"enabled": True, "path": str(tmp_path / "responses.sqlite3")}
+    for game_number in range(2):
+        li = OfflineLichess(adapter, OnlineCache(cache_cfg))
+        move = get_online_move_wrapper(li, chess.Board(), game, online_cfg, draw_or_resign_cfg)
+        assert move.move == chess.Move.from_uci("e2e4")
+    assert len(adapter.urls) == 1
+    assert OnlineCache(cache_cfg).stats()["lichess_cloud_analysis"]["hits"] == 1
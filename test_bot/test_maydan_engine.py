@@ -0,0 +1,573 @@
+"""Tests for MaydanEngine's search board and evaluation."""
+import random
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import chess.syzygy
+import json
+import numpy as np
+import os
+import pathlib
+import pytest
+import yaml
+from engines import (maydan_engine, batch_analysis, bench, book_builder, datagen, epd_runner, eval_tables, mate_solver, nnue,
+                     nnue_trainer, perft, pgn_annotator, replay, texel_tuner, tournament)
+from engines.maydan_engine import MaydanEngine, SearchBoard
+from lib.config import Configuration, insert_default_values
+from lib.search_capture import append_capture, capture_search, config_hash, read_captures
+from typing import Any, Optional, cast
+
+
+def assert_activity_matches_refresh(board: SearchBoard) -> None:
+    """Check that the incrementally updated sums equal a from-scratch computation."""
+    expected = board.copy(stack=False)
+    expected.refresh()
+    assert (board.mg_activity, board.eg_activity, board.phase) == (expected.mg_activity, expected.eg_activity,
+                                                                   expected.phase)
+    assert board.piece_key == expected.piece_key
+    if MaydanEngine.network is not None:
+        assert board.accumulator is not None and expected.accumulator is not None
+        assert np.array_equal(board.accumulator, expected.accumulator)
+    assert board.zobrist_key() == chess.polyglot.zobrist_hash(board)
+
+
+def random_walk(board: SearchBoard, plies: int, rng: random.Random) -> None:
+    """Play random moves, checking the incremental sums after every push and pop."""
+    for _ in range(plies):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        before = (board.mg_activity, board.eg_activity, board.phase)
+        move = rng.choice(moves)
+        board.push(move)
+        assert_activity_matches_refresh(board)
+        board.pop()
+        assert (board.mg_activity, board.eg_activity, board.phase) == before
+        board.push(move)
+
+
+def test_incremental_activity() -> None:
+    """Test castling, en passant, promotions and captures against a full recomputation."""
+    rng = random.Random(2024)
+    fens = [chess.STARTING_FEN,
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+            "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+            "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"]
+    for fen in fens:
+        for _ in range(20):
+            random_walk(SearchBoard(fen), 60, rng)
+
+    for scharnagl in (0, 518, 959):
+        board = SearchBoard.from_chess960_pos(scharnagl)
+        board.refresh()
+        random_walk(board, 60, rng)
+
+
+def test_phase() -> None:
+    """Test the game phase at the start, after a capture and in a pawn ending."""
+    board = SearchBoard()
+    assert board.phase == maydan_engine.TOTAL_PHASE
+    for move in ["e2e4", "d7d5", "e4d5", "d8d5", "b1c3", "d5a2", "a1a2"]:
+        board.push_uci(move)
+    assert board.phase == maydan_engine.TOTAL_PHASE - 4
+    assert SearchBoard("4k3/4p3/8/8/8/8/4P3/4K3 w - - 0 1").phase == 0
+
+
+def test_from_board_keeps_history() -> None:
+    """Test that converting a board keeps its move stack and sums."""
+    board = chess.Board()
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8", "g1f3", "g8f6", "f3g1", "f6g8"]:
+        board.push_uci(move)
+    search_board = SearchBoard.from_board(board)
+    assert search_board.can_claim_threefold_repetition()
+    assert search_board.move_stack == board.move_stack
+    assert_activity_matches_refresh(search_board)
+
+
+def test_table_bundle() -> None:
+    """Test that the shipped bundle matches the editable tables and is only mapped once."""
+    bundle = eval_tables.map_bundle()
+    assert bundle.dtype == np.int16
+    assert np.array_equal(bundle, eval_tables.pack_tables())
+    assert eval_tables.map_bundle() is bundle
+    assert eval_tables.activity_tables() is eval_tables.activity_tables()
+    king_table = np.load(os.path.join(eval_tables.TABLE_DIR, "king_activity_table.npy"))
+    assert bundle[eval_tables.MIDDLEGAME, int(chess.WHITE), chess.KING, chess.G1] == king_table[7][6]
+    assert bundle[eval_tables.MIDDLEGAME, int(chess.BLACK), chess.KING, chess.G8] == -king_table[7][6]
+
+
+def test_eval_cache() -> None:
+    """Test that cached evaluations are reused and match the uncached heuristic for both sides."""
+    cache = maydan_engine.EvalCache(1)
+    assert cache.mask + 1 == 2 ** 16
+    MaydanEngine.eval_cache = cache
+    try:
+        board = SearchBoard("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        for maximizer in (1, -1):
+            MaydanEngine.maximizer = maximizer
+            expected = maydan_engine.heuristic(board)
+            assert maydan_engine.evaluate(board) == expected
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        MaydanEngine.eval_cache = None
+        MaydanEngine.maximizer = 1
+
+
+def test_network_accumulator(tmp_path: pathlib.Path) -> None:
+    """Test that the incrementally updated accumulators equal a from-scratch computation."""
+    network_path = os.path.join(tmp_path, "random.nnue")
+    nnue.random_network(network_path, accumulator_size=16, hidden_size=8)
+    network = nnue.load_network(network_path)
+    assert (network.accumulator_size, network.hidden_size) == (16, 8)
+    MaydanEngine.network = network
+    try:
+        rng = random.Random(30)
+        for fen in ["r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                    "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1",
+                    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"]:
+            for _ in range(5):
+                random_walk(SearchBoard(fen), 40, rng)
+        board = SearchBoard.from_chess960_pos(959)
+        board.refresh()
+        random_walk(board, 40, rng)
+
+        board = SearchBoard()
+        MaydanEngine.maximizer = -1
+        assert maydan_engine.heuristic(board) == -network.evaluate(network.new_accumulator(board), chess.WHITE)
+        mirrored = SearchBoard(board.mirror().fen())
+        assert board.accumulator is not None and mirrored.accumulator is not None
+        assert network.evaluate(mirrored.accumulator, mirrored.turn) == pytest.approx(
+            -network.evaluate(board.accumulator, board.turn))
+    finally:
+        MaydanEngine.network = None
+        MaydanEngine.maximizer = 1
+
+
+def test_network_file(tmp_path: pathlib.Path) -> None:
+    """Test that files that are not networks are rejected."""
+    bad_path = os.path.join(tmp_path, "bad.nnue")
+    with open(bad_path, "wb") as bad_file:
+        bad_file.write(bytes(nnue.HEADER.size))
+    with pytest.raises(ValueError):
+        nnue.Network(bad_path)
+
+
+def test_network_overflow(tmp_path: pathlib.Path) -> None:
+    """Test that weights that can overflow the int16 accumulators are rejected."""
+    feature_weights = np.zeros((nnue.NUM_FEATURES, 4), dtype=np.int16)
+    feature_weights[0, 0] = 2000
+    with pytest.raises(ValueError):
+        nnue.write_network(os.path.join(tmp_path, "overflow.nnue"), feature_weights, np.zeros(4, dtype=np.int16),
+                           np.zeros((8, 2), dtype=np.float32), np.zeros(2, dtype=np.float32),
+                           np.zeros(2, dtype=np.float32), 0.0)
+
+
+def test_network_trainer(tmp_path: pathlib.Path) -> None:
+    """Test that the trainer's features match the engine's, that it learns, and that its output loads."""
+    rng = random.Random(31)
+    lines = []
+    for _ in range(200):
+        board = chess.Board()
+        for _ in range(rng.randrange(60)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        material = sum(len(board.pieces(piece_type, chess.WHITE)) - len(board.pieces(piece_type, chess.BLACK))
+                       for piece_type in range(chess.PAWN, chess.KING))
+        lines.append(f"{board.fen()};{material};{1 if material > 0 else 0 if material < 0 else 0.5}")
+    data_path = os.path.join(tmp_path, "data.txt")
+    with open(data_path, "w") as data_file:
+        data_file.write("\n".join(lines))
+
+    chunk = next(nnue_trainer.read_text_chunks(data_path, 1000))
+    assert len(chunk) == len(lines)
+    for perspective in chess.COLORS:
+        features = nnue_trainer.chunk_features(chunk.pieces, perspective)
+        for line, row in zip(lines, features):
+            expected = sorted(nnue.board_features(chess.Board(line.split(";")[0]), perspective))
+            assert list(row[:len(expected)]) == expected
+            assert all(row[len(expected):] == nnue_trainer.PADDING)
+
+    network_path = os.path.join(tmp_path, "trained.nnue")
+    trainer = nnue_trainer.Trainer(accumulator_size=8, hidden_size=4, learning_rate=1e-2)
+    white = nnue_trainer.chunk_features(chunk.pieces, chess.WHITE)
+    black = nnue_trainer.chunk_features(chunk.pieces, chess.BLACK)
+    own = np.where(chunk.white_to_move[:, None], white, black)
+    other = np.where(chunk.white_to_move[:, None], black, white)
+    target = trainer.targets(chunk.score, chunk.result, chunk.white_to_move)
+    first_loss = trainer.step(own, other, target)
+    for _ in range(50):
+        last_loss = trainer.step(own, other, target)
+    assert last_loss < first_loss
+
+    nnue_trainer.train(data_path, network_path, epochs=1, batch_size=64, trainer=trainer)
+    network = nnue.Network(network_path)
+    board = chess.Board(lines[0].split(";")[0])
+    scores, _ = trainer.forward(own[:1], other[:1])
+    white_score = float(scores[0]) if board.turn == chess.WHITE else -float(scores[0])
+    assert network.evaluate(network.new_accumulator(board), board.turn) == pytest.approx(white_score, abs=0.05)
+
+
+class CountingTablebase:
+    """Tablebases that know one ending: without its rook, black is lost."""
+
+    def __init__(self) -> None:
+        """Start with no probes."""
+        self.probed: list[str] = []
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        """Score the position for the side to move and remember it."""
+        self.probed.append(board.fen())
+        if board.pieces(chess.ROOK, chess.BLACK):
+            raise KeyError("Missing table")
+        return -2 if board.turn == chess.BLACK else 2
+
+
+def test_tablebase_probing(tmp_path: pathlib.Path) -> None:
+    """Test that the search probes the tablebases only after captures down to the limit, and only once per position."""
+    assert maydan_engine.open_tablebase(str(tmp_path)) is maydan_engine.open_tablebase(str(tmp_path))
+    tablebase = CountingTablebase()
+    MaydanEngine.tablebase = cast(chess.syzygy.Tablebase, tablebase)
+    MaydanEngine.syzygy_probe_limit = 4
+    MaydanEngine.wdl_cache = {}
+    try:
+        board = chess.Board("r3k3/7p/8/8/8/8/8/R5K1 w - - 0 1")
+        engine = MaydanEngine([], {}, None, Configuration({}))
+        MaydanEngine.tablebase = cast(chess.syzygy.Tablebase, tablebase)
+        assert engine.search(board).move == chess.Move.from_uci("a1a8")
+        assert tablebase.probed
+        assert len(tablebase.probed) == len(set(tablebase.probed))
+        assert all(chess.popcount(chess.Board(fen).occupied) <= 4 for fen in tablebase.probed)
+        assert MaydanEngine.tablebase_hits > 0
+    finally:
+        MaydanEngine.tablebase = None
+        MaydanEngine.syzygy_probe_limit = 7
+        MaydanEngine.wdl_cache = {}
+
+
+def test_mate_solver() -> None:
+    """Test that the mate solver proves mates, gives the longest defense, and stays within its table size."""
+    board = chess.Board("r5rk/5p1p/5R2/4B3/8/8/7P/7K w - - 0 1")
+    solver = mate_solver.MateSolver(max_nodes=10_000, table_entries=200)
+    mating_line = solver.solve(board)
+    assert mating_line is not None
+    assert board.variation_san(mating_line) == "1. Ra6+ f6 2. Bxf6+ Rg7 3. Rxa8#"
+    assert len(solver.table) <= 200
+    assert mate_solver.solve_mate(chess.Board(), max_nodes=500) is None
+
+    engine = MaydanEngine([], {"MateSolverNodes": 10_000}, None, Configuration({}))
+    result = engine.search(chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"))
+    assert result.move == chess.Move.from_uci("d1d8")
+    assert result.info["pv"] == [chess.Move.from_uci("d1d8")]
+    assert result.info["score"].white() == chess.engine.Mate(1)
+
+
+def test_bench() -> None:
+    """Test that the bench gives the same node signature every run and catches a slower search."""
+    fens = bench.BENCH_POSITIONS[:2] + bench.BENCH_POSITIONS[-2:]
+    result = bench.run_bench(depth=2, fens=fens)
+    assert len(result.positions) == 4
+    assert all(len(position.time_to_depth) == 2 for position in result.positions)
+    assert result.nodes > 0
+    assert bench.run_bench(depth=2, fens=fens).nodes == result.nodes
+
+    baseline = result.to_json()
+    assert bench.compare(result, baseline) == []
+    baseline["nps"] = result.nps * 2
+    assert len(bench.compare(result, baseline, threshold=0.1)) == 1
+    assert bench.compare(result, baseline, threshold=0.6) == []
+    with pytest.raises(ValueError):
+        bench.compare(bench.BenchResult(depth=3), baseline)
+
+
+def test_perft() -> None:
+    """Test that the perft counts of both board classes match the known counts, split across processes or not."""
+    assert perft.run_suite(max_nodes=3000) == []
+    kiwipete = perft.PERFT_SUITE[1].fen
+    counts = perft.divide(kiwipete, 2, "search", processes=2)
+    assert len(counts) == 48
+    assert counts == perft.divide(kiwipete, 2, "chess")
+    assert sum(counts.values()) == 2039
+    assert perft.perft(SearchBoard(kiwipete), 3) == 97862
+
+
+def homemade_config(name: str, options: Optional[dict[str, Any]] = None) -> Configuration:
+    """Create a bot config that plays with a homemade engine."""
+    with open("./config.yml.default") as file:
+        raw_config = yaml.safe_load(file)
+    insert_default_values(raw_config)
+    raw_config["engine"] |= {"protocol": "homemade", "name": name, "homemade_options": options or {}}
+    return Configuration(raw_config)
+
+
+def test_epd_runner(tmp_path: pathlib.Path) -> None:
+    """Test that the EPD runner scores bm and am positions and writes its results."""
+    epd_path = tmp_path / "suite.epd"
+    epd_path.write_text("# A mate in one and a defended pawn.\n"
+                        '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - bm Rd8#; id "back rank";\n'
+                        '4k3/8/2p5/3p4/8/8/8/3QK3 w - - am Qxd5; id "defended pawn";\n'
+                        "4k3/8/8/8/8/8/8/4K3 w - -\n")
+    positions = epd_runner.read_epd(str(epd_path))
+    assert [position.id for position in positions] == ["back rank", "defended pawn"]
+    assert positions[0].best_moves == ["d1d8"]
+    assert positions[1].avoid_moves == ["d1d5"]
+
+    config = homemade_config("MaydanEngine", {"BitbasePath": ""})
+    results = epd_runner.run_suite(positions, config, chess.engine.Limit(depth=2), processes=2)
+    assert [result.solved for result in results] == [True, True]
+    assert all(result.depth == 2 for result in results)
+    assert results[0].move == "d1d8"
+    assert results[0].nodes_to_solution == 0  # Found at depth 1.
+
+    epd_runner.write_csv(results, str(tmp_path / "results.csv"))
+    epd_runner.write_json(results, str(tmp_path / "results.json"))
+    assert (tmp_path / "results.csv").read_text().startswith("id,fen,best_moves,avoid_moves,move,solved")
+    assert "defended pawn" in (tmp_path / "results.json").read_text()
+
+
+def test_tournament(tmp_path: pathlib.Path) -> None:
+    """Test the match statistics and a short match with games saved as PGN."""
+    score = tournament.MatchScore(wins=30, draws=40, losses=30)
+    elo, margin = score.elo()
+    assert elo == pytest.approx(0)
+    assert 40 < margin < 60
+    assert score.llr(0, 5) < 0
+    lower, upper = tournament.sprt_bounds(0.05, 0.05)
+    assert lower == pytest.approx(-upper) == pytest.approx(-2.944, abs=1e-3)
+    assert tournament.MatchScore(wins=300, draws=100, losses=100).llr(0, 5) > upper
+    assert tournament.MatchScore(wins=100, draws=100, losses=300).llr(0, 5) < lower
+    assert tournament.MatchScore(wins=2).elo() == (float("inf"), float("inf"))
+
+    openings_path = tmp_path / "openings.epd"
+    openings_path.write_text("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq -\n"
+                             "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2\n")
+    openings = tournament.read_openings(str(openings_path))
+    assert len(openings) == 2
+    configs = (homemade_config("Alphabetical"), homemade_config("FirstMove"))
+    pgn_directory = tmp_path / "games"
+    score = tournament.run_match(configs, openings, tournament.TimeControl(60, 0), rounds=2, processes=2,
+                                 pgn_directory=str(pgn_directory), max_plies=10)
+    assert score.games == 4
+    assert sorted(os.listdir(pgn_directory)) == [f"round{number}.pgn" for number in range(1, 5)]
+    assert '[White "Alphabetical"]' in (pgn_directory / "round1.pgn").read_text()
+    assert '[Black "Alphabetical"]' in (pgn_directory / "round2.pgn").read_text()
+
+
+def test_datagen(tmp_path: pathlib.Path) -> None:
+    """Test that positions survive packing, and that self-play shards load without copying and can be trained on."""
+    boards = [chess.Board(), chess.Board("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K1R1 b Qk - 3 10"),
+              chess.Board("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3")]
+    records = np.array([datagen.pack_position(board, 1.5, False) for board in boards], dtype=datagen.RECORD)
+    assert records.itemsize == 32
+    assert [datagen.unpack_board(record).fen() for record in records] == [board.fen() for board in boards]
+    assert list(records["score"]) == [150, 150, 150]
+    pieces = datagen.unpack_pieces(records)
+    assert list(pieces[0][:8]) == [nnue_trainer.PIECE_CODES[symbol] for symbol in "RNBQKBNR"]
+    assert datagen.pack_position(chess.Board(), float("-inf"), True)["score"] == -datagen.MAX_SCORE
+
+    directory = tmp_path / "data"
+    positions = datagen.run(str(directory), games=2, limit=chess.engine.Limit(depth=1), processes=2, shard_size=40)
+    shards = [datagen.load_shard(path) for path in datagen.shard_paths(str(directory))]
+    assert len(shards) > 2
+    assert sum(len(shard) for shard in shards) == positions
+    assert not shards[0].flags.writeable and not shards[0].flags.owndata
+    assert set(np.concatenate(shards)["result"]) <= {-1, 0, 1}
+    chunks = list(nnue_trainer.read_shard_chunks(str(directory), 1000))
+    assert sum(len(chunk) for chunk in chunks) == positions
+    assert all(((chunk.result == 0) | (chunk.result == 0.5) | (chunk.result == 1)).all() for chunk in chunks)
+
+
+def test_texel_tuner(tmp_path: pathlib.Path) -> None:
+    """Test that the tuner evaluates like the engine, skips noisy positions, learns, and exports tables that load."""
+    rng = random.Random(41)
+    boards, results = [], []
+    for _ in range(300):
+        board = chess.Board()
+        for _ in range(rng.randrange(80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        material = sum(len(board.pieces(piece_type, chess.WHITE)) - len(board.pieces(piece_type, chess.BLACK))
+                       for piece_type in range(chess.PAWN, chess.KING))
+        boards.append(board)
+        results.append(1 if material > 0 else -1 if material < 0 else 0)
+    records = np.array([datagen.pack_position(board, 0, noisy=index % 3 == 0) for index, board in enumerate(boards)],
+                       dtype=datagen.RECORD)
+    records["result"] = results
+    (tmp_path / "data").mkdir()
+    datagen.write_shard(str(tmp_path / "data" / "positions.bin"), records)
+    quiet = [index for index, board in enumerate(boards) if index % 3 and not board.is_check()]
+    features = texel_tuner.read_positions(str(tmp_path / "data"), chunk_size=100)
+    assert len(features) == len(quiet)
+    assert list(features.result) == [(results[index] + 1) / 2 for index in quiet]
+
+    tables, piece_values = texel_tuner.load_weights()
+    MaydanEngine.maximizer = 1  # The heuristic is then from white's point of view, like the tuner's.
+    engine_values = [100 * maydan_engine.heuristic(SearchBoard(boards[index].fen())) for index in quiet]
+    assert texel_tuner.evaluate(features, tables, piece_values) == pytest.approx(engine_values)
+
+    scale = texel_tuner.fit_scale(features, texel_tuner.evaluate(features, tables, piece_values))
+    first_loss = texel_tuner.loss(features, texel_tuner.evaluate(features, tables, piece_values), scale)
+    tables, piece_values = texel_tuner.tune(features, tables, piece_values, scale, epochs=50, learning_rate=5,
+                                            report_every=0)
+    tuned = texel_tuner.evaluate(features, tables, piece_values)
+    assert texel_tuner.loss(features, tuned, scale) < first_loss
+    assert piece_values[chess.KING - 1] == 0
+
+    bundle_path = texel_tuner.write_tables(texel_tuner.export_tables(tables, piece_values), str(tmp_path / "tables"))
+    saved_tables = MaydanEngine.mg_activity_table, MaydanEngine.eg_activity_table
+    try:
+        MaydanEngine.mg_activity_table, MaydanEngine.eg_activity_table = eval_tables.activity_tables(bundle_path)
+        exported = [100 * maydan_engine.heuristic(SearchBoard(boards[index].fen())) for index in quiet]
+    finally:
+        MaydanEngine.mg_activity_table, MaydanEngine.eg_activity_table = saved_tables
+    assert np.abs(np.array(exported) - tuned).max() <= 16  # Rounding the 32 pieces' entries moves a score by 16 at most.
+
+    lines = [f"{boards[index].fen()};0;{(results[index] + 1) / 2}" for index in quiet]
+    (tmp_path / "data.txt").write_text("\n".join(lines))
+    assert texel_tuner.main([str(tmp_path / "data.txt"), "--epochs", "2", "--output", str(tmp_path / "cli")]) == 0
+    assert eval_tables.map_bundle(str(tmp_path / "cli" / "activity_tables.bin")).shape == eval_tables.BUNDLE_SHAPE
+
+
+def test_batch_analysis(tmp_path: pathlib.Path) -> None:
+    """Test that results come in input order from several workers and that an interrupted run is resumed."""
+    input_path = tmp_path / "positions.epd"
+    input_path.write_text("# Two FENs and two EPDs.\n"
+                          f"{chess.STARTING_FEN}\n"
+                          '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - id "back rank";\n'
+                          "4k3/8/2p5/3p4/8/8/8/3QK3 w - -\n"
+                          "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1\n")
+    positions = batch_analysis.read_positions(str(input_path))
+    assert [(position.index, position.id) for position in positions] == [(0, "2"), (1, "back rank"), (2, "4"), (3, "5")]
+
+    config = homemade_config("MaydanEngine", {"BitbasePath": ""})
+    limit = chess.engine.Limit(depth=2)
+    output_path = tmp_path / "results.ndjson"
+    assert batch_analysis.run(str(input_path), str(output_path), config, limit, processes=2) == 4
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert results[1]["move"] == "d1d8" and results[1]["mate"] == 1
+    assert results[2]["score"] > 500 and results[2]["depth"] == 2
+    assert results[3]["move"] is None and results[3]["score"] is None  # Stalemate.
+
+    lines = output_path.read_text().splitlines(keepends=True)
+    output_path.write_text("".join(lines[:2]) + lines[2][:10])  # Interrupted while writing the third result.
+    assert batch_analysis.run(str(input_path), str(output_path), config, limit, processes=1) == 2
+    resumed = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [result | {"seconds": 0} for result in resumed] == [result | {"seconds": 0} for result in results]
+
+    config_path = tmp_path / "config.yml"
+    config_path.write_text(yaml.safe_dump(config.config))
+    csv_path = tmp_path / "results.csv"
+    assert batch_analysis.main([str(input_path), str(csv_path), "--depth", "1", "--processes", "1",
+                                "--config", str(config_path)]) == 0
+    csv_lines = csv_path.read_text().splitlines()
+    assert csv_lines[0].startswith("index,id,fen,move,score,mate,pv")
+    assert batch_analysis.completed_indexes(str(csv_path)) == {0, 1, 2, 3}
+
+
+def test_pgn_annotator(tmp_path: pathlib.Path) -> None:
+    """Test that every unannotated position gets an evaluation, the bot's are kept, and re-runs skip old games."""
+    games: list[chess.pgn.Game] = []
+    for moves in (["e2e4", "e7e5", "g1f3", "b8c6"], ["d2d4", "d7d5"], ["f2f3", "e7e5", "g2g4", "d8h4"]):
+        game = chess.pgn.Game()
+        game.headers["Round"] = str(len(games) + 1)
+        node: chess.pgn.GameNode = game
+        for move in moves:
+            node = node.add_main_variation(chess.Move.from_uci(move))
+        games.append(game)
+    # The bot's own analysis of its first move, laid out like lib.lichess_bot writes it.
+    bot_line = games[0].add_line([chess.Move.from_uci("e2e4"), chess.Move.from_uci("c7c5")])
+    bot_line.set_eval(chess.engine.PovScore(chess.engine.Cp(30), chess.WHITE), 20)
+    (tmp_path / "games").mkdir()
+    (tmp_path / "games" / "bot games.pgn").write_text("\n\n".join(str(game) for game in games[:2]) + "\n\n")
+    (tmp_path / "games" / "mate.pgn").write_text(str(games[2]) + "\n\n")
+
+    config = homemade_config("MaydanEngine", {"BitbasePath": ""})
+    output = tmp_path / "annotated"
+    limit = chess.engine.Limit(depth=1)
+    assert pgn_annotator.run([str(tmp_path / "games")], str(output), config, limit, processes=2) == 3
+    with open(output / "bot games.pgn") as file:
+        annotated = [chess.pgn.read_game(file), chess.pgn.read_game(file)]
+    assert [cast(chess.pgn.Game, game).headers["Round"] for game in annotated] == ["1", "2"]
+    first = cast(chess.pgn.Game, annotated[0])
+    assert first.headers["Annotator"] == "MaydanEngine"
+    assert len(first.variations) == 2  # The bot's line was kept and not analysed again.
+    assert first.variations[1].next().eval().white() == chess.engine.Cp(30)  # type: ignore[union-attr]
+    for node in first.mainline():
+        assert pgn_annotator.is_annotated(node)
+    with open(output / "mate.pgn") as file:
+        mate_game = cast(chess.pgn.Game, chess.pgn.read_game(file))
+    before_mate = mate_game.end().parent
+    assert before_mate.variations[-1].eval().black().mate() == 1  # type: ignore[union-attr]
+
+    assert pgn_annotator.run([str(tmp_path / "games")], str(output), config, limit, processes=1) == 0
+    with open(tmp_path / "games" / "mate.pgn", "a") as file:
+        file.write(str(games[1]) + "\n\n")
+    assert pgn_annotator.run([str(tmp_path / "games" / "mate.pgn")], str(output), config, limit, processes=1) == 1
+    assert (output / "mate.pgn").read_text().count("[Annotator ") == 2
+
+
+def test_book_builder(tmp_path: pathlib.Path) -> None:
+    """Test that books read back with python-chess, that chunking changes nothing, and that books merge."""
+    games = [("1-0", "", "1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O Nf6"), ("0-1", "", "1. e4 c5 2. Nf3 (2. Nc3 d6) 2... d6"),
+             ("1/2-1/2", "", "1. d4 d5"), ("*", "", "1. e4 e5"), ("1-0", "", "1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O d6"),
+             ("1-0", '[SetUp "1"]\n[FEN "8/P6k/8/8/8/8/8/K7 w - - 0 1"]\n', "1. a8=Q Kg6")]
+    pgn_path = tmp_path / "games.pgn"
+    pgn_path.write_text("".join(f'[Event "Game {index}"]\n[Result "{result}"]\n{setup}\n{moves} {result}\n\n'
+                                for index, (result, setup, moves) in enumerate(games)))
+    assert len(book_builder.game_offsets(str(pgn_path), chunk_size=30)) == len(games)
+
+    counts, game_count = book_builder.build([str(pgn_path)], max_plies=8)
+    chunked, _ = book_builder.build([str(pgn_path)], max_plies=8, processes=2, chunk_size=30)
+    assert game_count == len(games)
+    for field in ("keys", "moves", "weights", "games"):
+        assert np.array_equal(getattr(counts, field), getattr(chunked, field))
+
+    book_path = str(tmp_path / "book.bin")
+    assert book_builder.write_book(counts, book_path) == len(counts)
+    castled = chess.Board("r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4")
+    with chess.polyglot.open_reader(book_path) as reader:
+        assert [(entry.move.uci(), entry.weight, entry.learn) for entry in reader.find_all(chess.Board())] == [
+            ("e2e4", 4, 3), ("d2d4", 1, 1)]  # Two wins and a loss, and a draw. The game without a result is left out.
+        assert [entry.move.uci() for entry in reader.find_all(castled)] == ["e1g1"]
+        assert reader.find(chess.Board("8/P6k/8/8/8/8/8/K7 w - - 0 1")).move.uci() == "a7a8q"
+        assert reader.find(chess.Board("Q7/7k/8/8/8/8/8/K7 b - - 0 1"), minimum_weight=0).move.uci() == "h7g6"
+
+    merged_path = str(tmp_path / "merged.bin")
+    assert book_builder.main([merged_path, "--merge", book_path, book_path, "--min-games", "3"]) == 0
+    with chess.polyglot.open_reader(merged_path) as reader:
+        assert [(entry.move.uci(), entry.weight, entry.learn) for entry in reader.find_all(chess.Board())] == [
+            ("e2e4", 8, 6)]
+
+
+def test_replay(tmp_path: pathlib.Path) -> None:
+    """Test that captured searches are run again and compared with what was captured."""
+    config = homemade_config("MaydanEngine", {"BitbasePath": ""})
+    board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+    captured = chess.engine.PlayResult(chess.Move.from_uci("g1f1"), None, info={"nodes": 10})
+    captures_path = tmp_path / "searches.jsonl"
+    capture_cfg = Configuration({"path": str(captures_path), "min_time": 0})
+    for seconds in (2.0, 0.5):
+        append_capture(capture_cfg, capture_search(board, "abcdefgh", chess.engine.Limit(time=1), False, False,
+                                                   chess.engine.PlayResult(None, None), captured, seconds, config.engine))
+    searches = read_captures(str(captures_path))
+    assert searches[0].config_hash == config_hash(config.engine)
+
+    results = replay.replay(searches, config)
+    assert [result.move for result in results] == ["d1d8", "d1d8"]
+    assert all(result.nodes and result.node_change == result.nodes - 10 for result in results)
+    assert results[0].time_change is not None and results[0].time_change < 0
+    assert results[0].describe().startswith("abcdefgh ply 1: g1f1 -> d1d8, 2.000 s -> ")
+
+    config_path = tmp_path / "config.yml"
+    config_path.write_text(yaml.safe_dump(config.config))
+    csv_path = tmp_path / "replay.csv"
+    assert replay.main([str(captures_path), "--config", str(config_path), "--min-seconds", "1",
+                        "--csv", str(csv_path)]) == 0
+    csv_lines = csv_path.read_text().splitlines()
+    assert len(csv_lines) == 2 and csv_lines[0].startswith("game_id,ply,captured_move,move")
@@ -1,6 +1,7 @@
 """Tests for the models."""
 
 import datetime
+import pytest
 from lib import model
 import yaml
 from lib import config
@@ -76,6 +77,12 @@ def test_game() -> None:
     assert game_model.mode == "casual"
     assert game_model.is_white is False
 
+    snapshot = game_model.snapshot()
+    game_model.state = {**game["state"], "moves": "e2e4"}
+    assert snapshot == model.GameSnapshot("") != game_model.snapshot()
+    with pytest.raises(AttributeError):
+        game_model.not_a_field = True  # type: ignore[attr-defined]
+
 
 def test_player() -> None:
     """Test the player model."""
@@ -0,0 +1,75 @@
+"""Tests for the on-disk cache of online sources."""
+import multiprocessing
+import pathlib
+import time
+from lib.config import Configuration
+from lib.online_cache import EVICT_EVERY, OnlineCache, online_source
+
+CHESSDB = "https://www.chessdb.cn/cdb.php"
+CLOUD = "https://lichess.org/api/cloud-eval"
+TABLEBASE = "https://tablebase.lichess.ovh/standard"
+
+
+def make_cache(tmp_path: pathlib.Path, max_entries: int = 1000, cloud_days: float = 7) -> OnlineCache:
+    """Create a cache in a temporary directory."""
+    return OnlineCache(Configuration({"path": str(tmp_path / "cache" / "responses.sqlite3"), "max_entries": max_entries,
+                                      "ttl_days": {"chessdb": 7, "lichess_cloud_analysis": cloud_days,
+                                                   "lichess_opening_explorer": 30, "lichess_tablebase": 365}}))
+
+
+def test_online_cache(tmp_path: pathlib.Path) -> None:
+    """Test that answers are found for the same position in other games, expire, and are counted."""
+    cache = make_cache(tmp_path)
+    fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    cache.put(CHESSDB, {"action": "querybest", "board": fen, "json": 1}, {"status": "ok", "move": "e7e5"}, 0.5)
+    transposed = fen.replace("0 1", "2 3")
+    assert cache.get(CHESSDB, {"json": 1, "board": transposed, "action": "querybest"}) == {"status": "ok", "move": "e7e5"}
+    assert cache.get(CHESSDB, {"action": "querypv", "board": fen, "json": 1}) is None
+
+    endgame = "8/8/8/8/8/3k4/8/3KQ3 w - - 10 80"
+    cache.put(TABLEBASE, {"fen": endgame}, {"moves": []}, 0.25)
+    assert cache.get(TABLEBASE, {"fen": endgame.replace("80", "90")}) == {"moves": []}
+    assert cache.get(TABLEBASE, {"fen": endgame.replace("10 80", "11 80")}) is None  # The fifty-move rule is closer.
+
+    assert online_source("https://example.com/book") is None
+    cache.put("https://example.com/book", {"fen": fen}, {"moves": []}, 1)
+    assert cache.get("https://example.com/book", {"fen": fen}) is None
+
+    stats = cache.stats()
+    assert (stats["chessdb"]["hits"], stats["chessdb"]["misses"], stats["chessdb"]["fetches"]) == (1, 1, 1)
+    assert stats["lichess_tablebase"]["average_fetch_seconds"] == 0.25
+    assert cache.summary().startswith("Online cache: chessdb 1 hits, 1 misses, 0.50 s per fetch")
+
+    expiring = make_cache(tmp_path, cloud_days=0)
+    expiring.put(CLOUD, {"fen": fen, "multiPv": 1}, {"depth": 30}, 0.1)
+    time.sleep(0.01)
+    assert expiring.get(CLOUD, {"fen": fen, "multiPv": 1}) is None
+
+
+def test_online_cache_eviction(tmp_path: pathlib.Path) -> None:
+    """Test that the answers used longest ago are removed when the cache is full."""
+    cache = make_cache(tmp_path, max_entries=10)
+    for index in range(EVICT_EVERY):
+        if index == EVICT_EVERY - 1:
+            assert cache.get(CHESSDB, {"board": "position 0"}) is not None  # Used again, so it is kept.
+        cache.put(CHESSDB, {"board": f"position {index}"}, {"status": "ok", "move": str(index)}, 0)
+    assert cache.get(CHESSDB, {"board": "position 0"}) is not None
+    assert cache.get(CHESSDB, {"board": "position 1"}) is None
+    assert cache.get(CHESSDB, {"board": f"position {EVICT_EVERY - 1}"}) is not None
+
+
+def fill_cache(cache: OnlineCache, start: int) -> None:
+    """Store answers from a separate process."""
+    for index in range(start, start + 50):
+        cache.put(CLOUD, {"fen": f"position {index}"}, {"depth": index}, 0)
+
+
+def test_online_cache_processes(tmp_path: pathlib.Path) -> None:
+    """Test that game processes can share the cache."""
+    cache = make_cache(tmp_path)
+    processes = [multiprocessing.Process(target=fill_cache, args=(cache, start)) for start in (0, 50)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(cache.get(CLOUD, {"fen": f"position {index}"}) == {"depth": index} for index in range(100))
@@ -0,0 +1,41 @@
+"""Tests for profiling the engine's searches."""
+import chess
+import chess.engine
+import os
+import pathlib
+import pstats
+import time
+from lib.config import Configuration
+from lib.profiling import SearchProfiler
+
+
+def slow_search(seconds: float) -> chess.engine.PlayResult:
+    """Pretend to search for a while."""
+    time.sleep(seconds)
+    return chess.engine.PlayResult(chess.Move.from_uci("e2e4"), None)
+
+
+def test_search_profiler(tmp_path: pathlib.Path) -> None:
+    """Test that the chosen plies and the slow searches are saved and summed up."""
+    directory = str(tmp_path / "profiles")
+    profiling_cfg = Configuration({"enabled": True, "plies": [3], "min_time": 0.05, "directory": directory, "top": 5})
+    profiler = SearchProfiler(profiling_cfg, "abcdefgh")
+    assert profiler.write_summary() is None
+
+    assert profiler.search(1, lambda: slow_search(0)).move == chess.Move.from_uci("e2e4")
+    profiler.search(3, lambda: slow_search(0))
+    profiler.search(5, lambda: slow_search(0.1))
+    assert sorted(os.listdir(directory)) == ["abcdefgh-ply3.pstats", "abcdefgh-ply5.pstats"]
+    stats = pstats.Stats(os.path.join(directory, "abcdefgh-ply5.pstats"))
+    assert any(function == "slow_search" for _, _, function in stats.stats)  # type: ignore[attr-defined]
+
+    summary = profiler.write_summary()
+    assert summary == os.path.join(directory, "abcdefgh-summary.txt")
+    with open(summary) as file:
+        text = file.read()
+    assert text.startswith("Game abcdefgh: profiled plies 3, 5")
+    assert "slow_search" in text
+
+    only_plies = SearchProfiler(profiling_cfg | {"min_time": 0}, "ijklmnop")
+    only_plies.search(5, lambda: slow_search(0.1))
+    assert only_plies.write_summary() is None
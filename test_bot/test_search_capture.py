@@ -0,0 +1,37 @@
+"""Tests for capturing the engine's searches."""
+import chess
+import chess.engine
+import pathlib
+from lib.config import Configuration
+from lib.search_capture import append_capture, capture_search, config_hash, read_captures
+
+
+def test_capture_round_trip(tmp_path: pathlib.Path) -> None:
+    """Test that a captured search sets up the same search again and that fast searches can be left out."""
+    board = chess.Board("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    for move in ["e2e4", "e7e5", "g1f3"]:
+        board.push_uci(move)
+    limit = chess.engine.Limit(white_clock=60, black_clock=55.5, white_inc=1, black_inc=1)
+    engine_cfg = Configuration({"name": "MaydanEngine", "protocol": "homemade", "capture": {"enabled": True}})
+    result = chess.engine.PlayResult(chess.Move.from_uci("b8c6"), None, info={"nodes": 1234})
+    root_moves = [chess.Move.from_uci("b8c6"), chess.Move.from_uci("g8f6")]
+    search = capture_search(board, "abcdefgh", limit, True, False, root_moves, result, 2.5, engine_cfg)
+    assert (search.ply, search.move, search.nodes, search.root_moves) == (4, "b8c6", 1234, ["b8c6", "g8f6"])
+
+    path = tmp_path / "captures" / "searches.jsonl"
+    capture_cfg = Configuration({"enabled": True, "path": str(path), "min_time": 1})
+    append_capture(capture_cfg, search)
+    fast = capture_search(board, "abcdefgh", limit, False, False, chess.engine.PlayResult(None, None), result, 0.5,
+                          engine_cfg)
+    append_capture(capture_cfg, fast)
+    with open(path, "a") as file:
+        file.write('{"game_id": "cut off')
+    [read] = read_captures(str(path))
+    assert read == search
+    assert read.board() == board and read.board().move_stack == board.move_stack
+    assert read.time_limit() == limit
+    assert read.root_move_list() == root_moves
+    assert fast.root_moves is None and isinstance(fast.root_move_list(), chess.engine.PlayResult)
+
+    assert config_hash(engine_cfg) == config_hash(Configuration({"name": "MaydanEngine", "protocol": "homemade"}))
+    assert config_hash(engine_cfg) != config_hash(Configuration({"name": "MaydanEngine", "protocol": "uci"}))